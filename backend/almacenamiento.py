@@ -0,0 +1,982 @@
+# almacenamiento.py - Capa de persistencia del backend CSI
+#
+# Dos implementaciones con la misma interfaz:
+# - AlmacenMemoria: diccionarios en el proceso (desarrollo, un solo worker)
+# - AlmacenSQLite: SQLite en modo WAL, compartible entre varios workers de uvicorn
+
+import bisect
+import copy
+import heapq
+import json
+import math
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from enum import Enum
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# ============================================
+# REGISTROS DE TESTS
+# ============================================
+
+# Marca de pregunta sin responder en el buffer de respuestas de un test en progreso
+SIN_RESPUESTA = 0xFF
+
+
+class EstadoTest(Enum):
+    EN_PROGRESO = "en_progreso"
+    COMPLETADO = "completado"
+    # Abandonado: sin actividad durante el TTL de tests; se liberan sus respuestas
+    EXPIRADO = "expirado"
+
+
+def ahora_epoch_us() -> int:
+    """Marca de tiempo actual en microsegundos desde epoch"""
+    return time.time_ns() // 1000
+
+
+def epoch_a_iso(epoch_us: Optional[int]) -> Optional[str]:
+    """Misma representación que datetime.now().isoformat() (hora local, sin zona)"""
+    if epoch_us is None:
+        return None
+    segundos, microsegundos = divmod(epoch_us, 1_000_000)
+    return datetime.fromtimestamp(segundos).replace(microsecond=microsegundos).isoformat()
+
+
+def datetime_a_epoch_us(fecha: datetime) -> int:
+    """Inversa de epoch_a_iso; las fechas sin zona se interpretan en hora local"""
+    return int(fecha.replace(microsecond=0).timestamp()) * 1_000_000 + fecha.microsecond
+
+
+# Límites para recorrer todos los tests en orden (inicio, test_id). El mínimo es el de un
+# INTEGER de SQLite: los tests importados pueden tener fechas anteriores a 1970 (negativas)
+INICIO_MINIMO = (-2 ** 63, "")
+INICIO_MAXIMO = 2 ** 62
+
+
+class RegistroTest:
+    """
+    Test CSI en forma compacta
+    - inicio/fin: epoch en microsegundos
+    - respuestas: 40 bytes, uno por pregunta; en progreso, las no respondidas
+      valen SIN_RESPUESTA (None si aún no hay ninguna)
+    - raw_scores: 8 bytes, puntaje bruto por indicador (en progreso, la suma de lo
+      respondido); percentiles, niveles e interpretaciones se derivan al leer
+    - normas: id de las normas con las que se interpreta ("csi/general@1.0"); se fija
+      al iniciar con las vigentes de la población y al completar con las vigentes en ese
+      momento. None en tests anteriores al registro de normas
+    """
+
+    __slots__ = (
+        "test_id", "email", "situacion_estresante", "inicio", "estado", "fin",
+        "capacidad_afrontamiento", "respuestas", "raw_scores", "normas"
+    )
+
+    def __init__(
+        self,
+        test_id: str,
+        email: str,
+        situacion_estresante: str,
+        inicio: int,
+        estado: EstadoTest = EstadoTest.EN_PROGRESO,
+        fin: Optional[int] = None,
+        capacidad_afrontamiento: Optional[int] = None,
+        respuestas: Optional[bytes] = None,
+        raw_scores: Optional[bytes] = None,
+        normas: Optional[str] = None
+    ):
+        self.test_id = test_id
+        self.email = sys.intern(email)
+        self.situacion_estresante = situacion_estresante
+        self.inicio = inicio
+        self.estado = estado
+        self.fin = fin
+        self.capacidad_afrontamiento = capacidad_afrontamiento
+        self.respuestas = respuestas
+        self.raw_scores = raw_scores
+        # Pocas normas distintas compartidas por millones de tests: una sola cadena de cada
+        self.normas = sys.intern(normas) if normas is not None else None
+
+    @property
+    def completado(self) -> bool:
+        return self.estado is EstadoTest.COMPLETADO
+
+    @property
+    def fecha_inicio(self) -> str:
+        return epoch_a_iso(self.inicio)
+
+    @property
+    def fecha_completado(self) -> Optional[str]:
+        return epoch_a_iso(self.fin)
+
+    def clave_orden(self) -> Tuple[int, str]:
+        return (self.inicio, self.test_id)
+
+# ============================================
+# ALMACÉN EN MEMORIA
+# ============================================
+
+class AlmacenMemoria:
+    """
+    Guarda todo en diccionarios del proceso; se pierde al reiniciar
+    - ttl_test: segundos sin actividad tras los que un test en progreso expira (0 = nunca)
+    - ttl_codigo: segundos de validez de un código de recuperación (0 = siempre)
+    """
+
+    # Operaciones de microsegundos con locks cortos: se pueden llamar desde el event loop
+    bloqueante = False
+
+    def __init__(self, ttl_test: int = 0, ttl_codigo: int = 0):
+        self.ttl_test = ttl_test * 1_000_000
+        self.ttl_codigo = ttl_codigo * 1_000_000
+        self.usuarios_db = {}  # {email: {datos_usuario}}
+        self.codigos_recuperacion = {}  # {email: codigo}
+        self.tests_db = {}  # {test_id: RegistroTest}
+        # Índices: test_ids ordenados por (inicio, test_id), global y por usuario
+        self.orden_global = []  # [test_id, ...]
+        self.tests_por_usuario = {}  # {email: [test_id, ...]}
+        self.completados_por_usuario = {}  # {email: [test_id, ...]}
+        self.total_completados = 0
+        self.documentos = {}  # {clave: dict} (agregados como las estadísticas de población)
+        # Expiración: vencimiento vigente de cada registro y un heap con una entrada por registro.
+        # Al sacar una entrada se compara con el vencimiento vigente: si la actividad lo
+        # aplazó, se vuelve a meter con la fecha nueva; si el registro ya no existe, se descarta.
+        self.vence_test = {}  # {test_id: epoch_us} solo tests en progreso
+        self.vence_codigo = {}  # {email: epoch_us}
+        self.vencimientos = []  # heap [(epoch_us, tipo, clave)]
+        self._lock = threading.Lock()
+
+    # ---------- Usuarios ----------
+
+    def crear_usuario(self, usuario: Dict) -> bool:
+        with self._lock:
+            if usuario["email"] in self.usuarios_db:
+                return False
+            self.usuarios_db[usuario["email"]] = dict(usuario)
+            return True
+
+    def obtener_usuario(self, email: str) -> Optional[Dict]:
+        usuario = self.usuarios_db.get(email)
+        return dict(usuario) if usuario is not None else None
+
+    def actualizar_usuario(self, email: str, cambios: Dict) -> None:
+        if email in self.usuarios_db:
+            self.usuarios_db[email].update(cambios)
+
+    # ---------- Códigos de recuperación ----------
+
+    def guardar_codigo(self, email: str, codigo: str) -> None:
+        with self._lock:
+            self.codigos_recuperacion[email] = codigo
+            if self.ttl_codigo:
+                self._programar("codigo", email, self.vence_codigo, ahora_epoch_us() + self.ttl_codigo)
+
+    def obtener_codigo(self, email: str) -> Optional[str]:
+        # El barrido puede ir por detrás: un código vencido no se devuelve aunque siga guardado
+        vence = self.vence_codigo.get(email)
+        if vence is not None and vence <= ahora_epoch_us():
+            return None
+        return self.codigos_recuperacion.get(email)
+
+    def borrar_codigo(self, email: str) -> None:
+        with self._lock:
+            self.codigos_recuperacion.pop(email, None)
+            self.vence_codigo.pop(email, None)
+
+    # ---------- Expiración ----------
+
+    def _programar(self, tipo: str, clave: str, vigentes: Dict[str, int], vence: int) -> None:
+        """Fija el vencimiento; solo entra en el heap si el registro no tenía ya una entrada"""
+        if clave not in vigentes:
+            heapq.heappush(self.vencimientos, (vence, tipo, clave))
+        vigentes[clave] = vence
+
+    def expirar(self, ahora: int, limite: int = 1000) -> Dict[str, int]:
+        """
+        Expira hasta `limite` registros vencidos en `ahora` (tests y códigos juntos)
+        - Tests en progreso: pasan a EXPIRADO y se liberan respuestas y puntajes
+        - Códigos de recuperación: se borran
+        """
+        expirados = {"tests": 0, "codigos": 0}
+        with self._lock:
+            while self.vencimientos and self.vencimientos[0][0] <= ahora and limite > 0:
+                _, tipo, clave = heapq.heappop(self.vencimientos)
+                vigentes = self.vence_test if tipo == "test" else self.vence_codigo
+                vence = vigentes.get(clave)
+                if vence is None:
+                    continue
+                if vence > ahora:
+                    heapq.heappush(self.vencimientos, (vence, tipo, clave))
+                    continue
+                del vigentes[clave]
+                limite -= 1
+                if tipo == "test":
+                    test = self.tests_db[clave]
+                    test.estado = EstadoTest.EXPIRADO
+                    test.respuestas = None
+                    test.raw_scores = None
+                    expirados["tests"] += 1
+                else:
+                    self.codigos_recuperacion.pop(clave, None)
+                    expirados["codigos"] += 1
+        return expirados
+
+    # ---------- Tests ----------
+
+    def _clave(self, test_id: str) -> Tuple[int, str]:
+        return self.tests_db[test_id].clave_orden()
+
+    def crear_test(self, test: RegistroTest) -> None:
+        with self._lock:
+            self.tests_db[test.test_id] = test
+            bisect.insort(self.orden_global, test.test_id, key=self._clave)
+            indice = self.tests_por_usuario.setdefault(test.email, [])
+            bisect.insort(indice, test.test_id, key=self._clave)
+            if self.ttl_test and test.estado is EstadoTest.EN_PROGRESO:
+                self._programar("test", test.test_id, self.vence_test, test.inicio + self.ttl_test)
+
+    def _fusionar(self, indice: List[str], nuevos: List[str]) -> None:
+        """Añade test_ids ya ordenados a un índice ordenado"""
+        if not nuevos:
+            return
+        if not indice or self._clave(indice[-1]) < self._clave(nuevos[0]):
+            indice.extend(nuevos)
+            return
+        # Búsqueda binaria de cada nuevo y unión por tramos: O(k log n) claves en vez de reordenar el índice
+        fusion = []
+        anterior = 0
+        for test_id in nuevos:
+            posicion = bisect.bisect_left(indice, self._clave(test_id), lo=anterior, key=self._clave)
+            fusion.extend(indice[anterior:posicion])
+            fusion.append(test_id)
+            anterior = posicion
+        fusion.extend(indice[anterior:])
+        indice[:] = fusion
+
+    def insertar_tests(self, tests: List[RegistroTest]) -> None:
+        """Alta en bloque (importaciones); los tests pueden llegar ya completados"""
+        with self._lock:
+            for test in tests:
+                self.tests_db[test.test_id] = test
+            nuevos = sorted((test.test_id for test in tests), key=self._clave)
+            self._fusionar(self.orden_global, nuevos)
+            por_usuario = {}
+            for test_id in nuevos:
+                por_usuario.setdefault(self.tests_db[test_id].email, []).append(test_id)
+            for email, test_ids in por_usuario.items():
+                self._fusionar(self.tests_por_usuario.setdefault(email, []), test_ids)
+                completados = [t for t in test_ids if self.tests_db[t].completado]
+                if completados:
+                    self._fusionar(self.completados_por_usuario.setdefault(email, []), completados)
+                    self.total_completados += len(completados)
+
+    def obtener_test(self, test_id: str) -> Optional[RegistroTest]:
+        return self.tests_db.get(test_id)
+
+    def guardar_parcial(
+        self,
+        test_id: str,
+        anteriores: Optional[bytes],
+        respuestas: bytes,
+        raw_scores: bytes,
+        capacidad_afrontamiento: Optional[int]
+    ) -> bool:
+        """Guarda respuestas parciales solo si no cambiaron desde que se leyeron (anteriores)"""
+        with self._lock:
+            test = self.tests_db[test_id]
+            if test.estado is not EstadoTest.EN_PROGRESO or test.respuestas != anteriores:
+                return False
+            test.respuestas = respuestas
+            test.raw_scores = raw_scores
+            test.capacidad_afrontamiento = capacidad_afrontamiento
+            if test_id in self.vence_test:
+                self.vence_test[test_id] = ahora_epoch_us() + self.ttl_test
+            return True
+
+    def completar_test(
+        self,
+        test_id: str,
+        respuestas: bytes,
+        raw_scores: bytes,
+        fin: int,
+        capacidad_afrontamiento: Optional[int],
+        normas: Optional[str] = None,
+        documentos: Optional[Dict[str, Callable[[Optional[Dict]], Dict]]] = None
+    ) -> bool:
+        """
+        Solo completa un test en curso; False si ya estaba completado o expirado
+        - documentos: {clave: funcion} que se aplican como actualizar_documento, de forma
+          atómica con la completación (todo o nada)
+        """
+        with self._lock:
+            test = self.tests_db[test_id]
+            if test.estado is not EstadoTest.EN_PROGRESO:
+                return False
+            # Sobre copias y antes de tocar el test: si una función falla no cambia nada
+            nuevos = {
+                clave: funcion(copy.deepcopy(self.documentos.get(clave)))
+                for clave, funcion in (documentos or {}).items()
+            }
+            self.documentos.update(nuevos)
+            test.respuestas = respuestas
+            test.raw_scores = raw_scores
+            test.normas = sys.intern(normas) if normas is not None else None
+            test.fin = fin
+            test.capacidad_afrontamiento = capacidad_afrontamiento
+            test.estado = EstadoTest.COMPLETADO
+            self.vence_test.pop(test_id, None)
+            indice = self.completados_por_usuario.setdefault(test.email, [])
+            bisect.insort(indice, test_id, key=self._clave)
+            self.total_completados += 1
+            return True
+
+    def _indice_usuario(self, email: str, completado: Optional[bool]) -> List[str]:
+        if completado:
+            return self.completados_por_usuario.get(email, [])
+        return self.tests_por_usuario.get(email, [])
+
+    def listar_tests(
+        self,
+        email: str,
+        limite: Optional[int] = None,
+        despues_de: Optional[Tuple[int, str]] = None,
+        completado: Optional[bool] = None
+    ) -> List[RegistroTest]:
+        """Tests del usuario ordenados por inicio, a partir de la clave (inicio, test_id)"""
+        indice = self._indice_usuario(email, completado)
+        inicio = bisect.bisect_right(indice, despues_de, key=self._clave) if despues_de else 0
+        tests = []
+        for test_id in indice[inicio:]:
+            test = self.tests_db[test_id]
+            if completado is False and test.completado:
+                continue
+            tests.append(test)
+            if limite is not None and len(tests) >= limite:
+                break
+        return tests
+
+    def contar_tests(self, email: str, completado: Optional[bool] = None) -> int:
+        total = len(self.tests_por_usuario.get(email, []))
+        if completado is None:
+            return total
+        completados = len(self.completados_por_usuario.get(email, []))
+        return completados if completado else total - completados
+
+    def iterar_tests(
+        self,
+        despues_de: Tuple[int, str] = INICIO_MINIMO,
+        hasta: int = INICIO_MAXIMO,
+        completado: Optional[bool] = None,
+        tamano_bloque: int = 1000
+    ) -> Iterator[RegistroTest]:
+        """Recorre todos los tests en orden (inicio, test_id) por bloques, sin copiar el almacén"""
+        while True:
+            with self._lock:
+                posicion = bisect.bisect_right(self.orden_global, despues_de, key=self._clave)
+                bloque = [self.tests_db[t] for t in self.orden_global[posicion:posicion + tamano_bloque]]
+            for test in bloque:
+                if test.inicio >= hasta:
+                    return
+                if completado is None or test.completado == completado:
+                    yield test
+            if len(bloque) < tamano_bloque:
+                return
+            despues_de = bloque[-1].clave_orden()
+
+    # ---------- Documentos ----------
+
+    def obtener_documento(self, clave: str) -> Optional[Dict]:
+        with self._lock:
+            return copy.deepcopy(self.documentos.get(clave))
+
+    def guardar_documento(self, clave: str, valor: Dict) -> None:
+        with self._lock:
+            self.documentos[clave] = copy.deepcopy(valor)
+
+    def actualizar_documento(self, clave: str, funcion: Callable[[Optional[Dict]], Dict]) -> None:
+        """Aplica funcion(valor_actual) y guarda el resultado de forma atómica"""
+        with self._lock:
+            self.documentos[clave] = funcion(self.documentos.get(clave))
+
+    def contar(self) -> Dict[str, int]:
+        """Registros por tabla (respuestas = tests completados), sin recorrer nada"""
+        return {
+            "usuarios": len(self.usuarios_db),
+            "tests": len(self.tests_db),
+            "respuestas": self.total_completados,
+            "codigos_recuperacion": len(self.codigos_recuperacion)
+        }
+
+    def cerrar(self) -> None:
+        pass
+
+# ============================================
+# ALMACÉN SQLITE
+# ============================================
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    email TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    password TEXT NOT NULL,
+    telefono TEXT,
+    activo INTEGER NOT NULL DEFAULT 1,
+    foto_perfil TEXT
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS codigos_recuperacion (
+    email TEXT PRIMARY KEY,
+    codigo TEXT NOT NULL,
+    vence INTEGER
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tests (
+    test_id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    situacion_estresante TEXT NOT NULL,
+    inicio INTEGER NOT NULL,
+    estado TEXT NOT NULL,
+    fin INTEGER,
+    capacidad_afrontamiento INTEGER,
+    respuestas BLOB,
+    raw_scores BLOB,
+    completado INTEGER GENERATED ALWAYS AS (estado = 'completado') VIRTUAL,
+    vence INTEGER,
+    normas TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_tests_inicio ON tests (inicio, test_id);
+CREATE INDEX IF NOT EXISTS idx_tests_email ON tests (email, inicio, test_id);
+CREATE INDEX IF NOT EXISTS idx_tests_email_completado ON tests (email, completado, inicio, test_id);
+
+CREATE TABLE IF NOT EXISTS documentos (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Columnas añadidas después de crear el esquema: (tabla, columna, tipo)
+COLUMNAS_NUEVAS = [
+    ("tests", "vence", "INTEGER"),
+    ("codigos_recuperacion", "vence", "INTEGER"),
+    ("tests", "normas", "TEXT"),
+]
+
+# Índices parciales de vencimiento: solo contienen los registros que pueden expirar,
+# así el barrido lee un rango ordenado en lugar de recorrer las tablas
+INDICES_VENCIMIENTO = """
+CREATE INDEX IF NOT EXISTS idx_tests_vence ON tests (vence) WHERE vence IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_codigos_vence ON codigos_recuperacion (vence) WHERE vence IS NOT NULL;
+"""
+
+# Registros por tabla para /metrics, mantenidos por triggers en cada alta, completado,
+# expiración y borrado: leerlos es una consulta de una fila y no un COUNT(*) por tabla,
+# y los ven igual todos los workers. "respuestas" son los tests completados, como en
+# AlmacenMemoria (un test a medias o expirado no cuenta).
+SQL_CREAR_CONTADORES = "CREATE TABLE contadores (tabla TEXT PRIMARY KEY, cuenta INTEGER NOT NULL) WITHOUT ROWID"
+SQL_EXISTEN_CONTADORES = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contadores'"
+# Recuento inicial: se hace una sola vez, al crear la tabla (una base de una versión anterior)
+SQL_INICIALIZAR_CONTADORES = (
+    "INSERT INTO contadores (tabla, cuenta) "
+    "SELECT 'usuarios', COUNT(*) FROM usuarios "
+    "UNION ALL SELECT 'tests', COUNT(*) FROM tests "
+    "UNION ALL SELECT 'respuestas', COUNT(*) FROM tests WHERE estado = 'completado' "
+    "UNION ALL SELECT 'codigos_recuperacion', COUNT(*) FROM codigos_recuperacion"
+)
+TRIGGERS_CONTADORES = [
+    f"CREATE TRIGGER IF NOT EXISTS {nombre} AFTER {evento} ON {tabla} {condicion}BEGIN {cuerpo} END"
+    for nombre, evento, tabla, condicion, cuerpo in [
+        ("contar_alta_usuario", "INSERT", "usuarios", "",
+         "UPDATE contadores SET cuenta = cuenta + 1 WHERE tabla = 'usuarios';"),
+        ("contar_baja_usuario", "DELETE", "usuarios", "",
+         "UPDATE contadores SET cuenta = cuenta - 1 WHERE tabla = 'usuarios';"),
+        ("contar_alta_codigo", "INSERT", "codigos_recuperacion", "",
+         "UPDATE contadores SET cuenta = cuenta + 1 WHERE tabla = 'codigos_recuperacion';"),
+        ("contar_baja_codigo", "DELETE", "codigos_recuperacion", "",
+         "UPDATE contadores SET cuenta = cuenta - 1 WHERE tabla = 'codigos_recuperacion';"),
+        ("contar_alta_test", "INSERT", "tests", "",
+         "UPDATE contadores SET cuenta = cuenta + 1 WHERE tabla = 'tests'; "
+         "UPDATE contadores SET cuenta = cuenta + 1 WHERE tabla = 'respuestas' AND NEW.estado = 'completado';"),
+        ("contar_baja_test", "DELETE", "tests", "",
+         "UPDATE contadores SET cuenta = cuenta - 1 WHERE tabla = 'tests'; "
+         "UPDATE contadores SET cuenta = cuenta - 1 WHERE tabla = 'respuestas' AND OLD.estado = 'completado';"),
+        ("contar_estado_test", "UPDATE OF estado", "tests",
+         "WHEN (OLD.estado = 'completado') != (NEW.estado = 'completado') ",
+         "UPDATE contadores SET cuenta = cuenta + (NEW.estado = 'completado') - (OLD.estado = 'completado') "
+         "WHERE tabla = 'respuestas';"),
+    ]
+]
+
+# Las sentencias son constantes para que sqlite3 reutilice la versión preparada
+# (caché de sentencias por conexión) en lugar de compilarlas en cada llamada.
+SQL_INSERTAR_USUARIO = (
+    "INSERT OR IGNORE INTO usuarios (email, nombre, password, telefono, activo, foto_perfil) "
+    "VALUES (:email, :nombre, :password, :telefono, :activo, :foto_perfil)"
+)
+SQL_OBTENER_USUARIO = (
+    "SELECT email, nombre, password, telefono, activo, foto_perfil FROM usuarios WHERE email = ?"
+)
+# Upsert y no INSERT OR REPLACE: REPLACE borra la fila anterior sin disparar los triggers
+# de borrado (salvo con recursive_triggers) y el contador de códigos se desviaría
+SQL_GUARDAR_CODIGO = (
+    "INSERT INTO codigos_recuperacion (email, codigo, vence) VALUES (?, ?, ?) "
+    "ON CONFLICT (email) DO UPDATE SET codigo = excluded.codigo, vence = excluded.vence"
+)
+SQL_OBTENER_CODIGO = "SELECT codigo FROM codigos_recuperacion WHERE email = ? AND (vence IS NULL OR vence > ?)"
+SQL_BORRAR_CODIGO = "DELETE FROM codigos_recuperacion WHERE email = ?"
+COLUMNAS_TEST = (
+    "test_id, email, situacion_estresante, inicio, estado, fin, "
+    "capacidad_afrontamiento, respuestas, raw_scores, normas"
+)
+SQL_INSERTAR_TEST = (
+    f"INSERT INTO tests ({COLUMNAS_TEST}, vence) VALUES (:test_id, :email, :situacion_estresante, "
+    ":inicio, :estado, :fin, :capacidad_afrontamiento, :respuestas, :raw_scores, :normas, :vence)"
+)
+SQL_INSERTAR_TESTS = f"INSERT INTO tests ({COLUMNAS_TEST}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_OBTENER_TEST = f"SELECT {COLUMNAS_TEST} FROM tests WHERE test_id = ?"
+SQL_GUARDAR_PARCIAL = (
+    "UPDATE tests SET respuestas = :respuestas, raw_scores = :raw_scores, "
+    "capacidad_afrontamiento = :capacidad_afrontamiento, vence = :vence "
+    "WHERE test_id = :test_id AND estado = :estado AND respuestas IS :anteriores"
+)
+SQL_COMPLETAR_TEST = (
+    "UPDATE tests SET respuestas = :respuestas, raw_scores = :raw_scores, estado = :estado, "
+    "fin = :fin, capacidad_afrontamiento = :capacidad_afrontamiento, normas = :normas, vence = NULL "
+    "WHERE test_id = :test_id AND estado = :en_progreso"
+)
+# Una sentencia por combinación de filtros (con/sin estado, con/sin cursor) para que
+# cada una use el índice adecuado y avance por rango en lugar de recorrer el historial
+SQL_LISTAR_TESTS = {
+    (filtra_estado, con_cursor): (
+        f"SELECT {COLUMNAS_TEST} FROM tests WHERE email = :email"
+        + (" AND completado = :completado" if filtra_estado else "")
+        + (" AND (inicio, test_id) > (:inicio, :test_id)" if con_cursor else "")
+        + " ORDER BY inicio, test_id LIMIT :limite"
+    )
+    for filtra_estado in (False, True)
+    for con_cursor in (False, True)
+}
+SQL_ITERAR_TESTS = (
+    f"SELECT {COLUMNAS_TEST} FROM tests WHERE (inicio, test_id) > (:inicio, :test_id) "
+    "AND inicio < :hasta AND (:completado IS NULL OR completado = :completado) "
+    "ORDER BY inicio, test_id LIMIT :limite"
+)
+SQL_CONTAR_TESTS = {
+    False: "SELECT COUNT(*) FROM tests WHERE email = :email",
+    True: "SELECT COUNT(*) FROM tests WHERE email = :email AND completado = :completado"
+}
+SQL_EXPIRAR_TESTS = (
+    "UPDATE tests SET estado = :expirado, respuestas = NULL, raw_scores = NULL, vence = NULL "
+    "WHERE test_id IN (SELECT test_id FROM tests WHERE vence <= :ahora LIMIT :limite)"
+)
+SQL_EXPIRAR_CODIGOS = (
+    "DELETE FROM codigos_recuperacion "
+    "WHERE email IN (SELECT email FROM codigos_recuperacion WHERE vence <= :ahora LIMIT :limite)"
+)
+SQL_VENCIMIENTO_TESTS_EXISTENTES = (
+    "UPDATE tests SET vence = inicio + :ttl WHERE estado = 'en_progreso' AND vence IS NULL"
+)
+SQL_VENCIMIENTO_CODIGOS_EXISTENTES = "UPDATE codigos_recuperacion SET vence = :vence WHERE vence IS NULL"
+SQL_OBTENER_DOCUMENTO = "SELECT valor FROM documentos WHERE clave = ?"
+SQL_GUARDAR_DOCUMENTO = "INSERT OR REPLACE INTO documentos (clave, valor) VALUES (?, ?)"
+SQL_CONTAR = "SELECT tabla, cuenta FROM contadores"
+
+# Columnas de usuarios que se pueden modificar con actualizar_usuario
+CAMPOS_USUARIO = ("nombre", "password", "telefono", "activo", "foto_perfil")
+
+
+class AlmacenSQLite:
+    """
+    Persistencia en SQLite (modo WAL)
+    - Un pool de conexiones por proceso/worker, creadas bajo demanda
+    - Varios workers pueden leer a la vez; las escrituras se serializan en SQLite
+    - ttl_test / ttl_codigo: como en AlmacenMemoria
+    """
+
+    # Una llamada puede esperar hasta busy_timeout el lock de escritura de otra conexión
+    # (una importación, una actualización de documento, otro worker): fuera del event loop
+    bloqueante = True
+
+    def __init__(self, ruta: str, tamano_pool: int = 8, ttl_test: int = 0, ttl_codigo: int = 0):
+        self.ruta = ruta
+        self.tamano_pool = tamano_pool
+        self.ttl_test = ttl_test * 1_000_000
+        self.ttl_codigo = ttl_codigo * 1_000_000
+        self._pool = queue.LifoQueue(maxsize=tamano_pool)
+        self._semaforo = threading.BoundedSemaphore(tamano_pool)
+        self._conexiones = []
+        self._lock = threading.Lock()
+        with self._conexion() as conn:
+            conn.executescript(ESQUEMA)
+            nuevas = self._migrar(conn)
+            # Los registros de una base anterior reciben su vencimiento al añadir la columna
+            if ("tests", "vence") in nuevas and self.ttl_test:
+                conn.execute(SQL_VENCIMIENTO_TESTS_EXISTENTES, {"ttl": self.ttl_test})
+            if ("codigos_recuperacion", "vence") in nuevas and self.ttl_codigo:
+                conn.execute(
+                    SQL_VENCIMIENTO_CODIGOS_EXISTENTES,
+                    {"vence": ahora_epoch_us() + self.ttl_codigo}
+                )
+            conn.executescript(INDICES_VENCIMIENTO)
+            self._crear_contadores(conn)
+
+    @staticmethod
+    def _crear_contadores(conn: sqlite3.Connection) -> None:
+        """Tabla de contadores y sus triggers; en la misma transacción que el recuento inicial"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(SQL_EXISTEN_CONTADORES).fetchone() is None:
+                conn.execute(SQL_CREAR_CONTADORES)
+                conn.execute(SQL_INICIALIZAR_CONTADORES)
+            for trigger in TRIGGERS_CONTADORES:
+                conn.execute(trigger)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _migrar(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+        """Añade a una base existente las columnas que no tenía; devuelve las añadidas"""
+        nuevas = []
+        for tabla, columna, tipo in COLUMNAS_NUEVAS:
+            existentes = {fila["name"] for fila in conn.execute(f"PRAGMA table_info({tabla})")}
+            if columna not in existentes:
+                conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {tipo}")
+                nuevas.append((tabla, columna))
+        return nuevas
+
+    def _abrir(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.ruta,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=64
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        with self._lock:
+            self._conexiones.append(conn)
+        return conn
+
+    @contextmanager
+    def _conexion(self):
+        self._semaforo.acquire()
+        try:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._abrir()
+            try:
+                yield conn
+            finally:
+                self._pool.put_nowait(conn)
+        finally:
+            self._semaforo.release()
+
+    @staticmethod
+    def _fila_a_test(fila: sqlite3.Row) -> RegistroTest:
+        return RegistroTest(
+            test_id=fila["test_id"],
+            email=fila["email"],
+            situacion_estresante=fila["situacion_estresante"],
+            inicio=fila["inicio"],
+            estado=EstadoTest(fila["estado"]),
+            fin=fila["fin"],
+            capacidad_afrontamiento=fila["capacidad_afrontamiento"],
+            respuestas=fila["respuestas"],
+            raw_scores=fila["raw_scores"],
+            normas=fila["normas"]
+        )
+
+    # ---------- Usuarios ----------
+
+    def crear_usuario(self, usuario: Dict) -> bool:
+        datos = {campo: usuario.get(campo) for campo in ("email",) + CAMPOS_USUARIO}
+        datos["activo"] = 1 if usuario.get("activo", True) else 0
+        with self._conexion() as conn:
+            return conn.execute(SQL_INSERTAR_USUARIO, datos).rowcount == 1
+
+    def obtener_usuario(self, email: str) -> Optional[Dict]:
+        with self._conexion() as conn:
+            fila = conn.execute(SQL_OBTENER_USUARIO, (email,)).fetchone()
+        if fila is None:
+            return None
+        usuario = dict(fila)
+        usuario["activo"] = bool(usuario["activo"])
+        return usuario
+
+    def actualizar_usuario(self, email: str, cambios: Dict) -> None:
+        campos = [c for c in CAMPOS_USUARIO if c in cambios]
+        if not campos:
+            return
+        asignaciones = ", ".join(f"{c} = :{c}" for c in campos)
+        datos = {c: cambios[c] for c in campos}
+        datos["email"] = email
+        with self._conexion() as conn:
+            conn.execute(f"UPDATE usuarios SET {asignaciones} WHERE email = :email", datos)
+
+    # ---------- Códigos de recuperación ----------
+
+    def guardar_codigo(self, email: str, codigo: str) -> None:
+        vence = ahora_epoch_us() + self.ttl_codigo if self.ttl_codigo else None
+        with self._conexion() as conn:
+            conn.execute(SQL_GUARDAR_CODIGO, (email, codigo, vence))
+
+    def obtener_codigo(self, email: str) -> Optional[str]:
+        with self._conexion() as conn:
+            fila = conn.execute(SQL_OBTENER_CODIGO, (email, ahora_epoch_us())).fetchone()
+        return fila["codigo"] if fila else None
+
+    def borrar_codigo(self, email: str) -> None:
+        with self._conexion() as conn:
+            conn.execute(SQL_BORRAR_CODIGO, (email,))
+
+    # ---------- Tests ----------
+
+    def crear_test(self, test: RegistroTest) -> None:
+        datos = {campo: getattr(test, campo) for campo in RegistroTest.__slots__}
+        datos["estado"] = test.estado.value
+        datos["vence"] = None
+        if self.ttl_test and test.estado is EstadoTest.EN_PROGRESO:
+            datos["vence"] = test.inicio + self.ttl_test
+        with self._conexion() as conn:
+            conn.execute(SQL_INSERTAR_TEST, datos)
+
+    def insertar_tests(self, tests: List[RegistroTest]) -> None:
+        """Alta en bloque (importaciones) en una sola transacción"""
+        filas = [
+            (test.test_id, test.email, test.situacion_estresante, test.inicio, test.estado.value,
+             test.fin, test.capacidad_afrontamiento, test.respuestas, test.raw_scores, test.normas)
+            for test in tests
+        ]
+        with self._conexion() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(SQL_INSERTAR_TESTS, filas)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def obtener_test(self, test_id: str) -> Optional[RegistroTest]:
+        with self._conexion() as conn:
+            fila = conn.execute(SQL_OBTENER_TEST, (test_id,)).fetchone()
+        return self._fila_a_test(fila) if fila else None
+
+    def guardar_parcial(
+        self,
+        test_id: str,
+        anteriores: Optional[bytes],
+        respuestas: bytes,
+        raw_scores: bytes,
+        capacidad_afrontamiento: Optional[int]
+    ) -> bool:
+        """Guarda respuestas parciales solo si no cambiaron desde que se leyeron (anteriores)"""
+        datos = {
+            "test_id": test_id,
+            "anteriores": anteriores,
+            "respuestas": respuestas,
+            "raw_scores": raw_scores,
+            "capacidad_afrontamiento": capacidad_afrontamiento,
+            "estado": EstadoTest.EN_PROGRESO.value,
+            "vence": ahora_epoch_us() + self.ttl_test if self.ttl_test else None
+        }
+        with self._conexion() as conn:
+            return conn.execute(SQL_GUARDAR_PARCIAL, datos).rowcount == 1
+
+    def completar_test(
+        self,
+        test_id: str,
+        respuestas: bytes,
+        raw_scores: bytes,
+        fin: int,
+        capacidad_afrontamiento: Optional[int],
+        normas: Optional[str] = None,
+        documentos: Optional[Dict[str, Callable[[Optional[Dict]], Dict]]] = None
+    ) -> bool:
+        """
+        Solo completa un test en curso; False si ya estaba completado o expirado
+        - documentos: {clave: funcion} que se aplican como actualizar_documento, de forma
+          atómica con la completación (todo o nada)
+        """
+        datos = {
+            "test_id": test_id,
+            "respuestas": respuestas,
+            "raw_scores": raw_scores,
+            "estado": EstadoTest.COMPLETADO.value,
+            "en_progreso": EstadoTest.EN_PROGRESO.value,
+            "normas": normas,
+            "fin": fin,
+            "capacidad_afrontamiento": capacidad_afrontamiento
+        }
+        with self._conexion() as conn:
+            if not documentos:
+                return conn.execute(SQL_COMPLETAR_TEST, datos).rowcount == 1
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute(SQL_COMPLETAR_TEST, datos).rowcount != 1:
+                    conn.execute("ROLLBACK")
+                    return False
+                for clave, funcion in documentos.items():
+                    self._actualizar_documento(conn, clave, funcion)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return True
+
+    def listar_tests(
+        self,
+        email: str,
+        limite: Optional[int] = None,
+        despues_de: Optional[Tuple[int, str]] = None,
+        completado: Optional[bool] = None
+    ) -> List[RegistroTest]:
+        """Tests del usuario ordenados por inicio, a partir de la clave (inicio, test_id)"""
+        datos = {"email": email, "limite": -1 if limite is None else limite}
+        if completado is not None:
+            datos["completado"] = 1 if completado else 0
+        if despues_de:
+            datos["inicio"], datos["test_id"] = despues_de
+        sql = SQL_LISTAR_TESTS[(completado is not None, bool(despues_de))]
+        with self._conexion() as conn:
+            filas = conn.execute(sql, datos).fetchall()
+        return [self._fila_a_test(fila) for fila in filas]
+
+    def contar_tests(self, email: str, completado: Optional[bool] = None) -> int:
+        datos = {"email": email}
+        if completado is not None:
+            datos["completado"] = 1 if completado else 0
+        with self._conexion() as conn:
+            return conn.execute(SQL_CONTAR_TESTS[completado is not None], datos).fetchone()[0]
+
+    def iterar_tests(
+        self,
+        despues_de: Tuple[int, str] = INICIO_MINIMO,
+        hasta: int = INICIO_MAXIMO,
+        completado: Optional[bool] = None,
+        tamano_bloque: int = 1000
+    ) -> Iterator[RegistroTest]:
+        """Recorre todos los tests en orden (inicio, test_id) por bloques; la conexión se devuelve entre bloques"""
+        datos = {
+            "hasta": hasta,
+            "completado": None if completado is None else int(completado),
+            "limite": tamano_bloque
+        }
+        while True:
+            datos["inicio"], datos["test_id"] = despues_de
+            with self._conexion() as conn:
+                filas = conn.execute(SQL_ITERAR_TESTS, datos).fetchall()
+            for fila in filas:
+                yield self._fila_a_test(fila)
+            if len(filas) < tamano_bloque:
+                return
+            despues_de = (filas[-1]["inicio"], filas[-1]["test_id"])
+
+    # ---------- Expiración ----------
+
+    def expirar(self, ahora: int, limite: int = 1000) -> Dict[str, int]:
+        """Como AlmacenMemoria.expirar, leyendo los índices parciales de vencimiento"""
+        datos = {"ahora": ahora, "limite": limite, "expirado": EstadoTest.EXPIRADO.value}
+        with self._conexion() as conn:
+            tests = conn.execute(SQL_EXPIRAR_TESTS, datos).rowcount
+            codigos = conn.execute(SQL_EXPIRAR_CODIGOS, {"ahora": ahora, "limite": limite}).rowcount
+        return {"tests": tests, "codigos": codigos}
+
+    # ---------- Documentos ----------
+
+    def obtener_documento(self, clave: str) -> Optional[Dict]:
+        with self._conexion() as conn:
+            fila = conn.execute(SQL_OBTENER_DOCUMENTO, (clave,)).fetchone()
+        return json.loads(fila[0]) if fila else None
+
+    def guardar_documento(self, clave: str, valor: Dict) -> None:
+        with self._conexion() as conn:
+            conn.execute(SQL_GUARDAR_DOCUMENTO, (clave, json.dumps(valor)))
+
+    def actualizar_documento(self, clave: str, funcion: Callable[[Optional[Dict]], Dict]) -> None:
+        """
+        Lectura, funcion y escritura en una transacción IMMEDIATE: los workers que
+        actualizan el mismo documento a la vez se serializan y no pierden cambios
+        """
+        with self._conexion() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._actualizar_documento(conn, clave, funcion)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _actualizar_documento(conn: sqlite3.Connection, clave: str, funcion: Callable[[Optional[Dict]], Dict]) -> None:
+        """Lectura, funcion y escritura de un documento dentro de la transacción abierta en conn"""
+        fila = conn.execute(SQL_OBTENER_DOCUMENTO, (clave,)).fetchone()
+        valor = funcion(json.loads(fila[0]) if fila else None)
+        conn.execute(SQL_GUARDAR_DOCUMENTO, (clave, json.dumps(valor)))
+
+    def contar(self) -> Dict[str, int]:
+        """Registros por tabla (respuestas = tests completados), de la tabla de contadores"""
+        with self._conexion() as conn:
+            return {fila["tabla"]: fila["cuenta"] for fila in conn.execute(SQL_CONTAR)}
+
+    def cerrar(self) -> None:
+        with self._lock:
+            # Vaciar el pool: una llamada posterior abriría una conexión nueva en vez de
+            # recibir una cerrada
+            while True:
+                try:
+                    self._pool.get_nowait()
+                except queue.Empty:
+                    break
+            for conn in self._conexiones:
+                conn.close()
+            self._conexiones.clear()
+
+# ============================================
+# SELECCIÓN DEL ALMACÉN
+# ============================================
+
+def segundos_ttl(variable: str, por_defecto: str, unidad: int) -> int:
+    """
+    TTL en segundos de una variable de entorno expresada en `unidad` segundos
+    - Se redondea hacia arriba: un valor positivo pequeño no puede quedar en 0 (= nunca)
+    """
+    valor = float(os.environ.get(variable, por_defecto))
+    if valor < 0:
+        raise ValueError(f"{variable} no puede ser negativo: {valor}")
+    return math.ceil(valor * unidad)
+
+
+def crear_almacen():
+    """
+    Crea el almacén según las variables de entorno
+    - CSI_ALMACEN: "sqlite" (por defecto) o "memoria"
+    - CSI_DB_PATH: ruta del archivo SQLite (por defecto neurometrica.db junto a este archivo)
+    - CSI_DB_POOL: conexiones por worker (por defecto 8)
+    - CSI_TTL_TEST_HORAS: horas sin actividad tras las que expira un test en progreso (por defecto 72, 0 = nunca)
+    - CSI_TTL_CODIGO_MINUTOS: validez de los códigos de recuperación (por defecto 15, 0 = siempre)
+    """
+    ttl = {
+        "ttl_test": segundos_ttl("CSI_TTL_TEST_HORAS", "72", 3600),
+        "ttl_codigo": segundos_ttl("CSI_TTL_CODIGO_MINUTOS", "15", 60)
+    }
+    tipo = os.environ.get("CSI_ALMACEN", "sqlite").lower()
+    if tipo == "memoria":
+        return AlmacenMemoria(**ttl)
+    if tipo != "sqlite":
+        raise ValueError(f"CSI_ALMACEN desconocido: {tipo}")
+    ruta = os.environ.get(
+        "CSI_DB_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "neurometrica.db")
+    )
+    return AlmacenSQLite(ruta, tamano_pool=int(os.environ.get("CSI_DB_POOL", "8")), **ttl)
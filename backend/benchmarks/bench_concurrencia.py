@@ -0,0 +1,195 @@
+# bench_concurrencia.py - Handlers async frente a la versión síncrona (threadpool) con miles de conexiones
+#
+# Levanta uvicorn (1 worker) con el backend actual y, con --referencia, con el de otra
+# revisión de git (git archive a un directorio temporal: por ejemplo la última con los
+# handlers síncronos). Para cada variante y cada valor de --conexiones abre esas
+# conexiones a la vez, espera a que todas estén establecidas y durante --segundos cada
+# una repite la mezcla del recorrido:
+#   GET /perfil, GET /test/preguntas, GET /test/{id}/resultados,
+#   GET /test/historial?limite=10, POST /test/iniciar + POST /test/{id}/responder
+# Informa peticiones por segundo, p50/p95/p99/máximo de latencia y errores (códigos
+# distintos de 2xx y timeouts). Cada medición usa un servidor recién levantado.
+#
+# Registro y login se hacen antes de medir y quedan fuera de la mezcla: su coste es el
+# scrypt, igual en ambas versiones (CSI_HASH_PROCESOS=0 para no levantar el pool).
+# El cliente corre en la misma máquina: con pocos núcleos compite por la CPU con el
+# servidor, así que las cifras sirven para comparar variantes, no como capacidad absoluta.
+#
+# Requiere httpx (solo para el benchmark): pip install httpx
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_concurrencia.py --referencia HEAD~1 --conexiones 100 1000 2000
+#   python benchmarks/bench_concurrencia.py --almacen sqlite --conexiones 1000 --segundos 30
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tarfile
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench_login import percentil
+from carga_almacen import BACKEND, levantar_servidor
+
+SITUACION = "Situación de prueba para el benchmark de concurrencia"
+
+
+def extraer_revision(revision: str, destino: str) -> str:
+    """Copia backend/ de una revisión de git en destino y devuelve su ruta"""
+    archivo = os.path.join(destino, "referencia.tar")
+    with open(archivo, "wb") as f:
+        subprocess.run(["git", "archive", revision, "."], cwd=BACKEND, stdout=f, check=True)
+    directorio = os.path.join(destino, "backend")
+    with tarfile.open(archivo) as tar:
+        tar.extractall(directorio)
+    return directorio
+
+
+def respuestas_aleatorias(rng: random.Random) -> dict:
+    return {str(q): rng.randint(0, 4) for q in range(1, 41)}
+
+
+async def preparar(cliente: httpx.AsyncClient, usuarios: int) -> list:
+    """Registra usuarios con un test completado cada uno: [(cabeceras, test_id)]"""
+    rng = random.Random(7)
+
+    async def uno(i: int) -> tuple:
+        email = f"concurrencia{i}@ejemplo.com"
+        r = await cliente.post("/registro", json={
+            "nombre": "Concurrencia", "primerApellido": str(i), "email": email, "password": "secreto123"
+        })
+        r.raise_for_status()
+        cabeceras = {"Authorization": f"Bearer {r.json()['token']}"}
+        r = await cliente.post("/test/iniciar", headers=cabeceras, json={"situacion_estresante": SITUACION})
+        test_id = r.json()["test_id"]
+        r = await cliente.post(f"/test/{test_id}/responder", headers=cabeceras,
+                               json={"respuestas": respuestas_aleatorias(rng)})
+        r.raise_for_status()
+        return cabeceras, test_id
+
+    return await asyncio.gather(*[uno(i) for i in range(usuarios)])
+
+
+async def conexion(url: str, cabeceras: dict, test_id: str, semilla: int, listas: list, comienzo: asyncio.Event,
+                   fin: list, latencias: dict, errores: list) -> None:
+    # Un cliente por conexión: el pool de httpx recorre sus conexiones en cada petición
+    # y con uno compartido de miles el cuello de botella sería el propio cliente
+    async with httpx.AsyncClient(base_url=url, limits=httpx.Limits(max_connections=1), timeout=120) as cliente:
+        # Abre la conexión y espera a que estén todas antes de empezar a medir
+        await cliente.get("/")
+        listas.append(1)
+        await comienzo.wait()
+        await repetir_mezcla(cliente, cabeceras, test_id, random.Random(semilla), fin, latencias, errores)
+
+
+async def repetir_mezcla(cliente, cabeceras: dict, test_id: str, rng: random.Random, fin: list,
+                         latencias: dict, errores: list) -> None:
+    async def medir(nombre: str, metodo: str, ruta: str, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            r = await cliente.request(metodo, ruta, headers=cabeceras, **kwargs)
+        except httpx.HTTPError as e:
+            errores.append(f"{nombre}: {type(e).__name__}")
+            return None
+        latencias[nombre].append(time.perf_counter() - inicio)
+        if r.status_code >= 300:
+            errores.append(f"{nombre}: {r.status_code}")
+            return None
+        return r
+
+    while time.perf_counter() < fin[0]:
+        await medir("GET /perfil", "GET", "/perfil")
+        await medir("GET /test/preguntas", "GET", "/test/preguntas")
+        await medir("GET /test/{test_id}/resultados", "GET", f"/test/{test_id}/resultados")
+        await medir("GET /test/historial", "GET", "/test/historial", params={"limite": 10})
+        r = await medir("POST /test/iniciar", "POST", "/test/iniciar", json={"situacion_estresante": SITUACION})
+        if r is not None:
+            await medir("POST /test/{test_id}/responder", "POST", f"/test/{r.json()['test_id']}/responder",
+                        json={"respuestas": respuestas_aleatorias(rng)})
+
+
+async def ejecutar(url: str, conexiones: int, usuarios: int, segundos: float) -> dict:
+    async with httpx.AsyncClient(base_url=url, timeout=120) as cliente:
+        preparados = await preparar(cliente, usuarios)
+    latencias = defaultdict(list)
+    errores, listas, fin = [], [], [0.0]
+    comienzo = asyncio.Event()
+    tareas = [
+        asyncio.create_task(conexion(url, *preparados[i % usuarios], i, listas, comienzo, fin, latencias, errores))
+        for i in range(conexiones)
+    ]
+    while len(listas) < conexiones:
+        await asyncio.sleep(0.05)
+    inicio = time.perf_counter()
+    fin[0] = inicio + segundos
+    comienzo.set()
+    await asyncio.gather(*tareas)
+    duracion = time.perf_counter() - inicio
+
+    todas = sorted(t for serie in latencias.values() for t in serie)
+    return {
+        "conexiones": conexiones,
+        "peticiones": len(todas),
+        "pet_s": len(todas) / duracion,
+        "p50_ms": percentil(todas, 50) * 1000,
+        "p95_ms": percentil(todas, 95) * 1000,
+        "p99_ms": percentil(todas, 99) * 1000,
+        "max_ms": todas[-1] * 1000 if todas else 0.0,
+        "errores": len(errores),
+        "ejemplos_errores": sorted(set(errores))[:5],
+        "p99_por_endpoint_ms": {
+            nombre: percentil(serie, 99) * 1000 for nombre, serie in sorted(latencias.items())
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrencia: handlers async frente a una revisión de referencia")
+    parser.add_argument("--referencia", help="Revisión de git a comparar (por ejemplo, la última con handlers síncronos)")
+    parser.add_argument("--conexiones", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--segundos", type=float, default=15)
+    parser.add_argument("--usuarios", type=int, default=50, help="Usuarios registrados; las conexiones se reparten entre ellos")
+    parser.add_argument("--almacen", choices=["memoria", "sqlite"], default="memoria")
+    parser.add_argument("--salida", help="Escribe los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        variantes = [("actual", BACKEND)]
+        if args.referencia:
+            variantes.append((args.referencia, extraer_revision(args.referencia, carpeta)))
+
+        resultados = []
+        print(f"{'variante':<12} {'conexiones':>10} {'pet/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+              f"{'p99 ms':>9} {'máx ms':>9} {'errores':>8}")
+        for conexiones in args.conexiones:
+            for nombre, directorio in variantes:
+                entorno = {"CSI_ALMACEN": args.almacen, "CSI_HASH_PROCESOS": "0"}
+                if args.almacen == "sqlite":
+                    ruta = os.path.join(carpeta, f"{len(resultados)}.db")
+                    entorno["CSI_DB_PATH"] = ruta
+                proceso, url = levantar_servidor(1, entorno, directorio)
+                try:
+                    r = asyncio.run(ejecutar(url, conexiones, args.usuarios, args.segundos))
+                finally:
+                    proceso.terminate()
+                    proceso.wait()
+                r["variante"] = nombre
+                resultados.append(r)
+                print(f"{nombre:<12} {conexiones:>10} {r['pet_s']:>8.0f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+                      f"{r['p99_ms']:>9.1f} {r['max_ms']:>9.1f} {r['errores']:>8}")
+                for error in r["ejemplos_errores"]:
+                    print(f"    {error}")
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"segundos": args.segundos, "almacen": args.almacen, "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench_formatos.py - Formatos de respuestas de /test/{test_id}/responder: diccionario, lista y cadena
+#
+# Mide por separado, en microsegundos por test, las tres fases del endpoint:
+# - parseo: RespuestasTest.model_validate_json sobre el cuerpo JSON
+# - validación: rango 0-4 y empaquetado a 40 bytes
+# - puntuación: puntajes brutos por indicador
+# "diccionario (antes)" reproduce el camino anterior: bucle de validación en Python,
+# calculate_raw_scores sobre el diccionario y empaquetar_respuestas.
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_formatos.py --tests 20000
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("CSI_ALMACEN", "memoria")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import (  # noqa: E402
+    POBLACION_POR_DEFECTO, RespuestasTest, empaquetar_respuestas, normas_vigentes, respuestas_empaquetadas
+)
+
+scoring_service = normas_vigentes(POBLACION_POR_DEFECTO)
+
+
+def cuerpos(n: int, semilla: int = 42) -> dict:
+    rng = random.Random(semilla)
+    valores = [[rng.randint(0, 4) for _ in range(40)] for _ in range(n)]
+    return {
+        "diccionario": [json.dumps({"respuestas": {str(q + 1): v for q, v in enumerate(fila)}}) for fila in valores],
+        "lista": [json.dumps({"respuestas": fila}) for fila in valores],
+        "cadena": [json.dumps({"respuestas": "".join(map(str, fila))}) for fila in valores],
+    }
+
+
+def validar_antes(respuestas: dict) -> dict:
+    if len(respuestas) != 40:
+        raise ValueError("faltan respuestas")
+    for pregunta, valor in respuestas.items():
+        if valor < 0 or valor > 4:
+            raise ValueError(f"pregunta {pregunta}")
+    return respuestas
+
+
+def cronometrar(funcion, entradas: list) -> tuple:
+    """(µs por elemento, resultados); mejor de 3 repeticiones"""
+    mejor, salida = float("inf"), None
+    for _ in range(3):
+        inicio = time.perf_counter()
+        salida = [funcion(entrada) for entrada in entradas]
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor / len(entradas) * 1e6, salida
+
+
+def medir(nombre: str, textos: list, antes: bool) -> dict:
+    parseo, modelos = cronometrar(RespuestasTest.model_validate_json, textos)
+    respuestas = [modelo.respuestas for modelo in modelos]
+    if antes:
+        validacion, validadas = cronometrar(validar_antes, respuestas)
+        puntuacion, puntajes = cronometrar(
+            lambda r: (scoring_service.calculate_raw_scores(r), empaquetar_respuestas(r)), validadas
+        )
+        puntajes = [p for p, _ in puntajes]
+    else:
+        validacion, paquetes = cronometrar(respuestas_empaquetadas, respuestas)
+        puntuacion, puntajes = cronometrar(scoring_service.calcular_puntajes_empaquetados, paquetes)
+    return {
+        "formato": nombre,
+        "parseo": parseo,
+        "validacion": validacion,
+        "puntuacion": puntuacion,
+        "total": parseo + validacion + puntuacion,
+        "puntajes": puntajes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Formatos de respuestas: parseo, validación y puntuación")
+    parser.add_argument("--tests", type=int, default=20000)
+    args = parser.parse_args()
+
+    textos = cuerpos(args.tests)
+    filas = [
+        medir("diccionario (antes)", textos["diccionario"], antes=True),
+        medir("diccionario", textos["diccionario"], antes=False),
+        medir("lista", textos["lista"], antes=False),
+        medir("cadena", textos["cadena"], antes=False),
+    ]
+    referencia = filas[0]
+    print(f"{'formato':<22} {'parseo':>8} {'validación':>11} {'puntuación':>11} {'total µs':>9} {'vs antes':>9}")
+    for fila in filas:
+        print(f"{fila['formato']:<22} {fila['parseo']:>8.2f} {fila['validacion']:>11.2f} "
+              f"{fila['puntuacion']:>11.2f} {fila['total']:>9.2f} {referencia['total'] / fila['total']:>8.1f}x")
+    iguales = all(fila["puntajes"] == referencia["puntajes"] for fila in filas)
+    print(f"Puntajes idénticos en los cuatro caminos: {'sí' if iguales else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
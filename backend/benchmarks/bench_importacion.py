@@ -0,0 +1,97 @@
+# bench_importacion.py - Importación CSV en bloque (POST /admin/importar) de principio a fin
+#
+# Genera un CSV con N tests aleatorios (algunas filas inválidas, fechas de aplicación
+# repartidas en un año y algunas anteriores a 1970), lo importa con ImportacionCSV
+# contra un almacén nuevo y comprueba que un recorrido completo (el de /admin/exportar
+# y estadisticas.py) devuelve todas las filas importadas y que las estadísticas de
+# población coinciden con las recalculadas desde los tests guardados.
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_importacion.py --filas 500000 --almacen sqlite memoria
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import estadisticas  # noqa: E402
+from almacenamiento import INICIO_MAXIMO, INICIO_MINIMO, AlmacenMemoria, AlmacenSQLite  # noqa: E402
+from importacion import COLUMNAS_RESPUESTA, ImportacionCSV  # noqa: E402
+from main import POBLACION_POR_DEFECTO, normas_vigentes  # noqa: E402
+
+# Una fila inválida cada tantas
+CADA_INVALIDA = 1000
+# Una hoja antigua (fecha anterior a 1970, inicio negativo) cada tantas
+CADA_ANTIGUA = 997
+
+
+def generar_csv(ruta: str, filas: int) -> None:
+    rng = random.Random(1)
+    with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+        archivo.write(",".join(["email", "fecha"] + COLUMNAS_RESPUESTA) + "\n")
+        for i in range(filas):
+            respuestas = [str(rng.randint(0, 4)) for _ in COLUMNAS_RESPUESTA]
+            if i % CADA_INVALIDA == CADA_INVALIDA - 1:
+                respuestas[-1] = "7"
+            # Las hojas en papel llegan agrupadas por fecha de aplicación, a lo largo de un año
+            fecha = (date(2025, 1, 1) + timedelta(days=i * 365 // filas)).isoformat()
+            if i % CADA_ANTIGUA == 0:
+                fecha = "1969-06-01"
+            archivo.write(f"clinica{i % 50}@ejemplo.com,{fecha}," + ",".join(respuestas) + "\n")
+
+
+def recalcular(almacen, scoring_service) -> tuple:
+    """(estadísticas recalculadas, tests recorridos) con el mismo recorrido que la exportación"""
+    estado = estadisticas.estado_vacio(scoring_service.indicadores)
+    recorridos = 0
+    for test in almacen.iterar_tests(despues_de=INICIO_MINIMO, hasta=INICIO_MAXIMO, completado=True):
+        resultados = scoring_service.interpret_scores(dict(zip(scoring_service.indicadores, test.raw_scores)))
+        estadisticas.registrar(estado, resultados["raw_scores"], resultados["levels"], test.fin)
+        recorridos += 1
+    return estado, recorridos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la importación CSV en bloque")
+    parser.add_argument("--filas", type=int, default=500_000)
+    parser.add_argument("--almacen", nargs="+", default=["sqlite", "memoria"], choices=["sqlite", "memoria"])
+    parser.add_argument("--sin-verificar", action="store_true", help="No recorre los tests ni recalcula las estadísticas al final")
+    args = parser.parse_args()
+
+    scoring_service = normas_vigentes(POBLACION_POR_DEFECTO)
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_csv = os.path.join(directorio, "tests.csv")
+        generar_csv(ruta_csv, args.filas)
+        print(f"CSV: {args.filas} filas, {os.path.getsize(ruta_csv) / 2**20:.1f} MB")
+        print(f"{'almacén':>8} {'segundos':>9} {'filas/s':>9} {'importadas':>11} {'errores':>8} "
+              f"{'recorridas':>11} {'estadísticas':>13}")
+        for tipo in args.almacen:
+            if tipo == "sqlite":
+                almacen = AlmacenSQLite(os.path.join(directorio, f"bench_{time.time_ns()}.db"))
+            else:
+                almacen = AlmacenMemoria()
+            trabajo = ImportacionCSV(open(ruta_csv, "rb"), "tests.csv", "admin@ejemplo.com", almacen, scoring_service)
+            comienzo = time.perf_counter()
+            estado = trabajo.ejecutar()
+            segundos = time.perf_counter() - comienzo
+            if estado["estado"] != "completado":
+                raise SystemExit(f"La importación falló: {estado['detalle']}")
+            verificacion, recorridas = "-", "-"
+            if not args.sin_verificar:
+                guardado = almacen.obtener_documento(estadisticas.CLAVE_DOCUMENTO)
+                recalculado, recorridas = recalcular(almacen, scoring_service)
+                verificacion = "ok" if not estadisticas.diferencias(guardado, recalculado) else "DIFIEREN"
+            print(f"{tipo:>8} {segundos:>9.2f} {args.filas / segundos:>9.0f} {estado['filas_importadas']:>11} "
+                  f"{estado['filas_con_error']:>8} {recorridas:>11} {verificacion:>13}")
+            if not args.sin_verificar and recorridas != estado["filas_importadas"]:
+                raise SystemExit(f"El recorrido completo devolvió {recorridas} de {estado['filas_importadas']} filas importadas")
+            almacen.cerrar()
+
+
+if __name__ == "__main__":
+    main()
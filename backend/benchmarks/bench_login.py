@@ -0,0 +1,102 @@
+# bench_login.py - Latencia de /login bajo carga concurrente, con y sin pool de hashing
+#
+# Levanta uvicorn dos veces (CSI_HASH_PROCESOS=0: scrypt en línea; CSI_HASH_PROCESOS=N:
+# pool de procesos) y lanza una tormenta de logins mientras una sonda mide la latencia
+# de un endpoint ajeno (GET /test/preguntas) para ver si el resto del servidor se bloquea.
+#
+# Requiere httpx (solo para el benchmark): pip install httpx
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_login.py --usuarios 50 --logins 400 --concurrencia 32
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+from carga_almacen import levantar_servidor
+
+
+def percentil(valores: list, p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+async def tormenta(url: str, usuarios: int, logins: int, concurrencia: int) -> dict:
+    limites = httpx.Limits(max_connections=concurrencia + 1)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120) as cliente:
+        emails = [f"login{i}@ejemplo.com" for i in range(usuarios)]
+        for email in emails:
+            await cliente.post("/registro", json={
+                "nombre": "Bench", "primerApellido": "Login", "email": email, "password": "secreto123"
+            })
+
+        latencias, sonda, rechazados = [], [], 0
+        terminado = asyncio.Event()
+        semaforo = asyncio.Semaphore(concurrencia)
+
+        async def login(i: int):
+            nonlocal rechazados
+            async with semaforo:
+                inicio = time.perf_counter()
+                r = await cliente.post("/login", json={"email": emails[i % usuarios], "password": "secreto123"})
+                if r.status_code == 503:
+                    rechazados += 1
+                else:
+                    latencias.append(time.perf_counter() - inicio)
+
+        async def sondear():
+            while not terminado.is_set():
+                inicio = time.perf_counter()
+                await cliente.get("/test/preguntas")
+                sonda.append(time.perf_counter() - inicio)
+                await asyncio.sleep(0.02)
+
+        tarea_sonda = asyncio.create_task(sondear())
+        inicio = time.perf_counter()
+        await asyncio.gather(*[login(i) for i in range(logins)])
+        duracion = time.perf_counter() - inicio
+        terminado.set()
+        await tarea_sonda
+
+    return {
+        "duracion": duracion,
+        "login_p50": statistics.median(latencias) if latencias else 0.0,
+        "login_p99": percentil(latencias, 99),
+        "sonda_p99": percentil(sonda, 99),
+        "rechazados": rechazados,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de /login con y sin pool de hashing")
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    configuraciones = [
+        ("sin pool (en línea)", {"CSI_ALMACEN": "memoria", "CSI_HASH_PROCESOS": "0"}),
+        (f"pool de {args.procesos} procesos", {"CSI_ALMACEN": "memoria", "CSI_HASH_PROCESOS": str(args.procesos)}),
+    ]
+    print(f"{'configuración':<24} {'login/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'sonda p99 ms':>13} {'503':>5}")
+    for nombre, entorno in configuraciones:
+        proceso, url = levantar_servidor(1, entorno)
+        try:
+            r = asyncio.run(tormenta(url, args.usuarios, args.logins, args.concurrencia))
+        finally:
+            proceso.terminate()
+            proceso.wait()
+        print(f"{nombre:<24} {(args.logins - r['rechazados']) / r['duracion']:>8.0f} "
+              f"{r['login_p50'] * 1000:>8.1f} {r['login_p99'] * 1000:>8.1f} "
+              f"{r['sonda_p99'] * 1000:>13.1f} {r['rechazados']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# bench_lote.py - Rendimiento del cálculo CSI por lotes frente al cálculo test a test
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_lote.py
+#   python benchmarks/bench_lote.py --tamanos 10000 1000000 --muestra-escalar 20000
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import POBLACION_POR_DEFECTO, normas_vigentes  # noqa: E402
+
+scoring_service = normas_vigentes(POBLACION_POR_DEFECTO)
+
+
+def generar_matriz(n: int, semilla: int = 42) -> np.ndarray:
+    return np.random.default_rng(semilla).integers(0, 5, size=(n, 40), dtype=np.int32)
+
+
+def a_diccionario(fila) -> dict:
+    return {q + 1: int(v) for q, v in enumerate(fila)}
+
+
+def verificar_equivalencia(matriz: np.ndarray) -> None:
+    lote = scoring_service.calculate_scores_batch(matriz)
+    for i, fila in enumerate(matriz):
+        esperado = scoring_service.calculate_scores(a_diccionario(fila))
+        obtenido = scoring_service.expandir_resultado(
+            lote["raw_scores"][i], lote["percentiles"][i], lote["levels"][i]
+        )
+        if esperado != obtenido:
+            raise SystemExit(f"Diferencia en el test {i}:\n{esperado}\n{obtenido}")
+
+
+def medir_escalar(matriz: np.ndarray) -> float:
+    respuestas = [a_diccionario(fila) for fila in matriz]
+    inicio = time.perf_counter()
+    for r in respuestas:
+        scoring_service.calculate_scores(r)
+    return time.perf_counter() - inicio
+
+
+def medir_lote(matriz: np.ndarray) -> float:
+    inicio = time.perf_counter()
+    scoring_service.calculate_scores_batch(matriz)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del cálculo CSI por lotes")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--muestra-escalar", type=int, default=50_000,
+                        help="Máximo de tests a medir en modo escalar (se extrapola el resto)")
+    args = parser.parse_args()
+
+    verificar_equivalencia(generar_matriz(2_000, semilla=7))
+    print("Equivalencia escalar/lote: OK (2000 tests aleatorios)\n")
+
+    print(f"{'tests':>10} {'escalar (t/s)':>15} {'lote (t/s)':>15} {'aceleración':>12}")
+    for n in args.tamanos:
+        matriz = generar_matriz(n)
+        muestra = matriz[:min(n, args.muestra_escalar)]
+        escalar = len(muestra) / medir_escalar(muestra)
+        lote = n / medir_lote(matriz)
+        print(f"{n:>10} {escalar:>15,.0f} {lote:>15,.0f} {lote / escalar:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
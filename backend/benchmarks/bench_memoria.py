@@ -0,0 +1,113 @@
+# bench_memoria.py - Memoria por test almacenado: formato anterior (dicts) vs RegistroTest compacto
+#
+# Mide con tracemalloc lo que ocupan N tests completados en AlmacenMemoria y lo
+# compara con el formato anterior (dict del test + dict de 40 respuestas +
+# resultados expandidos). El formato anterior se mide hasta --max-antiguo tests
+# y se extrapola linealmente a partir de ahí para no agotar la RAM.
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_memoria.py --tamanos 100000 1000000
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacenamiento import AlmacenMemoria, RegistroTest, ahora_epoch_us  # noqa: E402
+from main import POBLACION_POR_DEFECTO, empaquetar_puntajes, empaquetar_respuestas, normas_vigentes  # noqa: E402
+
+scoring_service = normas_vigentes(POBLACION_POR_DEFECTO)
+
+TESTS_POR_USUARIO = 5
+
+
+def respuestas_aleatorias(rng: random.Random) -> dict:
+    return {q: rng.randint(0, 4) for q in range(1, 41)}
+
+
+def situacion(i: int) -> str:
+    return f"Situación estresante número {i}: conflicto en el trabajo que me generó ansiedad"
+
+
+def email_de(i: int) -> str:
+    # Una cadena nueva por test, como la que devuelve verificar_token en cada petición
+    return "".join(["usuario", str(i // TESTS_POR_USUARIO), "@ejemplo.com"])
+
+
+def medir(construir, n: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    datos = construir(n)
+    despues = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del datos
+    gc.collect()
+    return despues - antes
+
+
+def construir_antiguo(n: int):
+    rng = random.Random(1)
+    tests_db, respuestas_db = {}, {}
+    for i in range(n):
+        test_id = str(uuid.uuid4())
+        respuestas = respuestas_aleatorias(rng)
+        tests_db[test_id] = {
+            "test_id": test_id,
+            "email": email_de(i),
+            "situacion_estresante": situacion(i),
+            "fecha_inicio": datetime.now().isoformat(),
+            "estado": "en_progreso",
+            "completado": True,
+            "fecha_completado": datetime.now().isoformat(),
+            "capacidad_afrontamiento": 3,
+            "resultados": scoring_service.calculate_scores(respuestas)
+        }
+        respuestas_db[test_id] = respuestas
+    return tests_db, respuestas_db
+
+
+def construir_compacto(n: int):
+    rng = random.Random(1)
+    almacen = AlmacenMemoria()
+    for i in range(n):
+        test_id = str(uuid.uuid4())
+        respuestas = respuestas_aleatorias(rng)
+        almacen.crear_test(RegistroTest(test_id, email_de(i), situacion(i), ahora_epoch_us()))
+        almacen.completar_test(
+            test_id,
+            respuestas=empaquetar_respuestas(respuestas),
+            raw_scores=empaquetar_puntajes(scoring_service.calculate_raw_scores(respuestas)),
+            fin=ahora_epoch_us(),
+            capacidad_afrontamiento=3
+        )
+    return almacen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria de los tests almacenados")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--max-antiguo", type=int, default=100_000,
+                        help="Tests a medir en el formato anterior; el resto se extrapola")
+    args = parser.parse_args()
+
+    print(f"{'tests':>10} {'anterior MB':>12} {'B/test':>8} {'compacto MB':>12} {'B/test':>8} {'reducción':>10}")
+    for n in args.tamanos:
+        muestra = min(n, args.max_antiguo)
+        antiguo = medir(construir_antiguo, muestra) * n / muestra
+        compacto = medir(construir_compacto, n)
+        marca = "*" if muestra < n else " "
+        print(f"{n:>10} {antiguo / 2**20:>11.1f}{marca} {antiguo / n:>8.0f} "
+              f"{compacto / 2**20:>12.1f} {compacto / n:>8.0f} {antiguo / compacto:>9.1f}x")
+    if any(n > args.max_antiguo for n in args.tamanos):
+        print(f"\n* extrapolado desde {args.max_antiguo} tests")
+
+
+if __name__ == "__main__":
+    main()
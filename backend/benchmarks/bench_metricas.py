@@ -0,0 +1,131 @@
+# bench_metricas.py - Coste de la instrumentación (/metrics) en los endpoints del recorrido
+#
+# Importa la app sin el middleware (CSI_METRICAS=0) y la mide de dos formas sobre el
+# mismo almacén: tal cual y con tramos desactivados (muestreo 0), frente a envuelta en
+# MiddlewareMetricas con todos los tramos o con --muestreo. Las rondas se alternan para
+# que la deriva del sistema afecte por igual a ambas variantes.
+#
+# En una máquina compartida la diferencia entre rondas puede ser mayor que el propio
+# coste, así que también se mide aislado: el middleware con una app vacía y un tramo
+# vacío, multiplicados por los tramos que genera cada petición real.
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_metricas.py --rondas 15 --peticiones 200
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+os.environ.setdefault("CSI_ALMACEN", "memoria")
+os.environ.setdefault("CSI_HASH_PROCESOS", "0")
+os.environ["CSI_METRICAS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app, metricas  # noqa: E402
+from metricas import Metricas, MiddlewareMetricas  # noqa: E402
+
+
+async def preparar(cliente: httpx.AsyncClient) -> tuple:
+    r = await cliente.post("/registro", json={
+        "nombre": "Bench", "primerApellido": "Metricas", "email": "metricas@ejemplo.com", "password": "secreto123"
+    })
+    cabeceras = {"Authorization": f"Bearer {r.json()['token']}"}
+    r = await cliente.post("/test/iniciar", headers=cabeceras,
+                           json={"situacion_estresante": "Situación de prueba para las métricas"})
+    test_id = r.json()["test_id"]
+    await cliente.post(f"/test/{test_id}/responder", headers=cabeceras,
+                       json={"respuestas": {str(q): q % 5 for q in range(1, 41)}})
+    return cabeceras, test_id
+
+
+async def ronda(cliente: httpx.AsyncClient, cabeceras: dict, test_id: str, peticiones: int) -> float:
+    """
+    Microsegundos por petición de una mezcla de lecturas del recorrido
+    (sin escrituras: el almacén no cambia entre rondas y las variantes son comparables)
+    """
+    inicio = time.perf_counter()
+    for _ in range(peticiones // 4):
+        await cliente.get("/test/preguntas")
+        await cliente.get(f"/test/{test_id}/resultados", headers=cabeceras)
+        await cliente.get("/test/historial", headers=cabeceras)
+        await cliente.get("/perfil", headers=cabeceras)
+    return (time.perf_counter() - inicio) / (peticiones // 4 * 4) * 1e6
+
+
+async def medir(rondas: int, peticiones: int, muestreo: float) -> dict:
+    variantes = {
+        "sin métricas": httpx.ASGITransport(app=app),
+        "con métricas": httpx.ASGITransport(app=MiddlewareMetricas(app, metricas)),
+    }
+    tiempos = {nombre: [] for nombre in variantes}
+    async with httpx.AsyncClient(transport=variantes["sin métricas"], base_url="http://bench") as cliente:
+        cabeceras, test_id = await preparar(cliente)
+    for i in range(rondas):
+        orden = list(variantes.items())
+        for nombre, transporte in (orden if i % 2 == 0 else orden[::-1]):
+            metricas.muestreo = muestreo if nombre == "con métricas" else 0.0
+            async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+                tiempos[nombre].append(await ronda(cliente, cabeceras, test_id, peticiones))
+    return {nombre: statistics.median(valores) for nombre, valores in tiempos.items()}
+
+
+async def coste_aislado(iteraciones: int) -> dict:
+    """Microsegundos por petición del middleware y por tramo, sin el resto de la app"""
+    class Ruta:
+        path = "/test/{test_id}/resultados"
+
+    async def vacia(scope, receive, send):
+        scope["route"] = Ruta
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def enviar(mensaje):
+        pass
+
+    propias = Metricas()
+    envuelta = MiddlewareMetricas(vacia, propias)
+    tiempos = {}
+    for nombre, destino in (("vacia", vacia), ("middleware", envuelta)):
+        inicio = time.perf_counter()
+        for _ in range(iteraciones):
+            await destino({"type": "http", "method": "GET"}, None, enviar)
+        tiempos[nombre] = (time.perf_counter() - inicio) / iteraciones * 1e6
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        with propias.tramo("vacio"):
+            pass
+    return {
+        "middleware_us": tiempos["middleware"] - tiempos["vacia"],
+        "tramo_us": (time.perf_counter() - inicio) / iteraciones * 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste de la instrumentación de métricas")
+    parser.add_argument("--rondas", type=int, default=15)
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--muestreo", type=float, default=1.0)
+    args = parser.parse_args()
+
+    resultado = asyncio.run(medir(args.rondas, args.peticiones, args.muestreo))
+    base = resultado["sin métricas"]
+    for nombre, valor in resultado.items():
+        print(f"{nombre:<14} {valor:>9.1f} µs/petición  ({(valor - base) / base:+.2%})")
+
+    # Tramos medidos por petición en la variante con métricas
+    peticiones = sum(sum(serie[:-1]) for serie in metricas.latencias.series.values()) or 1
+    tramos = sum(sum(serie[:-1]) for serie in metricas.tramos.series.values()) / peticiones
+    aislado = asyncio.run(coste_aislado(100_000))
+    estimado = aislado["middleware_us"] + aislado["tramo_us"] * tramos
+    print(f"coste aislado: middleware {aislado['middleware_us']:.2f} µs, tramo {aislado['tramo_us']:.2f} µs "
+          f"x {tramos:.2f} por petición = {estimado:.2f} µs ({estimado / base:.2%} de la petición media)")
+    print(f"exposición de /metrics: {len(metricas.exponer())} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+# bench_recorridos.py - Benchmark de extremo a extremo de la API CSI con comparación contra una línea base
+#
+# Ejecuta recorridos completos de usuario:
+#   /registro -> /login -> /test/preguntas -> (/test/iniciar -> /test/{id}/responder
+#   -> /test/{id}/resultados) x N -> /test/historial
+# contra la app ASGI en el mismo proceso (por defecto) o contra uvicorn en un subproceso
+# (--modo uvicorn). Antes de la carga se precargan --tests-almacenados tests completados
+# con /admin/importar, para medir con un almacén de tamaño realista.
+#
+# Informa rendimiento total, p50/p95/p99 por endpoint, RSS antes y después de la carga
+# y microbenchmarks de calculate_scores, crear_token y verificar_token. Con --salida
+# escribe el resultado en JSON; con --comparar lo contrasta con un JSON anterior y
+# termina con código 1 si alguna métrica empeora más de --tolerancia (p95 por endpoint,
+# peticiones por segundo y tiempo por llamada de los microbenchmarks) o si hubo errores.
+# El RSS se informa pero no se compara: depende demasiado del alojador de memoria.
+#
+# Requiere httpx (solo para el benchmark): pip install httpx
+#
+# Uso (desde backend/):
+#   python benchmarks/bench_recorridos.py --usuarios 100 --tests-por-usuario 3 --salida base.json
+#   python benchmarks/bench_recorridos.py --usuarios 100 --tests-por-usuario 3 --comparar base.json
+#   python benchmarks/bench_recorridos.py --modo uvicorn --almacen sqlite --tests-almacenados 100000
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from bench_login import percentil
+from carga_almacen import SIN_LIMITES, levantar_servidor
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+ADMIN = "admin-bench@ejemplo.com"
+# Dueño de los tests precargados; no participa en los recorridos
+RELLENO = "relleno-bench@ejemplo.com"
+PASSWORD = "secreto123"
+SITUACION = "Situación de prueba para el benchmark de recorridos"
+
+
+# ============================================
+# MEMORIA
+# ============================================
+
+def rss_bytes(pid: int) -> int:
+    """RSS de un proceso y de sus hijos (workers de uvicorn, pool de hashing); 0 fuera de Linux"""
+    total = 0
+    pendientes = [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with open(f"/proc/{actual}/status") as f:
+                for linea in f:
+                    if linea.startswith("VmRSS:"):
+                        total += int(linea.split()[1]) * 1024
+                        break
+            with open(f"/proc/{actual}/task/{actual}/children") as f:
+                pendientes.extend(int(hijo) for hijo in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+# ============================================
+# CARGA
+# ============================================
+
+def csv_relleno(n: int, semilla: int = 7) -> bytes:
+    rng = random.Random(semilla)
+    filas = [",".join(["email"] + [f"p{q}" for q in range(1, 41)])]
+    filas.extend(
+        ",".join([RELLENO] + [str(rng.randint(0, 4)) for _ in range(40)])
+        for _ in range(n)
+    )
+    return ("\n".join(filas) + "\n").encode()
+
+
+async def precargar(cliente: httpx.AsyncClient, tests: int) -> float:
+    """Importa `tests` tests completados; devuelve los segundos que tardó"""
+    if tests <= 0:
+        return 0.0
+    await cliente.post("/registro", json={
+        "nombre": "Admin", "primerApellido": "Bench", "email": ADMIN, "password": PASSWORD
+    })
+    r = await cliente.post("/login", json={"email": ADMIN, "password": PASSWORD})
+    cabeceras = {"Authorization": f"Bearer {r.json()['token']}"}
+    inicio = time.perf_counter()
+    r = await cliente.post("/admin/importar", headers=cabeceras,
+                           files={"archivo": ("relleno.csv", io.BytesIO(csv_relleno(tests)), "text/csv")})
+    if r.status_code != 202:
+        raise SystemExit(f"La precarga falló: {r.status_code} {r.text}")
+    trabajo_id = r.json()["trabajo_id"]
+    while True:
+        await asyncio.sleep(0.2)
+        estado = (await cliente.get(f"/admin/importar/{trabajo_id}", headers=cabeceras)).json()
+        if estado["estado"] in ("completado", "fallido", "cancelado"):
+            break
+    if estado["estado"] != "completado" or estado["filas_importadas"] != tests:
+        raise SystemExit(f"La precarga falló: {estado}")
+    return time.perf_counter() - inicio
+
+
+async def recorrido(cliente: httpx.AsyncClient, indice: int, tests: int, semaforo,
+                    latencias: dict, errores: list) -> None:
+    rng = random.Random(indice)
+    email = f"recorrido{indice}-{random.randrange(10**9)}@ejemplo.com"
+
+    async def peticion(endpoint: str, metodo: str, ruta: str, **kwargs):
+        inicio = time.perf_counter()
+        r = await cliente.request(metodo, ruta, **kwargs)
+        latencias[endpoint].append((time.perf_counter() - inicio) * 1000)
+        if r.status_code >= 400:
+            errores.append(f"{endpoint} {r.status_code}")
+        return r
+
+    async with semaforo:
+        await peticion("POST /registro", "POST", "/registro", json={
+            "nombre": "Bench", "primerApellido": str(indice), "email": email, "password": PASSWORD
+        })
+        r = await peticion("POST /login", "POST", "/login", json={"email": email, "password": PASSWORD})
+        if r.status_code != 200:
+            return
+        cabeceras = {"Authorization": f"Bearer {r.json()['token']}"}
+        await peticion("GET /test/preguntas", "GET", "/test/preguntas")
+        for _ in range(tests):
+            r = await peticion("POST /test/iniciar", "POST", "/test/iniciar", headers=cabeceras,
+                               json={"situacion_estresante": SITUACION})
+            if r.status_code != 200:
+                return
+            test_id = r.json()["test_id"]
+            respuestas = {str(q): rng.randint(0, 4) for q in range(1, 41)}
+            await peticion("POST /test/{test_id}/responder", "POST", f"/test/{test_id}/responder",
+                           headers=cabeceras, json={"respuestas": respuestas})
+            await peticion("GET /test/{test_id}/resultados", "GET", f"/test/{test_id}/resultados",
+                           headers=cabeceras)
+        r = await peticion("GET /test/historial", "GET", "/test/historial", headers=cabeceras)
+        if r.status_code == 200 and r.json().get("total_tests") != tests:
+            errores.append(f"historial incorrecto para {email}")
+
+
+async def ejecutar_carga(cliente: httpx.AsyncClient, args, pid: int) -> dict:
+    segundos_precarga = await precargar(cliente, args.tests_almacenados)
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    errores = []
+    # Calentamiento: arranca el pool de hashing y llena cachés; sus latencias no cuentan
+    await asyncio.gather(*[
+        recorrido(cliente, -1 - i, 1, semaforo, defaultdict(list), errores)
+        for i in range(args.calentamiento)
+    ])
+    rss_antes = rss_bytes(pid)
+
+    latencias = defaultdict(list)
+    inicio = time.perf_counter()
+    await asyncio.gather(*[
+        recorrido(cliente, i, args.tests_por_usuario, semaforo, latencias, errores)
+        for i in range(args.usuarios)
+    ])
+    duracion = time.perf_counter() - inicio
+    rss_despues = rss_bytes(pid)
+
+    peticiones = sum(len(valores) for valores in latencias.values())
+    return {
+        "precarga_segundos": round(segundos_precarga, 3),
+        "duracion_segundos": round(duracion, 3),
+        "peticiones": peticiones,
+        "peticiones_por_segundo": round(peticiones / duracion, 1),
+        "endpoints": {
+            endpoint: {
+                "n": len(valores),
+                "p50_ms": round(percentil(valores, 50), 3),
+                "p95_ms": round(percentil(valores, 95), 3),
+                "p99_ms": round(percentil(valores, 99), 3)
+            }
+            for endpoint, valores in latencias.items()
+        },
+        "rss_antes_mb": round(rss_antes / 2**20, 1),
+        "rss_despues_mb": round(rss_despues / 2**20, 1),
+        "rss_crecimiento_mb": round((rss_despues - rss_antes) / 2**20, 1),
+        "errores": len(errores),
+        "ejemplos_errores": sorted(set(errores))[:10]
+    }
+
+
+async def carga_en_proceso(args) -> dict:
+    from main import app
+
+    transporte = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=600) as cliente:
+            return await ejecutar_carga(cliente, args, os.getpid())
+
+
+async def carga_uvicorn(args, url: str, pid: int) -> dict:
+    limites = httpx.Limits(max_connections=args.concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=600) as cliente:
+        return await ejecutar_carga(cliente, args, pid)
+
+
+# ============================================
+# MICROBENCHMARKS
+# ============================================
+
+def cronometrar(funcion, iteraciones: int) -> float:
+    """Microsegundos por llamada (mejor de 3 repeticiones)"""
+    mejor = float("inf")
+    for _ in range(3):
+        inicio = time.perf_counter()
+        for i in range(iteraciones):
+            funcion(i)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return round(mejor / iteraciones * 1e6, 3)
+
+
+def microbenchmarks(iteraciones: int) -> dict:
+    from fastapi.security import HTTPAuthorizationCredentials
+
+    from main import POBLACION_POR_DEFECTO, cache_tokens, crear_token, normas_vigentes, verificar_token
+
+    scoring_service = normas_vigentes(POBLACION_POR_DEFECTO)
+
+    rng = random.Random(3)
+    respuestas = [{q: rng.randint(0, 4) for q in range(1, 41)} for _ in range(256)]
+    # Emails distintos: dentro del mismo segundo crear_token daría el mismo token
+    credenciales = [
+        HTTPAuthorizationCredentials(scheme="Bearer", credentials=crear_token(f"micro{i}@ejemplo.com"))
+        for i in range(iteraciones)
+    ]
+    fija = credenciales[0]
+
+    def verificar_sin_cache(i):
+        cache_tokens.capacidad, capacidad = 0, cache_tokens.capacidad
+        try:
+            verificar_token(credenciales[i])
+        finally:
+            cache_tokens.capacidad = capacidad
+
+    return {
+        "calculate_scores_us": cronometrar(lambda i: scoring_service.calculate_scores(respuestas[i % 256]), iteraciones),
+        "crear_token_us": cronometrar(lambda i: crear_token(f"micro{i}@ejemplo.com"), iteraciones),
+        "verificar_token_us": cronometrar(lambda i: verificar_token(fija), iteraciones),
+        "verificar_token_sin_cache_us": cronometrar(verificar_sin_cache, iteraciones),
+    }
+
+
+# ============================================
+# COMPARACIÓN
+# ============================================
+
+def regresiones(actual: dict, base: dict, tolerancia: float) -> list:
+    """Métricas que empeoran más de `tolerancia` (0.2 = 20 %) respecto a la línea base"""
+    encontradas = []
+
+    def comparar(nombre: str, nuevo: float, viejo: float, mayor_es_mejor: bool = False):
+        if not viejo:
+            return
+        cambio = (nuevo - viejo) / viejo
+        if (-cambio if mayor_es_mejor else cambio) > tolerancia:
+            encontradas.append(f"{nombre}: {viejo} -> {nuevo} ({cambio:+.0%})")
+
+    comparar("peticiones_por_segundo", actual["carga"]["peticiones_por_segundo"],
+             base["carga"]["peticiones_por_segundo"], mayor_es_mejor=True)
+    for endpoint, datos in actual["carga"]["endpoints"].items():
+        anterior = base["carga"]["endpoints"].get(endpoint)
+        if anterior is not None:
+            comparar(f"{endpoint} p95_ms", datos["p95_ms"], anterior["p95_ms"])
+    for nombre, valor in actual["micro"].items():
+        if nombre in base["micro"]:
+            comparar(nombre, valor, base["micro"][nombre])
+    return encontradas
+
+
+def imprimir(resultado: dict) -> None:
+    carga = resultado["carga"]
+    print(f"{carga['peticiones']} peticiones en {carga['duracion_segundos']} s "
+          f"({carga['peticiones_por_segundo']} pet/s), errores: {carga['errores']}")
+    print(f"{'endpoint':<34} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, datos in carga["endpoints"].items():
+        print(f"{endpoint:<34} {datos['n']:>7} {datos['p50_ms']:>9.2f} {datos['p95_ms']:>9.2f} {datos['p99_ms']:>9.2f}")
+    print(f"RSS: {carga['rss_antes_mb']} MB -> {carga['rss_despues_mb']} MB "
+          f"({carga['rss_crecimiento_mb']:+} MB)")
+    for nombre, valor in resultado["micro"].items():
+        print(f"{nombre:<34} {valor:>10.2f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo de la API CSI")
+    parser.add_argument("--modo", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--almacen", choices=("memoria", "sqlite"), default="memoria")
+    parser.add_argument("--workers", type=int, default=1, help="Solo con --modo uvicorn")
+    parser.add_argument("--usuarios", type=int, default=100)
+    parser.add_argument("--tests-por-usuario", type=int, default=3)
+    parser.add_argument("--tests-almacenados", type=int, default=10000)
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--calentamiento", type=int, default=8, help="Recorridos previos que no se miden")
+    parser.add_argument("--iteraciones-micro", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", help="Escribe el resultado en este JSON")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior usado como línea base")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    args = parser.parse_args()
+    random.seed(args.semilla)
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        entorno = {**SIN_LIMITES, "CSI_ALMACEN": args.almacen, "CSI_ADMINS": ADMIN}
+        if args.almacen == "sqlite":
+            entorno["CSI_DB_PATH"] = os.path.join(carpeta, "bench.db")
+
+        if args.modo == "uvicorn":
+            proceso, url = levantar_servidor(args.workers, entorno)
+            try:
+                carga = asyncio.run(carga_uvicorn(args, url, proceso.pid))
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            # Los microbenchmarks se ejecutan aquí: main se importa con la misma configuración
+            os.environ.update(entorno)
+        else:
+            # main lee la configuración al importarse
+            os.environ.update(entorno)
+            carga = asyncio.run(carga_en_proceso(args))
+        micro = microbenchmarks(args.iteraciones_micro)
+
+    resultado = {
+        "configuracion": {
+            clave: getattr(args, clave)
+            for clave in ("modo", "almacen", "workers", "usuarios", "tests_por_usuario",
+                          "tests_almacenados", "concurrencia", "calentamiento", "iteraciones_micro", "semilla")
+        },
+        # CSI_HASH_PROCESOS, tamaños de caché... cambian los resultados tanto como el código
+        "variables": {
+            clave: valor for clave, valor in sorted(os.environ.items())
+            if clave.startswith("CSI_") and clave != "CSI_DB_PATH"
+        },
+        "entorno": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "carga": carga,
+        "micro": micro
+    }
+    imprimir(resultado)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+
+    fallos = []
+    if carga["errores"]:
+        fallos.append(f"{carga['errores']} peticiones con error: {', '.join(carga['ejemplos_errores'])}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        if (base["configuracion"], base["variables"]) != (resultado["configuracion"], resultado["variables"]):
+            print("Aviso: la línea base se midió con otra configuración")
+        fallos.extend(regresiones(resultado, base, args.tolerancia))
+    if fallos:
+        print("REGRESIÓN:")
+        for fallo in fallos:
+            print(f"  {fallo}")
+        sys.exit(1)
+    if args.comparar:
+        print(f"Sin regresiones respecto a {args.comparar} (tolerancia {args.tolerancia:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# carga_almacen.py - Prueba de carga: 1 worker con diccionarios vs N workers con SQLite
+#
+# Levanta uvicorn en un subproceso para cada configuración y ejecuta recorridos
+# completos (registro -> login -> iniciar -> responder -> historial) con usuarios
+# concurrentes, comprobando que cada historial contiene exactamente los tests creados.
+#
+# Requiere httpx (solo para el benchmark): pip install httpx
+#
+# Uso (desde backend/):
+#   python benchmarks/carga_almacen.py --usuarios 200 --tests-por-usuario 3 --workers 4
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Todas las peticiones de los benchmarks salen de 127.0.0.1: sin límites de intentos
+# salvo que la configuración los pida (carga_limites.py)
+SIN_LIMITES = {
+    "CSI_LIMITE_IP_POR_MINUTO": "0",
+    "CSI_LIMITE_EMAIL_POR_MINUTO": "0",
+    "CSI_CONCURRENCIA_AUTENTICACION": "0",
+}
+
+
+def levantar_servidor(workers: int, entorno: dict, directorio: str = BACKEND) -> tuple:
+    puerto = puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=directorio,
+        env={**os.environ, **SIN_LIMITES, **entorno}
+    )
+    url = f"http://127.0.0.1:{puerto}"
+    for _ in range(200):
+        try:
+            if httpx.get(url + "/").status_code == 200:
+                return proceso, url
+        except httpx.TransportError:
+            time.sleep(0.05)
+    proceso.terminate()
+    raise SystemExit("El servidor no arrancó")
+
+
+async def recorrido(cliente: httpx.AsyncClient, indice: int, tests: int, semaforo, errores: list) -> int:
+    email = f"carga{indice}-{random.randrange(10**9)}@ejemplo.com"
+    peticiones = 0
+    async with semaforo:
+        r = await cliente.post("/registro", json={
+            "nombre": "Carga", "primerApellido": str(indice), "email": email, "password": "secreto123"
+        })
+        r = await cliente.post("/login", json={"email": email, "password": "secreto123"})
+        peticiones += 2
+        if r.status_code != 200:
+            errores.append(f"login {r.status_code}")
+            return peticiones
+        cabeceras = {"Authorization": f"Bearer {r.json()['token']}"}
+        for _ in range(tests):
+            r = await cliente.post("/test/iniciar", headers=cabeceras, json={
+                "situacion_estresante": "Situación de prueba para la carga del almacén"
+            })
+            test_id = r.json()["test_id"]
+            respuestas = {str(q): random.randint(0, 4) for q in range(1, 41)}
+            r = await cliente.post(f"/test/{test_id}/responder", headers=cabeceras,
+                                   json={"respuestas": respuestas})
+            peticiones += 2
+            if r.status_code != 200:
+                errores.append(f"responder {r.status_code}")
+        r = await cliente.get("/test/historial", headers=cabeceras)
+        peticiones += 1
+        historial = r.json()
+        if historial.get("total_tests") != tests or not all(t["completado"] for t in historial["tests"]):
+            errores.append(f"historial incorrecto para {email}")
+    return peticiones
+
+
+async def ejecutar_carga(url: str, usuarios: int, tests: int, concurrencia: int) -> dict:
+    semaforo = asyncio.Semaphore(concurrencia)
+    errores = []
+    limites = httpx.Limits(max_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        inicio = time.perf_counter()
+        peticiones = await asyncio.gather(*[
+            recorrido(cliente, i, tests, semaforo, errores) for i in range(usuarios)
+        ])
+        duracion = time.perf_counter() - inicio
+    return {"peticiones": sum(peticiones), "duracion": duracion, "errores": errores}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del almacén CSI")
+    parser.add_argument("--usuarios", type=int, default=200)
+    parser.add_argument("--tests-por-usuario", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--concurrencia", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        configuraciones = [
+            ("memoria, 1 worker", 1, {"CSI_ALMACEN": "memoria"}),
+            (f"sqlite, {args.workers} workers", args.workers,
+             {"CSI_ALMACEN": "sqlite", "CSI_DB_PATH": os.path.join(carpeta, "carga.db")}),
+        ]
+        print(f"{'configuración':<24} {'peticiones':>10} {'seg':>8} {'pet/s':>10} {'errores':>8}")
+        for nombre, workers, entorno in configuraciones:
+            proceso, url = levantar_servidor(workers, entorno)
+            try:
+                r = asyncio.run(ejecutar_carga(url, args.usuarios, args.tests_por_usuario, args.concurrencia))
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            print(f"{nombre:<24} {r['peticiones']:>10} {r['duracion']:>8.2f} "
+                  f"{r['peticiones'] / r['duracion']:>10.0f} {len(r['errores']):>8}")
+            for error in r["errores"][:5]:
+                print(f"    {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# carga_limites.py - Latencia de GET /test/{test_id}/resultados durante una avalancha de /login
+#
+# Levanta uvicorn con distintas configuraciones de límites, mide la latencia de una
+# sonda que lee resultados sin carga y después mientras se prueban contraseñas contra
+# cuentas existentes (cada intento que pasa cuesta un scrypt) a un ritmo fijo, y
+# compara los percentiles de ambas fases.
+#
+# - sin límites: todo intento llega a scrypt
+# - solo concurrencia: sin límites por IP/email (atacante distribuido), pero con
+#   tope de peticiones de autenticación simultáneas
+# - límites completos: cubos por IP y por email además del tope de concurrencia
+#
+# Requiere httpx (solo para el benchmark): pip install httpx
+#
+# Uso (desde backend/):
+#   python benchmarks/carga_limites.py --segundos 10 --ritmo 200 --concurrencia 128
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+
+from bench_login import percentil
+from carga_almacen import levantar_servidor
+
+CONFIGURACIONES = [
+    ("sin límites", {}),
+    ("solo concurrencia", {"CSI_CONCURRENCIA_AUTENTICACION": "2"}),
+    ("límites completos", {
+        "CSI_LIMITE_IP_POR_MINUTO": "60",
+        "CSI_LIMITE_EMAIL_POR_MINUTO": "10",
+        "CSI_CONCURRENCIA_AUTENTICACION": "2",
+    }),
+]
+
+
+VICTIMAS = [f"victima{i}@ejemplo.com" for i in range(10)]
+
+
+async def preparar(cliente: httpx.AsyncClient) -> tuple:
+    """Cuentas atacadas y un usuario con un test completado; devuelve (cabeceras, test_id)"""
+    for email in VICTIMAS:
+        await cliente.post("/registro", json={
+            "nombre": "Victima", "primerApellido": "Carga", "email": email, "password": "secreto123"
+        })
+    r = await cliente.post("/registro", json={
+        "nombre": "Sonda", "primerApellido": "Resultados", "email": "sonda@ejemplo.com", "password": "secreto123"
+    })
+    cabeceras = {"Authorization": f"Bearer {r.json()['token']}"}
+    r = await cliente.post("/test/iniciar", headers=cabeceras, json={
+        "situacion_estresante": "Situación de prueba para la sonda de resultados"
+    })
+    test_id = r.json()["test_id"]
+    await cliente.post(f"/test/{test_id}/responder", headers=cabeceras, json={
+        "respuestas": {str(q): random.randint(0, 4) for q in range(1, 41)}
+    })
+    return cabeceras, test_id
+
+
+async def sondear(cliente: httpx.AsyncClient, ruta: str, cabeceras: dict, segundos: float) -> list:
+    latencias = []
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        r = await cliente.get(ruta, headers=cabeceras)
+        latencias.append(time.perf_counter() - inicio)
+        if r.status_code != 200:
+            raise SystemExit(f"La sonda recibió {r.status_code}")
+        await asyncio.sleep(0.01)
+    return latencias
+
+
+async def medir(url: str, segundos: float, ritmo: float, concurrencia: int) -> dict:
+    limites = httpx.Limits(max_connections=concurrencia + 2)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120) as cliente:
+        cabeceras, test_id = await preparar(cliente)
+        ruta = f"/test/{test_id}/resultados"
+        base = await sondear(cliente, ruta, cabeceras, segundos)
+
+        estados = {}
+        terminado = asyncio.Event()
+        en_vuelo = set()
+
+        async def intento():
+            r = await cliente.post("/login", json={
+                "email": random.choice(VICTIMAS), "password": f"intento{random.randrange(10**6)}"
+            })
+            estados[r.status_code] = estados.get(r.status_code, 0) + 1
+
+        async def atacar():
+            # Ritmo fijo (bucle abierto): el atacante no espera a que el servidor responda,
+            # solo se limita a `concurrencia` conexiones abiertas
+            siguiente = time.perf_counter()
+            while not terminado.is_set():
+                if len(en_vuelo) < concurrencia:
+                    tarea = asyncio.create_task(intento())
+                    en_vuelo.add(tarea)
+                    tarea.add_done_callback(en_vuelo.discard)
+                siguiente += 1 / ritmo
+                await asyncio.sleep(max(0.0, siguiente - time.perf_counter()))
+
+        ataque = asyncio.create_task(atacar())
+        inicio = time.perf_counter()
+        avalancha = await sondear(cliente, ruta, cabeceras, segundos)
+        terminado.set()
+        await ataque
+        await asyncio.gather(*en_vuelo)
+        duracion = time.perf_counter() - inicio
+
+    return {
+        "base_p50": statistics.median(base),
+        "base_p99": percentil(base, 99),
+        "avalancha_p50": statistics.median(avalancha),
+        "avalancha_p99": percentil(avalancha, 99),
+        "logins_por_segundo": sum(estados.values()) / duracion,
+        "estados": estados,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de lecturas de resultados durante una avalancha de logins")
+    parser.add_argument("--segundos", type=float, default=10, help="Duración de cada fase (sin carga y con avalancha)")
+    parser.add_argument("--ritmo", type=float, default=200, help="Intentos de login por segundo")
+    parser.add_argument("--concurrencia", type=int, default=128, help="Máximo de intentos de login abiertos a la vez")
+    args = parser.parse_args()
+
+    print(f"{'configuración':<20} {'base p50':>9} {'base p99':>9} {'aval. p50':>10} {'aval. p99':>10} "
+          f"{'login/s':>8}  estados de /login")
+    for nombre, entorno in CONFIGURACIONES:
+        proceso, url = levantar_servidor(1, {"CSI_ALMACEN": "memoria", **entorno})
+        try:
+            r = asyncio.run(medir(url, args.segundos, args.ritmo, args.concurrencia))
+        finally:
+            proceso.terminate()
+            proceso.wait()
+        estados = ", ".join(f"{codigo}: {n}" for codigo, n in sorted(r["estados"].items()))
+        print(f"{nombre:<20} {r['base_p50'] * 1000:>8.1f}m {r['base_p99'] * 1000:>8.1f}m "
+              f"{r['avalancha_p50'] * 1000:>9.1f}m {r['avalancha_p99'] * 1000:>9.1f}m "
+              f"{r['logins_por_segundo']:>8.0f}  {estados}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# cache_http.py - Respuestas JSON serializadas y comprimidas una sola vez
+#
+# Para contenido que no cambia (catálogo del test, resultados completados):
+# el cuerpo se guarda como bytes en identity, gzip y brotli, con un ETag fuerte
+# por variante, y las peticiones con If-None-Match reciben 304 sin cuerpo.
+
+import gzip
+import hashlib
+import json
+from typing import Dict, Optional, Tuple
+
+import brotli
+from fastapi import Request, Response
+
+# Orden de preferencia cuando el cliente acepta varias codificaciones
+CODIFICACIONES = ("br", "gzip", "identity")
+
+
+def serializar_json(contenido) -> bytes:
+    return json.dumps(contenido, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def elegir_codificacion(accept_encoding: Optional[str]) -> str:
+    """Devuelve la codificación preferida entre las aceptadas por el cliente (q > 0)"""
+    if not accept_encoding:
+        return "identity"
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        calidad = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith("q="):
+            try:
+                calidad = float(parametros[2:])
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre.strip().lower()] = calidad
+    for codificacion in CODIFICACIONES:
+        if aceptadas.get(codificacion, aceptadas.get("*", 0.0)) > 0:
+            return codificacion
+    return "identity"
+
+
+def etags_solicitados(if_none_match: Optional[str]) -> set:
+    """ETags de If-None-Match; la comparación es débil, así que se ignora el prefijo W/"""
+    if not if_none_match:
+        return set()
+    return {etiqueta.strip().removeprefix("W/") for etiqueta in if_none_match.split(",")}
+
+
+class RespuestaPrecalculada:
+    """
+    Cuerpo JSON ya serializado y comprimido
+    - etag: identificador estable del contenido; por defecto, hash del cuerpo
+    - cache_control: valor de la cabecera Cache-Control
+    - nivel_gzip / calidad_br: máximos por defecto (contenido que se comprime una vez al
+      arrancar); más bajos para lo que se precalcula bajo demanda
+    """
+
+    def __init__(
+        self,
+        contenido,
+        cache_control: str,
+        etag: Optional[str] = None,
+        nivel_gzip: int = 9,
+        calidad_br: int = 11
+    ):
+        cuerpo = serializar_json(contenido)
+        base = etag or hashlib.sha256(cuerpo).hexdigest()[:32]
+        self.cache_control = cache_control
+        self.variantes: Dict[str, Tuple[bytes, str]] = {
+            "identity": (cuerpo, f'"{base}"'),
+            "gzip": (gzip.compress(cuerpo, compresslevel=nivel_gzip, mtime=0), f'"{base}-gzip"'),
+            "br": (brotli.compress(cuerpo, quality=calidad_br), f'"{base}-br"'),
+        }
+        self.etags = {etiqueta for _, etiqueta in self.variantes.values()}
+        self.tamano = sum(len(variante) for variante, _ in self.variantes.values())
+
+    def responder(self, request: Request) -> Response:
+        codificacion = elegir_codificacion(request.headers.get("accept-encoding"))
+        cuerpo, etiqueta = self.variantes[codificacion]
+        cabeceras = {
+            "ETag": etiqueta,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        solicitados = etags_solicitados(request.headers.get("if-none-match"))
+        if "*" in solicitados or solicitados & self.etags:
+            return Response(status_code=304, headers=cabeceras)
+        if codificacion != "identity":
+            cabeceras["Content-Encoding"] = codificacion
+        return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
@@ -0,0 +1,170 @@
+# estadisticas.py - Estadísticas de población de los indicadores CSI
+#
+# El estado es un dict serializable a JSON que se actualiza con cada test completado:
+# - histograma de 21 posiciones (puntaje bruto 0-20) por indicador
+# - conteo de niveles Bajo/Medio/Alto por indicador
+# - media y varianza acumuladas (Welford) por indicador
+# - tests completados por semana ISO
+#
+# Consultarlo cuesta lo mismo con 10 tests que con 10 millones.
+#
+# Reconstrucción desde el almacén (desde backend/):
+#   python estadisticas.py            # solo informa de las diferencias
+#   python estadisticas.py --aplicar  # además reemplaza el estado guardado
+
+import argparse
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from normas import NIVELES
+
+PUNTAJE_MAXIMO = 20
+
+# Clave del documento en el almacén
+CLAVE_DOCUMENTO = "estadisticas_poblacion"
+
+
+def estado_vacio(indicadores: Sequence[str]) -> Dict:
+    return {
+        "total": 0,
+        "indicadores": {
+            indicador: {
+                "histograma": [0] * (PUNTAJE_MAXIMO + 1),
+                "niveles": dict.fromkeys(NIVELES, 0),
+                "n": 0,
+                "media": 0.0,
+                "m2": 0.0
+            }
+            for indicador in indicadores
+        },
+        "semanas": {}
+    }
+
+
+def semana_iso(epoch_us: int) -> str:
+    anio, semana, _ = datetime.fromtimestamp(epoch_us // 1_000_000).isocalendar()
+    return f"{anio}-W{semana:02d}"
+
+
+def registrar(estado: Dict, raw_scores: Dict[str, int], niveles: Dict[str, str], fin: int) -> Dict:
+    """Suma un test completado al estado (lo modifica y lo devuelve)"""
+    estado["total"] += 1
+    for indicador, valor in raw_scores.items():
+        datos = estado["indicadores"][indicador]
+        datos["histograma"][valor] += 1
+        datos["niveles"][niveles[indicador]] += 1
+        # Welford: media y suma de cuadrados de las desviaciones sin guardar los valores
+        datos["n"] += 1
+        delta = valor - datos["media"]
+        datos["media"] += delta / datos["n"]
+        datos["m2"] += delta * (valor - datos["media"])
+    semana = semana_iso(fin)
+    estado["semanas"][semana] = estado["semanas"].get(semana, 0) + 1
+    return estado
+
+
+def registrar_lote(estado: Dict, indicadores: Sequence[str], raw_scores, niveles, fines) -> Dict:
+    """
+    Suma N tests completados de una vez (importaciones)
+    - raw_scores / niveles: matrices Nx8 de puntajes brutos y códigos de nivel (0=Bajo, 1=Medio, 2=Alto)
+    - fines: N marcas de tiempo en microsegundos
+    """
+    n = len(raw_scores)
+    if n == 0:
+        return estado
+    estado["total"] += n
+    for i, indicador in enumerate(indicadores):
+        datos = estado["indicadores"][indicador]
+        columna = np.asarray(raw_scores[:, i], dtype=np.int64)
+        histograma = np.bincount(columna, minlength=PUNTAJE_MAXIMO + 1).tolist()
+        datos["histograma"] = [a + b for a, b in zip(datos["histograma"], histograma)]
+        for nivel, cuenta in zip(NIVELES, np.bincount(niveles[:, i], minlength=len(NIVELES)).tolist()):
+            datos["niveles"][nivel] += cuenta
+        # Combinación de Chan: (n, media, m2) del lote con el acumulado, equivalente a Welford fila a fila
+        media_lote = float(columna.mean())
+        m2_lote = float(((columna - media_lote) ** 2).sum())
+        total = datos["n"] + n
+        delta = media_lote - datos["media"]
+        datos["m2"] += m2_lote + delta * delta * datos["n"] * n / total
+        datos["media"] += delta * n / total
+        datos["n"] = total
+    for fin, cuenta in zip(*np.unique(np.asarray(fines), return_counts=True)):
+        semana = semana_iso(int(fin))
+        estado["semanas"][semana] = estado["semanas"].get(semana, 0) + int(cuenta)
+    return estado
+
+
+def resumen(estado: Dict, indicador: Optional[str] = None) -> Dict:
+    """Vista para el endpoint: media, varianza y desviación calculadas a partir del estado"""
+    indicadores = {}
+    for nombre, datos in estado["indicadores"].items():
+        if indicador is not None and nombre != indicador:
+            continue
+        n = datos["n"]
+        varianza = datos["m2"] / (n - 1) if n > 1 else 0.0
+        indicadores[nombre] = {
+            "n": n,
+            "media": round(datos["media"], 4),
+            "varianza": round(varianza, 4),
+            "desviacion": round(math.sqrt(varianza), 4),
+            "histograma": datos["histograma"],
+            "niveles": datos["niveles"]
+        }
+    return {
+        "total_completados": estado["total"],
+        "indicadores": indicadores,
+        "semanas": dict(sorted(estado["semanas"].items()))
+    }
+
+
+def diferencias(guardado: Dict, recalculado: Dict, tolerancia: float = 1e-6) -> List[str]:
+    """Lista legible de lo que no coincide entre dos estados"""
+    cambios = []
+    if guardado["total"] != recalculado["total"]:
+        cambios.append(f"total: {guardado['total']} -> {recalculado['total']}")
+    for nombre, nuevo in recalculado["indicadores"].items():
+        viejo = guardado["indicadores"].get(nombre)
+        if viejo is None:
+            cambios.append(f"{nombre}: falta en el estado guardado")
+            continue
+        for campo in ("histograma", "niveles", "n"):
+            if viejo[campo] != nuevo[campo]:
+                cambios.append(f"{nombre}.{campo}: {viejo[campo]} -> {nuevo[campo]}")
+        for campo in ("media", "m2"):
+            if abs(viejo[campo] - nuevo[campo]) > tolerancia * max(1.0, abs(nuevo[campo])):
+                cambios.append(f"{nombre}.{campo}: {viejo[campo]:.6f} -> {nuevo[campo]:.6f}")
+    if guardado["semanas"] != recalculado["semanas"]:
+        cambios.append("semanas: los conteos semanales no coinciden")
+    return cambios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula las estadísticas de población desde el almacén")
+    parser.add_argument("--aplicar", action="store_true", help="Reemplaza el estado guardado por el recalculado")
+    args = parser.parse_args()
+
+    # Se importa aquí para que el módulo no dependa de main al usarse desde la API
+    from main import almacen, estadisticas_recalculadas
+
+    recalculado = estadisticas_recalculadas()
+    guardado = almacen.obtener_documento(CLAVE_DOCUMENTO)
+    if guardado is None:
+        print("No hay estadísticas guardadas")
+        cambios = ["estado inexistente"]
+    else:
+        cambios = diferencias(guardado, recalculado)
+        print("Sin diferencias" if not cambios else "Diferencias encontradas:")
+        for cambio in cambios:
+            print(f"  {cambio}")
+
+    if args.aplicar and cambios:
+        almacen.guardar_documento(CLAVE_DOCUMENTO, recalculado)
+        print(f"Estado reemplazado ({recalculado['total']} tests completados)")
+    almacen.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# expiracion.py - Barrido periódico de tests abandonados y códigos de recuperación vencidos
+#
+# Los almacenes mantienen un índice por vencimiento (heap en memoria, índice parcial
+# en SQLite); cada barrido solo lee lo que ya venció, en lotes para no bloquear
+# el almacén mucho tiempo seguido.
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from almacenamiento import ahora_epoch_us, epoch_a_iso
+
+logger = logging.getLogger(__name__)
+
+
+class Barrendero:
+    """
+    Ejecuta almacen.expirar cada `intervalo` segundos y lleva las métricas
+    - lote: registros por llamada; entre lotes se suelta el lock o la transacción
+    """
+
+    def __init__(self, almacen, intervalo: float, lote: int = 1000):
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self.lote = lote
+        self.barridos = 0
+        self.errores = 0
+        self.tests_expirados = 0
+        self.codigos_expirados = 0
+        self.ultimo_barrido: Optional[int] = None
+        self.ultima_duracion_ms = 0.0
+        self.max_duracion_ms = 0.0
+
+    def barrer(self, ahora: Optional[int] = None) -> Dict[str, int]:
+        ahora = ahora if ahora is not None else ahora_epoch_us()
+        comienzo = time.perf_counter()
+        total = {"tests": 0, "codigos": 0}
+        while True:
+            expirados = self.almacen.expirar(ahora, self.lote)
+            total["tests"] += expirados["tests"]
+            total["codigos"] += expirados["codigos"]
+            # El almacén en memoria aplica el límite a tests y códigos juntos y SQLite a cada
+            # tipo: con la suma por debajo del lote no queda nada vencido en ninguno de los dos
+            if expirados["tests"] + expirados["codigos"] < self.lote:
+                break
+        duracion = (time.perf_counter() - comienzo) * 1000
+        self.barridos += 1
+        self.tests_expirados += total["tests"]
+        self.codigos_expirados += total["codigos"]
+        self.ultimo_barrido = ahora
+        self.ultima_duracion_ms = duracion
+        self.max_duracion_ms = max(self.max_duracion_ms, duracion)
+        return total
+
+    async def ejecutar(self) -> None:
+        """Bucle del barrido; se lanza como tarea en el ciclo de vida de la app"""
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await asyncio.to_thread(self.barrer)
+            except Exception:
+                self.errores += 1
+                logger.exception("Error en el barrido de expiración")
+
+    def estadisticas(self) -> Dict:
+        return {
+            "intervalo_segundos": self.intervalo,
+            "barridos": self.barridos,
+            "errores": self.errores,
+            "tests_expirados": self.tests_expirados,
+            "codigos_expirados": self.codigos_expirados,
+            "ultimo_barrido": epoch_a_iso(self.ultimo_barrido),
+            "ultima_duracion_ms": round(self.ultima_duracion_ms, 3),
+            "max_duracion_ms": round(self.max_duracion_ms, 3)
+        }
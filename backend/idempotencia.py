@@ -0,0 +1,77 @@
+# idempotencia.py - Reintentos seguros del envío de respuestas
+#
+# - RespuestasIdempotentes: la primera respuesta a cada Idempotency-Key, ya serializada,
+#   en un LRU acotado con caducidad; un reintento con la misma clave la recibe tal cual
+#   sin volver a leer el almacén ni a puntuar
+# - CerrojosPorTest: un número fijo de locks de asyncio repartidos por hash del test_id,
+#   para que comprobar y completar un test sea atómico dentro del proceso sin serializar
+#   todos los envíos detrás de un lock global
+#
+# Entre workers distintos la garantía la da el almacén: completar_test solo escribe si
+# el test sigue en curso.
+
+import asyncio
+import time
+import zlib
+from typing import Dict, NamedTuple, Optional
+
+from lru import CacheLRU
+
+# Longitud máxima de la cabecera Idempotency-Key
+MAX_LONGITUD_CLAVE = 255
+
+
+class RespuestaGuardada(NamedTuple):
+    test_id: str
+    estado: int
+    cuerpo: bytes
+    vence: float
+
+
+class RespuestasIdempotentes(CacheLRU):
+    """
+    LRU de respuestas por (email, Idempotency-Key)
+    - capacidad: entradas guardadas; al llenarse se descarta la usada hace más tiempo
+    - ttl: segundos durante los que una clave se puede reintentar
+    """
+
+    def __init__(self, capacidad: int = 10000, ttl: float = 24 * 3600):
+        super().__init__(capacidad)
+        self.ttl = ttl
+        self.guardadas = 0
+
+    def _vigente(self, entrada: RespuestaGuardada) -> bool:
+        return time.monotonic() < entrada.vence
+
+    def obtener(self, email: str, clave: str) -> Optional[RespuestaGuardada]:
+        return super().obtener((email, clave))
+
+    def guardar(self, email: str, clave: str, test_id: str, estado: int, cuerpo: bytes) -> None:
+        super().guardar((email, clave), RespuestaGuardada(test_id, estado, cuerpo, time.monotonic() + self.ttl))
+        self.guardadas += 1
+
+    def _estadisticas_propias(self) -> Dict:
+        return {
+            "ttl_segundos": self.ttl,
+            "guardadas": self.guardadas,
+            "repeticiones": self.aciertos
+        }
+
+
+class CerrojosPorTest:
+    """
+    Locks repartidos por test_id (lock striping), para usar con async with
+    - franjas: número de locks; dos tests comparten lock solo si caen en la misma franja
+    - Son de asyncio y no de threading: esperar uno cede el event loop en vez de bloquearlo
+    """
+
+    def __init__(self, franjas: int = 64):
+        self._locks = [asyncio.Lock() for _ in range(franjas)]
+        self.esperas = 0
+
+    def de(self, test_id: str) -> asyncio.Lock:
+        # crc32 y no hash(): estable entre procesos y ejecuciones, útil al depurar
+        lock = self._locks[zlib.crc32(test_id.encode()) % len(self._locks)]
+        if lock.locked():
+            self.esperas += 1
+        return lock
@@ -0,0 +1,281 @@
+# importacion.py - Importación en bloque de tests CSI aplicados en papel
+#
+# El CSV lleva cabecera. Columnas obligatorias: p1 ... p40 (valores 0-4).
+# Opcionales: email (por defecto, quien sube el archivo), situacion_estresante,
+# capacidad_afrontamiento (0-4) y fecha (ISO 8601; por defecto, el momento de la importación).
+#
+# El archivo se procesa por bloques: validación, puntuación vectorizada con
+# CSIScoringService.calculate_scores_batch (con las normas vigentes al subir el archivo,
+# que quedan registradas en cada test) y escritura de todo el bloque en una transacción.
+# Las filas inválidas se saltan y quedan registradas en el estado del trabajo, que se
+# guarda en el almacén para que cualquier worker pueda consultarlo.
+
+import csv
+import io
+import itertools
+import operator
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import BinaryIO, Dict, List, Optional
+
+import numpy as np
+
+import estadisticas
+from almacenamiento import EstadoTest, RegistroTest, ahora_epoch_us, datetime_a_epoch_us, epoch_a_iso
+
+NUM_PREGUNTAS = 40
+COLUMNAS_RESPUESTA = [f"p{q}" for q in range(1, NUM_PREGUNTAS + 1)]
+FILAS_POR_BLOQUE = 10000
+# Errores por fila que se guardan en el estado (se cuentan todos)
+MAX_ERRORES = 100
+SITUACION_POR_DEFECTO = "Test aplicado en papel e importado desde CSV"
+
+
+def clave_trabajo(trabajo_id: str) -> str:
+    return f"importacion:{trabajo_id}"
+
+
+def uuids_ordenados(n: int) -> List[str]:
+    """
+    n UUID versión 7 (48 bits de milisegundos + aleatorio) en orden creciente
+    - Generados de una vez: uuid.uuid4() por fila era lo más caro de la importación
+    - Al ser crecientes, las inserciones en la clave primaria van al final del índice
+      en lugar de repartirse por todo el árbol en cada bloque
+    """
+    crudo = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    crudo[:, :6] = np.frombuffer((time.time_ns() // 1_000_000).to_bytes(8, "big")[2:], dtype=np.uint8)
+    crudo[:, 6] = (crudo[:, 6] & 0x0F) | 0x70  # versión 7
+    crudo[:, 8] = (crudo[:, 8] & 0x3F) | 0x80  # variante RFC 4122
+    texto = crudo.tobytes().hex()
+    return sorted(
+        f"{h[0:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:32]}"
+        for h in (texto[i:i + 32] for i in range(0, 32 * n, 32))
+    )
+
+
+class ImportacionCSV:
+    """
+    Un trabajo de importación
+    - Al crearlo se lee la cabecera (ValueError si faltan columnas)
+    - ejecutar() procesa el resto del archivo; pensado para correr en un hilo aparte
+    - cancelar() lo detiene al terminar el bloque en curso (estado "cancelado")
+    """
+
+    def __init__(self, archivo: BinaryIO, nombre: str, email: str, almacen, scoring_service):
+        self.trabajo_id = str(uuid.uuid4())
+        self.email = email
+        self.almacen = almacen
+        self._cancelado = threading.Event()
+        self.scoring_service = scoring_service
+        self.texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+        self.lector = csv.reader(self.texto)
+
+        cabecera = [columna.strip().lower() for columna in next(self.lector, [])]
+        faltan = [columna for columna in COLUMNAS_RESPUESTA if columna not in cabecera]
+        if faltan:
+            self.texto.close()
+            raise ValueError(f"Faltan columnas en la cabecera: {', '.join(faltan)}")
+        self.num_columnas = len(cabecera)
+        self.posiciones = [cabecera.index(columna) for columna in COLUMNAS_RESPUESTA]
+        self.extraer_respuestas = operator.itemgetter(*self.posiciones)
+        self.columna = {
+            opcional: cabecera.index(opcional) if opcional in cabecera else None
+            for opcional in ("email", "situacion_estresante", "capacidad_afrontamiento", "fecha")
+        }
+
+        self.estado = {
+            "trabajo_id": self.trabajo_id,
+            "archivo": nombre,
+            "estado": "pendiente",
+            "creado": epoch_a_iso(ahora_epoch_us()),
+            "filas_leidas": 0,
+            "filas_importadas": 0,
+            "filas_con_error": 0,
+            "errores": [],
+            "segundos": 0.0,
+            "filas_por_segundo": 0.0,
+            "detalle": None
+        }
+        self._guardar_estado()
+
+    def _guardar_estado(self) -> None:
+        self.almacen.guardar_documento(clave_trabajo(self.trabajo_id), self.estado)
+
+    def _error(self, fila: int, detalle: str) -> None:
+        self.estado["filas_con_error"] += 1
+        if len(self.estado["errores"]) < MAX_ERRORES:
+            self.estado["errores"].append({"fila": fila, "detalle": detalle})
+
+    # ---------- Validación ----------
+
+    @staticmethod
+    def _respuestas_lentas(valores) -> List[int]:
+        """Para las filas que no son 40 dígitos exactos: admite espacios y da el error concreto"""
+        respuestas = []
+        for pregunta, valor in enumerate(valores, 1):
+            valor = valor.strip()
+            if not valor:
+                raise ValueError(f"La pregunta {pregunta} no tiene respuesta")
+            try:
+                numero = int(valor)
+            except ValueError:
+                numero = -1
+            if numero < 0 or numero > 4:
+                raise ValueError(f"La respuesta de la pregunta {pregunta} debe estar entre 0 y 4")
+            respuestas.append(numero)
+        return respuestas
+
+    def _datos_fila(self, fila: List[str], ahora: int, fechas: Dict[str, int]) -> tuple:
+        """(email, situación, capacidad, fecha) de las columnas opcionales"""
+        email, situacion, capacidad, fecha = self.email, SITUACION_POR_DEFECTO, None, ahora
+        columna = self.columna
+        if columna["email"] is not None and fila[columna["email"]].strip():
+            email = fila[columna["email"]].strip()
+        if columna["situacion_estresante"] is not None and fila[columna["situacion_estresante"]].strip():
+            situacion = fila[columna["situacion_estresante"]].strip()
+            if not 10 <= len(situacion) <= 2000:
+                raise ValueError("La situación estresante debe tener entre 10 y 2000 caracteres")
+        if columna["capacidad_afrontamiento"] is not None and fila[columna["capacidad_afrontamiento"]].strip():
+            try:
+                capacidad = int(fila[columna["capacidad_afrontamiento"]])
+            except ValueError:
+                capacidad = -1
+            if capacidad < 0 or capacidad > 4:
+                raise ValueError("La capacidad de afrontamiento debe estar entre 0 y 4")
+        if columna["fecha"] is not None and fila[columna["fecha"]].strip():
+            texto = fila[columna["fecha"]].strip()
+            # En un lote en papel se repiten pocas fechas: se convierten una vez por bloque
+            fecha = fechas.get(texto)
+            if fecha is None:
+                try:
+                    fecha = fechas[texto] = datetime_a_epoch_us(datetime.fromisoformat(texto))
+                except ValueError:
+                    raise ValueError("Fecha inválida, se espera ISO 8601 (AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS)")
+        return email, situacion, capacidad, fecha
+
+    # ---------- Procesamiento ----------
+
+    def _procesar_bloque(self, filas: List[List[str]], primera: int) -> None:
+        ahora = ahora_epoch_us()
+        fechas = {}
+        datos = []
+        textos = []
+        lentas = {}  # posición en el bloque -> respuestas ya validadas
+        for numero, fila in enumerate(filas, primera):
+            if len(fila) != self.num_columnas:
+                self._error(numero, f"Se esperaban {self.num_columnas} columnas, recibidas: {len(fila)}")
+                continue
+            try:
+                extra = self._datos_fila(fila, ahora, fechas)
+                valores = self.extraer_respuestas(fila)
+                texto = "".join(valores)
+                # Camino rápido: 40 valores de un carácter, se validan en bloque con numpy
+                if len(texto) != NUM_PREGUNTAS or "" in valores:
+                    lentas[len(datos)] = self._respuestas_lentas(valores)
+                    texto = "0" * NUM_PREGUNTAS
+            except ValueError as e:
+                self._error(numero, str(e))
+                continue
+            datos.append((numero, extra))
+            textos.append(texto)
+
+        if not datos:
+            return
+        matriz = (
+            np.frombuffer("".join(textos).encode("ascii", "replace"), dtype=np.uint8)
+            .reshape(-1, NUM_PREGUNTAS)
+            .astype(np.int16) - ord("0")
+        )
+        for posicion, respuestas in lentas.items():
+            matriz[posicion] = respuestas
+        invalidas = np.flatnonzero(((matriz < 0) | (matriz > 4)).any(axis=1))
+        if len(invalidas):
+            for posicion in invalidas.tolist():
+                numero, _ = datos[posicion]
+                try:
+                    self._respuestas_lentas(textos[posicion])
+                    self._error(numero, "Las respuestas deben ser dígitos entre 0 y 4")
+                except ValueError as e:
+                    self._error(numero, str(e))
+            validas = np.ones(len(datos), dtype=bool)
+            validas[invalidas] = False
+            matriz = matriz[validas]
+            datos = [d for d, valida in zip(datos, validas.tolist()) if valida]
+            if not datos:
+                return
+
+        lote = self.scoring_service.calculate_scores_batch(matriz)
+        respuestas = matriz.astype(np.uint8).tobytes()
+        puntajes = lote["raw_scores"].astype(np.uint8).tobytes()
+        num_indicadores = len(lote["indicadores"])
+        tests = []
+        fines = np.empty(len(datos), dtype=np.int64)
+        for i, ((_, (email, situacion, capacidad, fecha)), test_id) in enumerate(zip(datos, uuids_ordenados(len(datos)))):
+            tests.append(RegistroTest(
+                test_id=test_id,
+                email=email,
+                situacion_estresante=situacion,
+                inicio=fecha,
+                estado=EstadoTest.COMPLETADO,
+                fin=fecha,
+                capacidad_afrontamiento=capacidad,
+                respuestas=respuestas[i * NUM_PREGUNTAS:(i + 1) * NUM_PREGUNTAS],
+                raw_scores=puntajes[i * num_indicadores:(i + 1) * num_indicadores],
+                normas=self.scoring_service.normas_id
+            ))
+            fines[i] = fecha
+
+        self.almacen.insertar_tests(tests)
+        self.almacen.actualizar_documento(
+            estadisticas.CLAVE_DOCUMENTO,
+            lambda estado: estadisticas.registrar_lote(
+                estado or estadisticas.estado_vacio(lote["indicadores"]),
+                lote["indicadores"], lote["raw_scores"], lote["levels"], fines
+            )
+        )
+        self.estado["filas_importadas"] += len(tests)
+
+    def ejecutar(self) -> Dict:
+        self.estado["estado"] = "en_curso"
+        self._guardar_estado()
+        comienzo = time.perf_counter()
+        try:
+            while True:
+                if self._cancelado.is_set():
+                    # Los bloques ya escritos se mantienen, como al fallar
+                    self.estado["estado"] = "cancelado"
+                    self.estado["detalle"] = "Cancelada al detener el servicio"
+                    break
+                filas = list(itertools.islice(self.lector, FILAS_POR_BLOQUE))
+                if not filas:
+                    self.estado["estado"] = "completado"
+                    break
+                self._procesar_bloque(filas, self.estado["filas_leidas"] + 1)
+                self.estado["errores"].sort(key=lambda error: error["fila"])
+                self.estado["filas_leidas"] += len(filas)
+                self._actualizar_ritmo(comienzo)
+                self._guardar_estado()
+        except Exception as e:
+            # Los bloques ya escritos se mantienen; el estado indica hasta dónde se llegó
+            self.estado["estado"] = "fallido"
+            self.estado["detalle"] = f"{type(e).__name__}: {e}"
+        finally:
+            self.texto.close()
+        self._actualizar_ritmo(comienzo)
+        self._guardar_estado()
+        return self.estado
+
+    def cancelar(self) -> None:
+        self._cancelado.set()
+
+    def _actualizar_ritmo(self, comienzo: float) -> None:
+        segundos = time.perf_counter() - comienzo
+        self.estado["segundos"] = round(segundos, 3)
+        self.estado["filas_por_segundo"] = round(self.estado["filas_leidas"] / segundos, 1) if segundos else 0.0
+
+
+def obtener_estado(almacen, trabajo_id: str) -> Optional[Dict]:
+    return almacen.obtener_documento(clave_trabajo(trabajo_id))
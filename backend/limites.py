@@ -0,0 +1,228 @@
+# limites.py - Limitación de intentos y control de admisión por clase de endpoint
+#
+# - Cubos de tokens por IP (endpoints de autenticación) y por email (/login, /registro),
+#   guardados en un LRU de tamaño fijo: la memoria no crece con el número de atacantes
+# - Peticiones simultáneas máximas por clase de endpoint: una avalancha de logins
+#   se rechaza en la entrada con 503 en lugar de ocupar CPU que necesitan las lecturas
+#
+# Los rechazos por intentos devuelven 429 y los de capacidad 503, ambos con Retry-After.
+#
+# Detrás de un proxy inverso, sin CSI_CONFIAR_PROXY=1 todos los clientes llegan con la IP
+# del proxy y comparten un solo cubo por IP: un usuario puede dejar a todos sin /login.
+# El middleware lo avisa en el log la primera vez que ve X-Forwarded-For sin esa opción.
+
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Rutas exactas de autenticación: cada intento cuesta un hash scrypt
+RUTAS_AUTENTICACION = {
+    ("POST", "/login"),
+    ("POST", "/registro"),
+    ("PUT", "/perfil/cambiar-password"),
+}
+# Rutas cuyo cuerpo JSON lleva el email del intento
+RUTAS_CON_EMAIL = {("POST", "/login"), ("POST", "/registro")}
+# Cuerpo máximo que se lee para buscar el email; uno mayor pasa sin límite por email
+MAX_CUERPO_EMAIL = 16 * 1024
+
+CLASES = ("autenticacion", "puntuacion", "lectura", "administracion")
+
+logger = logging.getLogger(__name__)
+
+
+def clase_de(metodo: str, ruta: str) -> str:
+    if (metodo, ruta) in RUTAS_AUTENTICACION:
+        return "autenticacion"
+    if ruta.startswith("/admin/"):
+        return "administracion"
+    if ruta.startswith("/test/") and metodo in ("POST", "PATCH"):
+        return "puntuacion"
+    return "lectura"
+
+
+class CubosTokens:
+    """
+    Un cubo de tokens por clave en un LRU acotado
+    - por_minuto: intentos por minuto (también es el tamaño de la ráfaga)
+    - max_claves: cubos guardados; al llenarse se descarta el usado hace más tiempo
+    """
+
+    def __init__(self, por_minuto: float, max_claves: int):
+        self.capacidad = por_minuto
+        self.tasa = por_minuto / 60.0
+        self.max_claves = max_claves
+        self._cubos: "OrderedDict[str, list]" = OrderedDict()  # {clave: [tokens, ultima_recarga]}
+        self.rechazos = 0
+        self.expulsiones = 0
+
+    def consumir(self, clave: str, ahora: float) -> float:
+        """0 si se admite el intento; si no, segundos hasta el siguiente token"""
+        cubo = self._cubos.get(clave)
+        if cubo is None:
+            cubo = [self.capacidad, ahora]
+            self._cubos[clave] = cubo
+            if len(self._cubos) > self.max_claves:
+                self._cubos.popitem(last=False)
+                self.expulsiones += 1
+        else:
+            self._cubos.move_to_end(clave)
+            cubo[0] = min(self.capacidad, cubo[0] + (ahora - cubo[1]) * self.tasa)
+            cubo[1] = ahora
+        if cubo[0] >= 1:
+            cubo[0] -= 1
+            return 0.0
+        self.rechazos += 1
+        return (1 - cubo[0]) / self.tasa
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {"claves": len(self._cubos), "rechazos": self.rechazos, "expulsiones": self.expulsiones}
+
+
+class ControlAdmision:
+    """
+    Configuración y contadores compartidos por el middleware
+    - por_ip / por_email: intentos por minuto en autenticación (0 = sin límite)
+    - concurrencia: {clase: máximo de peticiones simultáneas} (0 = sin límite)
+    - confiar_proxy: toma la IP de X-Forwarded-For (solo detrás de un proxy propio)
+    """
+
+    def __init__(
+        self,
+        por_ip: float,
+        por_email: float,
+        concurrencia: Dict[str, int],
+        max_claves: int = 100_000,
+        confiar_proxy: bool = False
+    ):
+        self.por_ip = CubosTokens(por_ip, max_claves) if por_ip > 0 else None
+        self.por_email = CubosTokens(por_email, max_claves) if por_email > 0 else None
+        self.concurrencia = {clase: concurrencia.get(clase, 0) for clase in CLASES}
+        self.en_curso = dict.fromkeys(CLASES, 0)
+        self.rechazos_concurrencia = dict.fromkeys(CLASES, 0)
+        self.confiar_proxy = confiar_proxy
+        # Intentos de autenticación con X-Forwarded-For sin confiar_proxy (probable proxy mal configurado)
+        self.reenviadas_sin_confiar = 0
+
+    def estadisticas(self) -> Dict:
+        return {
+            "confiar_proxy": self.confiar_proxy,
+            "reenviadas_sin_confiar": self.reenviadas_sin_confiar,
+            "por_ip": self.por_ip.estadisticas() if self.por_ip else None,
+            "por_email": self.por_email.estadisticas() if self.por_email else None,
+            "concurrencia": {
+                clase: {
+                    "limite": self.concurrencia[clase],
+                    "en_curso": self.en_curso[clase],
+                    "rechazos": self.rechazos_concurrencia[clase]
+                }
+                for clase in CLASES
+            }
+        }
+
+
+def respuesta_json(estado: int, detalle: str, retry_after: float):
+    cuerpo = json.dumps({"detail": detalle}, ensure_ascii=False).encode("utf-8")
+    cabeceras = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(cuerpo)).encode()),
+        (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+    ]
+
+    async def enviar(send):
+        await send({"type": "http.response.start", "status": estado, "headers": cabeceras})
+        await send({"type": "http.response.body", "body": cuerpo})
+    return enviar
+
+
+def email_del_cuerpo(cuerpo: bytes) -> Optional[str]:
+    try:
+        email = json.loads(cuerpo).get("email")
+    except (ValueError, AttributeError):
+        return None
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+class MiddlewareAdmision:
+    """Middleware ASGI: aplica ControlAdmision antes de que la petición llegue a FastAPI"""
+
+    def __init__(self, app, control: ControlAdmision):
+        self.app = app
+        self.control = control
+
+    def _ip(self, scope) -> str:
+        control = self.control
+        for nombre, valor in scope["headers"]:
+            if nombre == b"x-forwarded-for":
+                if control.confiar_proxy:
+                    return valor.decode("latin-1").split(",")[0].strip()
+                if not control.reenviadas_sin_confiar:
+                    logger.warning(
+                        "Petición con X-Forwarded-For y CSI_CONFIAR_PROXY desactivado: detrás de un "
+                        "proxy todos los clientes comparten el límite por IP del proxy"
+                    )
+                control.reenviadas_sin_confiar += 1
+                break
+        cliente = scope.get("client")
+        return cliente[0] if cliente else "desconocida"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        control = self.control
+        metodo, ruta = scope["method"], scope["path"]
+        clase = clase_de(metodo, ruta)
+
+        if clase == "autenticacion":
+            ahora = time.monotonic()
+            if control.por_ip is not None:
+                espera = control.por_ip.consumir(self._ip(scope), ahora)
+                if espera:
+                    return await respuesta_json(429, "Demasiados intentos, inténtalo de nuevo más tarde", espera)(send)
+            if control.por_email is not None and (metodo, ruta) in RUTAS_CON_EMAIL:
+                receive, cuerpo = await self._leer_cuerpo(receive)
+                email = email_del_cuerpo(cuerpo) if cuerpo is not None else None
+                if email:
+                    espera = control.por_email.consumir(email, ahora)
+                    if espera:
+                        return await respuesta_json(429, "Demasiados intentos para esta cuenta, inténtalo más tarde", espera)(send)
+
+        limite = control.concurrencia[clase]
+        if limite and control.en_curso[clase] >= limite:
+            control.rechazos_concurrencia[clase] += 1
+            return await respuesta_json(503, "Servidor ocupado, inténtalo de nuevo en unos segundos", 1)(send)
+
+        control.en_curso[clase] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            control.en_curso[clase] -= 1
+
+    @staticmethod
+    async def _leer_cuerpo(receive):
+        """
+        Lee el cuerpo para buscar el email y devuelve un receive que lo repite
+        (None como cuerpo si supera MAX_CUERPO_EMAIL)
+        """
+        mensajes = []
+        tamano = 0
+        while True:
+            mensaje = await receive()
+            mensajes.append(mensaje)
+            if mensaje["type"] != "http.request":
+                break
+            tamano += len(mensaje.get("body", b""))
+            if not mensaje.get("more_body", False) or tamano > MAX_CUERPO_EMAIL:
+                break
+        completo = mensajes[-1]["type"] == "http.request" and not mensajes[-1].get("more_body", False)
+        cuerpo = b"".join(m.get("body", b"") for m in mensajes) if completo and tamano <= MAX_CUERPO_EMAIL else None
+
+        async def repetir():
+            if mensajes:
+                return mensajes.pop(0)
+            return await receive()
+        return repetir, cuerpo
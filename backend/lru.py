@@ -0,0 +1,82 @@
+# lru.py - Caché LRU acotada y segura entre hilos, base de las cachés en memoria
+#
+# Una sola implementación del desalojo y de los contadores (aciertos, fallos,
+# expulsiones) para la caché de tokens, la de resultados y las respuestas por
+# Idempotency-Key. Cada una añade lo suyo con tres ganchos que se llaman con el lock
+# tomado: _vigente (caducidad), _al_guardar y _al_quitar (índices y tamaños).
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class CacheLRU:
+    """
+    LRU con contadores
+    - capacidad: entradas guardadas; al superarla se expulsa la usada hace más tiempo
+    - Una entrada que deja de estar vigente se quita al consultarla y cuenta como fallo
+    """
+
+    def __init__(self, capacidad: int):
+        self.capacidad = capacidad
+        self._entradas: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+
+    # ---------- Ganchos (con el lock tomado) ----------
+
+    def _vigente(self, valor) -> bool:
+        return True
+
+    def _al_guardar(self, clave, valor) -> None:
+        pass
+
+    def _al_quitar(self, clave, valor) -> None:
+        pass
+
+    # ---------- Operaciones ----------
+
+    def _quitar(self, clave) -> None:
+        self._al_quitar(clave, self._entradas.pop(clave))
+
+    def obtener(self, clave) -> Optional[Any]:
+        with self._lock:
+            valor = self._entradas.get(clave)
+            if valor is not None:
+                if self._vigente(valor):
+                    self._entradas.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                self._quitar(clave)
+                self.expulsiones += 1
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, valor) -> None:
+        with self._lock:
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = valor
+            self._al_guardar(clave, valor)
+            while len(self._entradas) > self.capacidad:
+                self._quitar(next(iter(self._entradas)))
+                self.expulsiones += 1
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "capacidad": self.capacidad,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "expulsiones": self.expulsiones,
+                **self._estadisticas_propias()
+            }
+
+    def _estadisticas_propias(self) -> Dict:
+        """Contadores propios de cada caché (con el lock tomado)"""
+        return {}
@@ -1,24 +1,104 @@
 # main.py - Backend
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, File, Header, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, Dict, List
+from pydantic import BaseModel, EmailStr, Field, WrapValidator
+from typing import Annotated, Optional, Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import numpy as np
+import asyncio
+import functools
 import jwt
 import hashlib
+import base64
+import csv
+import io
+import json
 from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+import time
 import uuid
 
+from almacenamiento import (
+    EstadoTest, RegistroTest, SIN_RESPUESTA, INICIO_MAXIMO, INICIO_MINIMO,
+    ahora_epoch_us, crear_almacen, datetime_a_epoch_us
+)
+from cache_http import RespuestaPrecalculada
+from lru import CacheLRU
+import estadisticas
+import tendencias
+from expiracion import Barrendero
+from limites import CLASES, ControlAdmision, MiddlewareAdmision
+from metricas import Metricas, MiddlewareMetricas
+from normas import NIVELES, Instrumento, Normas, RegistroNormas, separar_identificador
+from idempotencia import MAX_LONGITUD_CLAVE, CerrojosPorTest, RespuestaGuardada, RespuestasIdempotentes
+from importacion import ImportacionCSV, obtener_estado as estado_importacion
+from seguridad import PoolHashing, PoolSaturado, necesita_actualizar
+
 # ============================================
 # CONFIGURACIÓN
 # ============================================
 
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    barrido = asyncio.create_task(barrendero.ejecutar())
+    revision_normas = asyncio.create_task(registro_normas.ejecutar())
+    yield
+    barrido.cancel()
+    revision_normas.cancel()
+    # Las importaciones terminan el bloque en curso y guardan su estado ("cancelado"); las
+    # que no habían empezado lo guardan sin leer nada. Todo antes de cerrar el almacén
+    for trabajo in list(importaciones_en_curso):
+        trabajo.cancelar()
+    executor_importacion.shutdown(wait=True)
+    executor_calculo.shutdown(wait=False, cancel_futures=True)
+    executor_almacen.shutdown(wait=True, cancel_futures=True)
+    pool_hashing.cerrar()
+    almacen.cerrar()
+
+# Métricas de Prometheus en /metrics; CSI_METRICAS_MUESTREO < 1 mide solo esa fracción
+# de los tramos explícitos (las peticiones se cuentan siempre)
+metricas = Metricas(muestreo=float(os.environ.get("CSI_METRICAS_MUESTREO", "1.0")))
+
+class RespuestaJSON(JSONResponse):
+    """JSONResponse con la serialización medida como tramo"""
+    
+    def render(self, content) -> bytes:
+        with metricas.tramo("serializar_respuesta"):
+            return super().render(content)
+
 app = FastAPI(
     title="API Sistema CSI",
     description="Backend para el test CSI con autenticación completa",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=ciclo_de_vida,
+    default_response_class=RespuestaJSON
 )
 
+# Intentos por minuto en autenticación (por IP y por email) y peticiones simultáneas por
+# clase de endpoint; 0 desactiva cada límite. Se registra antes que CORS para que las
+# respuestas 429/503 también lleven las cabeceras CORS.
+# IMPORTANTE: detrás de un proxy inverso hay que poner CSI_CONFIAR_PROXY=1 (y que el proxy
+# fije X-Forwarded-For); si no, todos los clientes comparten el cubo por IP del proxy y
+# un solo usuario puede bloquear /login para todos. Sin proxy debe quedar en 0: el
+# cliente podría falsear la cabecera.
+control_admision = ControlAdmision(
+    por_ip=float(os.environ.get("CSI_LIMITE_IP_POR_MINUTO", "60")),
+    por_email=float(os.environ.get("CSI_LIMITE_EMAIL_POR_MINUTO", "10")),
+    concurrencia={
+        clase: int(os.environ.get(f"CSI_CONCURRENCIA_{clase.upper()}", por_defecto.get(clase, 0)))
+        for por_defecto in [{"autenticacion": 2 * (os.cpu_count() or 1), "administracion": 4}]
+        for clase in CLASES
+    },
+    max_claves=int(os.environ.get("CSI_LIMITE_CLAVES", "100000")),
+    confiar_proxy=os.environ.get("CSI_CONFIAR_PROXY", "0") == "1"
+)
+app.add_middleware(MiddlewareAdmision, control=control_admision)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -31,111 +111,138 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# La capa más externa: también mide las respuestas 429/503 del control de admisión.
+# CSI_METRICAS=0 la quita (para medir su coste en los benchmarks)
+if os.environ.get("CSI_METRICAS", "1") == "1":
+    app.add_middleware(MiddlewareMetricas, metricas=metricas, rutas=app.router.routes)
+
 SECRET_KEY = "tu-clave-super-secreta-cambiala-en-produccion"
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_HOURS = 24
 
 security = HTTPBearer()
 
+# Emails con acceso a los endpoints /admin, separados por comas
+ADMINISTRADORES = {e.strip().lower() for e in os.environ.get("CSI_ADMINS", "").split(",") if e.strip()}
+
+# Hash de contraseñas (scrypt) en un pool de procesos; CSI_HASH_PROCESOS=0 lo calcula en línea
+pool_hashing = PoolHashing(
+    procesos=int(os.environ.get("CSI_HASH_PROCESOS", str(os.cpu_count() or 1))),
+    max_pendientes=int(os.environ.get("CSI_HASH_MAX_PENDIENTES", "64"))
+)
+
+# Importaciones CSV en segundo plano, de una en una por worker
+executor_importacion = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CSI_IMPORTACION_HILOS", "1")),
+    thread_name_prefix="importacion"
+)
+# Trabajos enviados y sin terminar, para cancelarlos al detener el servicio
+importaciones_en_curso = set()
+
+# Los handlers son async y se ejecutan en el event loop; lo que puede tardar milisegundos
+# (puntuar y serializar lotes, leer archivos) va a este executor para no frenar al resto
+executor_calculo = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("CSI_CALCULO_HILOS", str(os.cpu_count() or 1))),
+    thread_name_prefix="calculo"
+)
+
+async def en_executor(funcion, *args):
+    """Ejecuta funcion(*args) en executor_calculo sin bloquear el event loop"""
+    return await asyncio.get_running_loop().run_in_executor(executor_calculo, funcion, *args)
+
 # ============================================
-# BASE DE DATOS SIMULADA
+# BASE DE DATOS
 # ============================================
 
-usuarios_db = {}  # {email: {datos_usuario}}
-codigos_recuperacion = {}  # {email: codigo}
-tests_db = {}  # {test_id: {datos_test}}
-respuestas_db = {}  # {test_id: {pregunta: respuesta}}
+# SQLite por defecto; CSI_ALMACEN=memoria para usar diccionarios en el proceso
+almacen = crear_almacen()
+
+# Las llamadas al almacén SQLite pueden esperar el lock de escritura de otra conexión
+# (hasta busy_timeout): van a su propio executor, uno por conexión del pool, para no
+# frenar el event loop ni ocupar los hilos de cálculo. Las del almacén en memoria son de
+# microsegundos y se hacen directamente.
+executor_almacen = ThreadPoolExecutor(
+    max_workers=almacen.tamano_pool if almacen.bloqueante else 1,
+    thread_name_prefix="almacen"
+)
+
+async def en_almacen(funcion, *args, **kwargs):
+    """Ejecuta funcion(*args, **kwargs), que usa el almacén, sin bloquear el event loop"""
+    if not almacen.bloqueante:
+        return funcion(*args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor_almacen, functools.partial(funcion, *args, **kwargs)
+    )
+
+# Expiración de tests abandonados y códigos de recuperación (TTL en crear_almacen)
+barrendero = Barrendero(almacen, intervalo=float(os.environ.get("CSI_BARRIDO_SEGUNDOS", "60")))
 
 # ============================================
 # SERVICIO DE CÁLCULO CSI
 # ============================================
 
 class CSIScoringService:
-    """Calcula e interpreta los resultados del test CSI"""
-    
-    PERCENTILE_TABLE = {
-        'REP': {0: 1, 1: 1, 2: 1, 3: 2, 4: 3, 5: 5, 6: 7, 7: 10, 8: 14, 9: 18, 10: 25, 11: 32, 12: 40, 13: 48, 14: 55, 15: 62, 16: 70, 17: 77, 18: 84, 19: 91, 20: 99},
-        'AUC': {0: 1, 1: 2, 2: 4, 3: 7, 4: 11, 5: 16, 6: 23, 7: 30, 8: 38, 9: 46, 10: 54, 11: 62, 12: 70, 13: 77, 14: 84, 15: 89, 16: 93, 17: 96, 18: 98, 19: 99, 20: 99},
-        'EEM': {0: 2, 1: 5, 2: 9, 3: 14, 4: 20, 5: 27, 6: 35, 7: 43, 8: 51, 9: 59, 10: 67, 11: 74, 12: 80, 13: 86, 14: 91, 15: 94, 16: 97, 17: 98, 18: 99, 19: 99, 20: 99},
-        'PSD': {0: 1, 1: 3, 2: 6, 3: 10, 4: 15, 5: 21, 6: 28, 7: 36, 8: 44, 9: 52, 10: 60, 11: 68, 12: 75, 13: 81, 14: 87, 15: 92, 16: 95, 17: 97, 18: 99, 19: 99, 20: 99},
-        'APS': {0: 2, 1: 4, 2: 8, 3: 13, 4: 19, 5: 26, 6: 34, 7: 42, 8: 50, 9: 58, 10: 66, 11: 73, 12: 80, 13: 86, 14: 91, 15: 94, 16: 97, 17: 98, 18: 99, 19: 99, 20: 99},
-        'REC': {0: 1, 1: 2, 2: 4, 3: 7, 4: 11, 5: 16, 6: 22, 7: 29, 8: 37, 9: 45, 10: 53, 11: 61, 12: 69, 13: 76, 14: 83, 15: 89, 16: 93, 17: 96, 18: 98, 19: 99, 20: 99},
-        'EVP': {0: 3, 1: 6, 2: 11, 3: 17, 4: 24, 5: 32, 6: 40, 7: 48, 8: 56, 9: 64, 10: 71, 11: 78, 12: 84, 13: 89, 14: 93, 15: 96, 16: 98, 17: 99, 18: 99, 19: 99, 20: 99},
-        'RES': {0: 4, 1: 8, 2: 13, 3: 19, 4: 26, 5: 34, 6: 42, 7: 50, 8: 58, 9: 66, 10: 73, 11: 79, 12: 85, 13: 90, 14: 94, 15: 96, 16: 98, 17: 99, 18: 99, 19: 99, 20: 99}
-    }
+    """
+    Calcula e interpreta los resultados del test CSI con unas normas concretas
+    - instrumento: preguntas por indicador, nombres e interpretaciones (normas/csi/instrumento.json)
+    - normas: tablas de percentiles compiladas de una población y versión (normas/csi/*.json)
+    """
     
-    INDICATOR_QUESTIONS = {
-        'REP': [1, 9, 17, 25, 33],
-        'AUC': [2, 10, 18, 26, 34],
-        'EEM': [3, 11, 19, 27, 35],
-        'PSD': [4, 12, 20, 28, 36],
-        'APS': [5, 13, 21, 29, 37],
-        'REC': [6, 14, 22, 30, 38],
-        'EVP': [7, 15, 23, 31, 39],
-        'RES': [8, 16, 24, 32, 40]
-    }
+    NUM_PREGUNTAS = 40
+    NIVELES = NIVELES
     
-    INTERPRETATIONS = {
-        'REP': {
-            'name': 'Resolución de Problemas',
-            'high': 'Se presenta un puntaje alto, lo cual sugiere una tendencia activa y constructiva hacia el manejo de situaciones estresantes. La persona tiende a enfrentar los problemas de manera directa, buscando soluciones prácticas y efectivas.'
-        },
-        'AUC': {
-            'name': 'Autocrítica',
-            'high': 'Se presenta un puntaje alto, esto puede reflejar una tendencia marcada de la persona a responsabilizarse en exceso por las dificultades que enfrenta. Puede mostrar auto señalamientos, sentimientos de culpa y percepciones negativas sobre su propio desempeño.'
-        },
-        'EEM': {
-            'name': 'Expresión Emocional',
-            'high': 'Se presenta un puntaje alto, lo cual indica que la persona tiende a liberar y comunicar sus emociones de manera frecuente. Esto puede ser adaptativo en contextos de apoyo, pero también puede volverse problemático si la expresión emocional es excesiva.'
-        },
-        'PSD': {
-            'name': 'Pensamiento Desiderativo',
-            'high': 'Se presenta un puntaje alto, esto puede sugerir que la persona recurre frecuentemente a deseos o fantasías sobre cómo le gustaría que fuera la situación. Aunque esto puede proporcionar un alivio temporal, generalmente no contribuye a resolver el problema.'
-        },
-        'APS': {
-            'name': 'Apoyo Social',
-            'high': 'Se presenta un puntaje alto, lo cual refleja una disposición a buscar y aprovechar el soporte de otras personas. Este estilo de afrontamiento suele ser beneficioso, ya que permite compartir la carga emocional y fortalecer las redes de apoyo.'
-        },
-        'REC': {
-            'name': 'Reestructuración Cognitiva',
-            'high': 'Se presenta un puntaje alto, esto indica que la persona tiende a reformular mentalmente las situaciones estresantes para verlas desde una perspectiva más positiva o manejable. Esta estrategia cognitiva suele ser adaptativa.'
-        },
-        'EVP': {
-            'name': 'Evitación de Problemas',
-            'high': 'Se presenta un puntaje alto, esto puede sugerir una inclinación a esquivar o posponer la confrontación directa de los problemas. Aunque a corto plazo esto disminuya la tensión, a largo plazo tiende a perpetuar el estrés.'
-        },
-        'RES': {
-            'name': 'Retirada Social',
-            'high': 'Se presenta un puntaje alto, esto puede reflejar que la persona tiende a aislarse y reducir el contacto con su entorno. Este patrón puede dificultar el acceso a redes de apoyo y limitar las oportunidades de recibir ayuda externa.'
-        }
-    }
+    def __init__(self, instrumento: Instrumento, normas: Normas):
+        if instrumento.num_preguntas != self.NUM_PREGUNTAS:
+            raise ValueError(f"{instrumento.codigo}: el CSI tiene {self.NUM_PREGUNTAS} preguntas, no {instrumento.num_preguntas}")
+        self.instrumento = instrumento
+        self.normas = normas
+        self.normas_id = normas.id
+        self.indicadores = instrumento.indicadores
+        # Índices compilados en normas.py: compartidos por todas las normas del instrumento
+        self.mascara = instrumento.mascara
+        self.indicador_de_pregunta = instrumento.indicador_de_pregunta
+        self._extractores = instrumento.extractores
+        self._posiciones = {indicator: i for i, indicator in enumerate(self.indicadores)}
+        self._topes = instrumento.topes
+        self._filas = np.arange(len(self.indicadores))
+        self._topes_lote = np.array(instrumento.topes)
+        # Tablas indexadas por [indicador][puntaje bruto]: percentil y nivel
+        self._percentiles = normas.percentiles
+        self._niveles = normas.niveles
+        self.tabla_percentiles = normas.tabla_percentiles
+        self.tabla_niveles = normas.tabla_niveles
     
     def calculate_scores(self, responses: Dict[int, int]) -> Dict:
         """Calcula las puntuaciones del CSI"""
+        return self.interpret_scores(self.calculate_raw_scores(responses))
+    
+    def calculate_raw_scores(self, responses: Dict[int, int]) -> Dict[str, int]:
+        """Suma las respuestas de cada indicador"""
         raw_scores = {}
-        for indicator, questions in self.INDICATOR_QUESTIONS.items():
+        for indicator, questions in self.instrumento.preguntas.items():
             raw_scores[indicator] = sum(responses.get(q, 0) for q in questions)
-        
+        return raw_scores
+    
+    def calcular_puntajes_empaquetados(self, respuestas: bytes) -> Dict[str, int]:
+        """Como calculate_raw_scores, a partir de las 40 respuestas empaquetadas en bytes"""
+        return {indicador: sum(extraer(respuestas)) for indicador, extraer in self._extractores}
+    
+    def interpret_scores(self, raw_scores: Dict[str, int]) -> Dict:
+        """Percentiles, niveles e interpretaciones a partir de los puntajes brutos"""
         percentiles = {}
-        for indicator, raw_score in raw_scores.items():
-            raw_score = min(max(raw_score, 0), 20)
-            percentiles[indicator] = self.PERCENTILE_TABLE[indicator].get(raw_score, 50)
-        
         levels = {}
-        for indicator, percentile in percentiles.items():
-            if percentile < 35:
-                levels[indicator] = 'Bajo'
-            elif percentile <= 64:
-                levels[indicator] = 'Medio'
-            else:
-                levels[indicator] = 'Alto'
+        for indicator, raw_score in raw_scores.items():
+            i = self._posiciones[indicator]
+            raw_score = min(max(raw_score, 0), self._topes[i])
+            percentiles[indicator] = self._percentiles[i][raw_score]
+            levels[indicator] = self._niveles[i][raw_score]
         
         interpretations = {}
         for indicator, level in levels.items():
             if level == 'Alto':
                 interpretations[indicator] = {
-                    'name': self.INTERPRETATIONS[indicator]['name'],
-                    'interpretation': self.INTERPRETATIONS[indicator]['high']
+                    'name': self.instrumento.nombres[indicator],
+                    'interpretation': self.instrumento.interpretaciones[indicator]
                 }
         
         return {
@@ -150,7 +257,98 @@ class CSIScoringService:
             }
         }
 
-scoring_service = CSIScoringService()
+    # ---------- Modo por lotes (vectorizado) ----------
+
+    def calculate_scores_batch(self, matriz) -> Dict:
+        """Calcula las puntuaciones de N tests a partir de una matriz Nx40 (columna j = pregunta j+1)"""
+        matriz = np.asarray(matriz, dtype=np.int32)
+        raw_scores = matriz @ self.mascara
+        indices = np.clip(raw_scores, 0, self._topes_lote)
+        return {
+            'indicadores': self.indicadores,
+            'raw_scores': raw_scores,
+            'percentiles': self.tabla_percentiles[self._filas, indices],
+            'levels': self.tabla_niveles[self._filas, indices]
+        }
+
+    def expandir_resultado(self, raw_scores, percentiles, levels) -> Dict:
+        """Convierte una fila del modo por lotes al mismo formato que calculate_scores"""
+        niveles = {ind: self.NIVELES[c] for ind, c in zip(self.indicadores, levels.tolist())}
+        return {
+            'raw_scores': dict(zip(self.indicadores, raw_scores.tolist())),
+            'percentiles': dict(zip(self.indicadores, percentiles.tolist())),
+            'levels': niveles,
+            'interpretations': {
+                ind: {
+                    'name': self.instrumento.nombres[ind],
+                    'interpretation': self.instrumento.interpretaciones[ind]
+                }
+                for ind, nivel in niveles.items() if nivel == 'Alto'
+            },
+            'summary': {
+                'high_count': sum(1 for l in niveles.values() if l == 'Alto'),
+                'medium_count': sum(1 for l in niveles.values() if l == 'Medio'),
+                'low_count': sum(1 for l in niveles.values() if l == 'Bajo')
+            }
+        }
+
+# Servicio de puntuación de cada instrumento; uno por cada archivo de normas cargado
+SERVICIOS_POR_INSTRUMENTO = {"csi": CSIScoringService}
+
+def crear_servicio(instrumento: Instrumento, normas: Normas):
+    clase = SERVICIOS_POR_INSTRUMENTO.get(instrumento.codigo)
+    if clase is None:
+        raise ValueError(f"No hay servicio de puntuación para el instrumento {instrumento.codigo}")
+    return clase(instrumento, normas)
+
+# Instrumentos y normas desde archivos de datos (normas.py). CSI_NORMAS_DIR cambia el
+# directorio y CSI_NORMAS_REVISION_SEGUNDOS cada cuánto se buscan cambios en disco
+# (0 = solo con POST /admin/normas/recargar). Las huellas de contenido van al almacén
+registro_normas = RegistroNormas(
+    os.environ.get("CSI_NORMAS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "normas")),
+    crear_servicio,
+    intervalo=float(os.environ.get("CSI_NORMAS_REVISION_SEGUNDOS", "30")),
+    almacen=almacen
+)
+
+INSTRUMENTO = "csi"
+POBLACION_POR_DEFECTO = "general"
+# Normas con las que se puntuaban los tests guardados antes de que cada test registrara las suyas
+NORMAS_HISTORICAS = "csi/general@1.0"
+
+# Indicadores y preguntas del CSI: fijan el orden de los puntajes empaquetados, así que
+# no cambian en caliente (el registro rechaza recargas que los modifiquen)
+instrumento_csi = registro_normas.instrumento(INSTRUMENTO)
+
+def normas_vigentes(poblacion: str) -> CSIScoringService:
+    """Servicio con la versión vigente de las normas de una población; 400 si no hay"""
+    servicio = registro_normas.vigente(INSTRUMENTO, poblacion)
+    if servicio is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No hay normas para la población {poblacion}; disponibles: {', '.join(registro_normas.poblaciones(INSTRUMENTO))}"
+        )
+    return servicio
+
+def normas_para_completar(test) -> CSIScoringService:
+    """
+    Normas con las que se puntúa un test al completarlo: la versión vigente de la población
+    con la que se inició (la que tenía al iniciarse si esa población ya no está activa)
+    """
+    normas_id = test.normas or NORMAS_HISTORICAS
+    poblacion = separar_identificador(normas_id)[1]
+    return (
+        registro_normas.vigente(INSTRUMENTO, poblacion)
+        or registro_normas.servicio(normas_id)
+        or normas_vigentes(POBLACION_POR_DEFECTO)
+    )
+
+def normas_de(test) -> CSIScoringService:
+    """
+    Normas con las que se puntuó un test completado; si su archivo se retiró antes de
+    un reinicio, las que le tocarían al completarlo ahora
+    """
+    return registro_normas.servicio(test.normas or NORMAS_HISTORICAS) or normas_para_completar(test)
 
 # ============================================
 # MODELOS DE DATOS
@@ -175,6 +373,7 @@ class CambioPassword(BaseModel):
 
 class IniciarTest(BaseModel):
     situacion_estresante: str = Field(..., min_length=10, max_length=2000)
+    poblacion: str = Field(POBLACION_POR_DEFECTO, max_length=100, description="Población de referencia para los percentiles (GET /test/normas)")
     
     class Config:
         json_schema_extra = {
@@ -183,30 +382,211 @@ class IniciarTest(BaseModel):
             }
         }
 
+def validar_formato_respuestas(valor, validar_diccionario):
+    """
+    Cadena y lista pasan sin recorrerse: se convierten y validan de una vez en
+    respuestas_empaquetadas; el diccionario se valida como siempre
+    """
+    if isinstance(valor, (str, list)):
+        return valor
+    return validar_diccionario(valor)
+
+RespuestasCompletas = Annotated[
+    Dict[int, int],
+    WrapValidator(validar_formato_respuestas, json_schema_input_type=Union[str, List[int], Dict[int, int]])
+]
+
 class RespuestasTest(BaseModel):
-    respuestas: Dict[int, int] = Field(..., description="Diccionario {numero_pregunta: valor (0-4)}")
+    respuestas: RespuestasCompletas = Field(
+        ...,
+        description='40 dígitos en orden de pregunta ("3120..."), lista de 40 valores (0-4) o diccionario {numero_pregunta: valor (0-4)}'
+    )
     capacidad_afrontamiento: Optional[int] = Field(None, ge=0, le=4)
     
     class Config:
         json_schema_extra = {
             "example": {
-                "respuestas": {
-                    "1": 3, "2": 1, "3": 2, "4": 0, "5": 4,
-                    "6": 2, "7": 1, "8": 0, "9": 3, "10": 2
-                },
+                "respuestas": "3120421032" * 4,
                 "capacidad_afrontamiento": 3
             }
         }
 
+class RespuestasParciales(BaseModel):
+    respuestas: Dict[int, int] = Field(default_factory=dict, max_length=40, description="Respuestas nuevas o corregidas {numero_pregunta: valor (0-4)}")
+    capacidad_afrontamiento: Optional[int] = Field(None, ge=0, le=4)
+    finalizar: bool = Field(False, description="Completa el test si ya están respondidas las 40 preguntas")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "respuestas": {"11": 3, "12": 0},
+                "finalizar": False
+            }
+        }
+
+class RespuestasLote(BaseModel):
+    respuestas: List[List[int]] = Field(..., min_length=1, max_length=10000, description="Lista de tests, cada uno con 40 valores (0-4) en orden de pregunta")
+    completo: bool = Field(False, description="Si es true, devuelve cada resultado con el mismo formato que /test/{test_id}/responder")
+    poblacion: str = Field(POBLACION_POR_DEFECTO, max_length=100, description="Población de referencia para los percentiles")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "respuestas": [[3, 1, 2, 0, 4, 2, 1, 0] * 5, [2] * 40],
+                "completo": False
+            }
+        }
+
+# ============================================
+# CACHÉ DE TOKENS VERIFICADOS
+# ============================================
+
+class CacheTokens(CacheLRU):
+    """
+    Caché LRU de tokens cuya firma ya fue verificada
+    - Clave: digest del token (no se guarda el token en claro)
+    - Valor: (email, exp); la entrada caduca cuando expira el token
+    """
+    
+    def __init__(self, capacidad: int = 10000):
+        super().__init__(capacidad)
+        self._por_email = {}  # {email: {digest}} para revocar
+        self.revocaciones = 0
+    
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+    
+    def _vigente(self, valor) -> bool:
+        return time.time() < valor[1]
+    
+    def _al_guardar(self, digest: bytes, valor) -> None:
+        self._por_email.setdefault(valor[0], set()).add(digest)
+    
+    def _al_quitar(self, digest: bytes, valor) -> None:
+        digests = self._por_email.get(valor[0])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._por_email[valor[0]]
+    
+    def obtener(self, token: str) -> Optional[str]:
+        entrada = super().obtener(self._digest(token))
+        return entrada[0] if entrada is not None else None
+    
+    def guardar(self, token: str, email: str, exp: float) -> None:
+        super().guardar(self._digest(token), (email, exp))
+    
+    def revocar(self, email: str) -> None:
+        """Elimina todas las entradas de un usuario (cambio de contraseña, cuenta desactivada)"""
+        with self._lock:
+            for digest in list(self._por_email.get(email, ())):
+                self._quitar(digest)
+                self.revocaciones += 1
+    
+    def _estadisticas_propias(self) -> Dict:
+        return {"revocaciones": self.revocaciones}
+
+cache_tokens = CacheTokens(capacidad=int(os.environ.get("CSI_CACHE_TOKENS", "10000")))
+
+# ============================================
+# CACHÉ DE RESULTADOS COMPLETADOS
+# ============================================
+
+# Los resultados de un test completado no cambian: el navegador puede guardarlos sin revalidar
+CACHE_RESULTADOS = "private, max-age=31536000, immutable"
+
+class CacheResultados(CacheLRU):
+    """
+    Caché LRU de respuestas de /test/{test_id}/resultados ya serializadas y comprimidas
+    - Clave: test_id
+    - Valor: (email del dueño, RespuestaPrecalculada); el dueño se comprueba sin leer el almacén
+    """
+    
+    def __init__(self, capacidad: int = 2000):
+        super().__init__(capacidad)
+        self.bytes = 0
+    
+    def _al_guardar(self, test_id: str, valor) -> None:
+        self.bytes += valor[1].tamano
+    
+    def _al_quitar(self, test_id: str, valor) -> None:
+        self.bytes -= valor[1].tamano
+    
+    def guardar(self, test_id: str, email: str, respuesta: RespuestaPrecalculada) -> None:
+        super().guardar(test_id, (email, respuesta))
+    
+    def _estadisticas_propias(self) -> Dict:
+        return {"bytes": self.bytes}
+
+cache_resultados = CacheResultados(capacidad=int(os.environ.get("CSI_CACHE_RESULTADOS", "2000")))
+
+# ============================================
+# REINTENTOS DE ENVÍO DE RESPUESTAS
+# ============================================
+
+# Primera respuesta de cada Idempotency-Key de /test/{test_id}/responder
+respuestas_idempotentes = RespuestasIdempotentes(
+    capacidad=int(os.environ.get("CSI_IDEMPOTENCIA_CAPACIDAD", "10000")),
+    ttl=float(os.environ.get("CSI_IDEMPOTENCIA_HORAS", "24")) * 3600
+)
+# Comprobar y completar un test es atómico por test dentro del proceso
+cerrojos_tests = CerrojosPorTest(franjas=int(os.environ.get("CSI_CERROJOS_TESTS", "64")))
+
+# ============================================
+# INDICADORES DE /metrics
+# ============================================
+
+def indicadores_cache() -> Dict:
+    valores = {}
+    for nombre, cache in (("tokens", cache_tokens), ("resultados", cache_resultados)):
+        datos = cache.estadisticas()
+        for campo in ("entradas", "aciertos", "fallos", "expulsiones"):
+            valores[(nombre, campo)] = datos[campo]
+    return valores
+
+# Lo actualiza GET /metrics antes de exponer: en SQLite leerlo es una consulta y se hace
+# con en_almacen, fuera del event loop
+registros_almacen: Dict[str, int] = {}
+
+metricas.indicador(
+    "csi_almacen_registros", "Registros en el almacén por tabla (respuestas: tests completados)", ("tabla",),
+    lambda: {(tabla,): cuenta for tabla, cuenta in registros_almacen.items()}
+)
+metricas.indicador("csi_cache", "Contadores de las cachés en memoria", ("cache", "campo"), indicadores_cache)
+metricas.indicador(
+    "csi_hash_pendientes", "Operaciones de hash en cola o en curso", (),
+    lambda: {(): pool_hashing.pendientes}
+)
+metricas.indicador(
+    "csi_admision_en_curso", "Peticiones en curso por clase de endpoint", ("clase",),
+    lambda: {(clase,): cuenta for clase, cuenta in control_admision.en_curso.items()}
+)
+
 # ============================================
 # FUNCIONES AUXILIARES
 # ============================================
 
-def encriptar_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+def servidor_ocupado() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Servidor ocupado, inténtalo de nuevo en unos segundos",
+        headers={"Retry-After": "1"}
+    )
 
-def verificar_password(password_plana: str, password_encriptada: str) -> bool:
-    return encriptar_password(password_plana) == password_encriptada
+async def encriptar_password(password: str) -> str:
+    try:
+        with metricas.tramo("hashear_password"):
+            return await pool_hashing.hashear(password)
+    except PoolSaturado:
+        raise servidor_ocupado()
+
+async def verificar_password(password_plana: str, password_encriptada: str) -> bool:
+    try:
+        with metricas.tramo("verificar_password"):
+            return await pool_hashing.verificar(password_plana, password_encriptada)
+    except PoolSaturado:
+        raise servidor_ocupado()
 
 def crear_token(email: str) -> str:
     expiracion = datetime.utcnow() + timedelta(hours=TOKEN_EXPIRE_HOURS)
@@ -214,33 +594,243 @@ def crear_token(email: str) -> str:
     return jwt.encode(datos_token, SECRET_KEY, algorithm=ALGORITHM)
 
 def verificar_token(credentials: HTTPAuthorizationCredentials) -> str:
-    try:
+    with metricas.tramo("verificar_token"):
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("email")
-        if email is None:
+        email = cache_tokens.obtener(token)
+        if email is not None:
+            return email
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email = payload.get("email")
+            if email is None:
+                raise HTTPException(status_code=401, detail="Token inválido")
+            if isinstance(payload.get("exp"), (int, float)):
+                cache_tokens.guardar(token, email, payload["exp"])
+            return email
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expirado")
+        except jwt.InvalidTokenError:
             raise HTTPException(status_code=401, detail="Token inválido")
-        return email
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expirado")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Token inválido")
+
+def verificar_admin(credentials: HTTPAuthorizationCredentials) -> str:
+    email = verificar_token(credentials)
+    if email.lower() not in ADMINISTRADORES:
+        raise HTTPException(status_code=403, detail="Se requieren permisos de administrador")
+    return email
+
+def codificar_cursor(test: RegistroTest) -> str:
+    return base64.urlsafe_b64encode(json.dumps(test.clave_orden()).encode()).decode()
+
+def decodificar_cursor(cursor: str) -> tuple:
+    try:
+        inicio, test_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        inicio = int(inicio)
+    except (ValueError, TypeError, OverflowError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    # Acotado a INTEGER de SQLite (64 bits con signo)
+    if not -2 ** 63 <= inicio < 2 ** 63:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return inicio, str(test_id)
+
+def empaquetar_respuestas(respuestas: Dict[int, int]) -> bytes:
+    """40 respuestas -> 40 bytes en orden de pregunta (las que falten cuentan como 0)"""
+    return bytes(respuestas.get(q, 0) for q in range(1, CSIScoringService.NUM_PREGUNTAS + 1))
+
+# Byte de un carácter -> valor de la respuesta; lo que no es un dígito 0-4 queda en 255
+TABLA_DIGITOS = bytes(c - 48 if 48 <= c <= 52 else 255 for c in range(256))
+
+def error_respuesta(pregunta: int) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"La respuesta de la pregunta {pregunta} debe estar entre 0 y 4"
+    )
+
+def respuestas_empaquetadas(respuestas: Union[str, List[int], Dict[int, int]]) -> bytes:
+    """
+    Valida las 40 respuestas y las devuelve empaquetadas (40 bytes en orden de pregunta)
+    - Cadena de dígitos: translate la convierte y marca los caracteres inválidos en una pasada
+    - Lista: bytes() la convierte y rechaza lo que no sea un entero 0-255 en una pasada
+      (los booleanos se rechazan antes, comprobando los tipos)
+    - Diccionario: formato original, se recorre en Python
+    """
+    if len(respuestas) != CSIScoringService.NUM_PREGUNTAS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se requieren 40 respuestas, recibidas: {len(respuestas)}"
+        )
+    
+    if isinstance(respuestas, dict):
+        for pregunta, valor in respuestas.items():
+            if valor < 0 or valor > 4:
+                raise error_respuesta(pregunta)
+        return empaquetar_respuestas(respuestas)
+    
+    if isinstance(respuestas, str):
+        codificada = respuestas.encode("utf-8")
+        # Un carácter no ASCII ocupa varios bytes: se busca en la cadena original
+        if len(codificada) != len(respuestas):
+            raise error_respuesta(next(i for i, c in enumerate(respuestas, 1) if ord(c) > 127))
+        paquete = codificada.translate(TABLA_DIGITOS)
+    else:
+        # bool es subclase de int y bytes() aceptaría true/false como 1/0: con algún
+        # booleano se va al camino que marca cada elemento (ahí solo vale type(v) is int)
+        try:
+            if bool in map(type, respuestas):
+                raise TypeError
+            paquete = bytes(respuestas)
+        except (TypeError, ValueError):
+            paquete = bytes(v if type(v) is int and 0 <= v <= 4 else 255 for v in respuestas)
+    
+    if max(paquete) > 4:
+        raise error_respuesta(next(i for i, v in enumerate(paquete, 1) if v > 4))
+    return paquete
+
+def empaquetar_puntajes(raw_scores: Dict[str, int]) -> bytes:
+    return bytes(raw_scores[indicador] for indicador in instrumento_csi.indicadores)
+
+def desempaquetar_puntajes(raw_scores: bytes) -> Dict[str, int]:
+    return dict(zip(instrumento_csi.indicadores, raw_scores))
+
+def aplicar_respuestas(respuestas: Optional[bytes], raw_scores: Optional[bytes], nuevas: Dict[int, int]) -> tuple:
+    """
+    Aplica respuestas sueltas al estado parcial de un test
+    - Mantiene la suma de cada indicador: restando la respuesta anterior si se corrige
+    - Devuelve (respuestas, raw_scores) como bytes
+    """
+    buffer = bytearray(respuestas) if respuestas else bytearray([SIN_RESPUESTA] * CSIScoringService.NUM_PREGUNTAS)
+    sumas = bytearray(raw_scores) if raw_scores else bytearray(len(instrumento_csi.indicadores))
+    for pregunta, valor in nuevas.items():
+        indicador = instrumento_csi.indicador_de_pregunta[pregunta]
+        anterior = buffer[pregunta - 1]
+        if anterior != SIN_RESPUESTA:
+            sumas[indicador] -= anterior
+        sumas[indicador] += valor
+        buffer[pregunta - 1] = valor
+    return bytes(buffer), bytes(sumas)
+
+def preguntas_pendientes(respuestas: Optional[bytes]) -> List[int]:
+    if not respuestas:
+        return list(range(1, CSIScoringService.NUM_PREGUNTAS + 1))
+    return [q + 1 for q, valor in enumerate(respuestas) if valor == SIN_RESPUESTA]
+
+def resultados_de(test: RegistroTest) -> Dict:
+    """
+    Deriva percentiles, niveles e interpretaciones de los puntajes brutos guardados,
+    con las normas que se usaron al completarlo
+    """
+    return normas_de(test).interpret_scores(desempaquetar_puntajes(test.raw_scores))
+
+def completar_test(
+    test_id: str,
+    email: str,
+    respuestas: bytes,
+    raw_scores: bytes,
+    capacidad: Optional[int],
+    resultados: Dict,
+    normas: str
+) -> bool:
+    """
+    Marca el test como completado y lo suma a las estadísticas de población y a las
+    tendencias de su usuario, todo en una transacción del almacén: un fallo a mitad no
+    deja un test completado fuera de las estadísticas
+    - normas: identificador de las normas que produjeron los resultados, se guarda con el test
+    - False si otra petición (de este u otro worker) lo completó antes: no se escribe nada
+    """
+    fin = ahora_epoch_us()
+    return almacen.completar_test(
+        test_id,
+        respuestas=respuestas,
+        raw_scores=raw_scores,
+        fin=fin,
+        capacidad_afrontamiento=capacidad,
+        normas=normas,
+        documentos={
+            estadisticas.CLAVE_DOCUMENTO: lambda estado: estadisticas.registrar(
+                estado or estadisticas.estado_vacio(instrumento_csi.indicadores),
+                resultados["raw_scores"], resultados["levels"], fin
+            ),
+            tendencias.clave(email): lambda estado: tendencias.registrar(
+                estado or tendencias.estado_vacio(instrumento_csi.indicadores),
+                test_id, fin, normas, capacidad, resultados
+            )
+        }
+    )
+
+def estadisticas_recalculadas() -> Dict:
+    """Estadísticas de población calculadas desde cero recorriendo los tests completados"""
+    estado = estadisticas.estado_vacio(instrumento_csi.indicadores)
+    for test in almacen.iterar_tests(despues_de=INICIO_MINIMO, hasta=INICIO_MAXIMO, completado=True):
+        resultados = resultados_de(test)
+        estadisticas.registrar(estado, resultados["raw_scores"], resultados["levels"], test.fin)
+    return estado
+
+def tendencias_reconstruidas(email: str) -> Dict:
+    """Tendencias de un usuario calculadas desde cero a partir de sus tests completados"""
+    estado = tendencias.estado_vacio(instrumento_csi.indicadores)
+    for test in almacen.listar_tests(email, completado=True):
+        tendencias.registrar(
+            estado, test.test_id, test.fin, normas_de(test).normas_id,
+            test.capacidad_afrontamiento, resultados_de(test)
+        )
+    return estado
+
+def actualizar_usuario(email: str, cambios: Dict) -> None:
+    """Actualiza el usuario y revoca sus tokens en caché si cambian las credenciales o el estado"""
+    almacen.actualizar_usuario(email, cambios)
+    if "password" in cambios or "activo" in cambios:
+        cache_tokens.revocar(email)
 
 # ============================================
 # ENDPOINTS DE AUTENTICACIÓN
 # ============================================
 
 @app.get("/")
-def inicio():
+async def inicio():
     return {
         "mensaje": "API del Sistema CSI funcionando",
         "version": "2.0.0",
         "modulos": ["Autenticación", "Test CSI", "Resultados"]
     }
 
+@app.get("/estado/cache-tokens")
+async def estado_cache_tokens():
+    """Contadores de la caché de tokens verificados"""
+    return cache_tokens.estadisticas()
+
+@app.get("/estado/cache-resultados")
+async def estado_cache_resultados():
+    """Contadores de la caché de resultados completados"""
+    return cache_resultados.estadisticas()
+
+@app.get("/metrics")
+async def exponer_metricas():
+    """Métricas en formato de texto de Prometheus"""
+    registros_almacen.update(await en_almacen(almacen.contar))
+    return Response(metricas.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/estado/idempotencia")
+async def estado_idempotencia():
+    """Respuestas guardadas por Idempotency-Key y esperas en los locks por test"""
+    return {**respuestas_idempotentes.estadisticas(), "esperas_cerrojos": cerrojos_tests.esperas}
+
+@app.get("/estado/limites")
+async def estado_limites():
+    """Rechazos por intentos y peticiones en curso por clase de endpoint"""
+    return control_admision.estadisticas()
+
+@app.get("/estado/normas")
+async def estado_normas():
+    """Normas cargadas y vigentes, y resultado de las recargas"""
+    return registro_normas.estadisticas()
+
+@app.get("/estado/expiracion")
+async def estado_expiracion():
+    """Registros expirados y duración de los barridos"""
+    return barrendero.estadisticas()
+
 @app.post("/registro")
-def registrar_usuario(usuario: UsuarioRegistro):
-    if usuario.email in usuarios_db:
+async def registrar_usuario(usuario: UsuarioRegistro):
+    if await en_almacen(almacen.obtener_usuario, usuario.email) is not None:
         raise HTTPException(status_code=400, detail="Este correo ya está registrado")
     
     # Concatenar nombre completo
@@ -248,29 +838,38 @@ def registrar_usuario(usuario: UsuarioRegistro):
     if usuario.segundoApellido:
         nombre_completo += f" {usuario.segundoApellido}"
         
-    usuarios_db[usuario.email] = {
+    creado = await en_almacen(almacen.crear_usuario, {
         "nombre": nombre_completo,
         "email": usuario.email,
-        "password": encriptar_password(usuario.password),
-        "teleforno": usuario.telefono,
+        "password": await encriptar_password(usuario.password),
+        "telefono": usuario.telefono,
         #"fecha_registro": datetime.now().isoformat(), no uso de momento
         "activo": True,
         "foto_perfil": None #futura implementacion
-    }
+    })
+    if not creado:
+        raise HTTPException(status_code=400, detail="Este correo ya está registrado")
     
     token = crear_token(usuario.email)
     return {"token": token, "tipo": "Bearer", "mensaje": f"Usuario {nombre_completo} registrado exitosamente"}
 
 @app.post("/login")
-def iniciar_sesion(credenciales: UsuarioLogin):
-    if credenciales.email not in usuarios_db:
+async def iniciar_sesion(credenciales: UsuarioLogin):
+    usuario = await en_almacen(almacen.obtener_usuario, credenciales.email)
+    if usuario is None:
         raise HTTPException(status_code=401, detail="Email o contraseña incorrectos")
     
-    usuario = usuarios_db[credenciales.email]
-    
-    if not verificar_password(credenciales.password, usuario["password"]):
+    if not await verificar_password(credenciales.password, usuario["password"]):
         raise HTTPException(status_code=401, detail="Email o contraseña incorrectos")
     
+    # Migrar hashes antiguos (SHA-256 sin sal) a scrypt; si el pool está lleno se reintenta en otro login
+    if necesita_actualizar(usuario["password"]):
+        try:
+            nuevo_hash = await pool_hashing.hashear(credenciales.password)
+            await en_almacen(almacen.actualizar_usuario, credenciales.email, {"password": nuevo_hash})
+        except PoolSaturado:
+            pass
+    
     if not usuario.get("activo", True):
         raise HTTPException(status_code=403, detail="Esta cuenta ha sido desactivada")
     
@@ -278,13 +877,13 @@ def iniciar_sesion(credenciales: UsuarioLogin):
     return {"token": token, "tipo": "Bearer", "mensaje": f"Bienvenido/a {usuario['nombre']}"}
 
 @app.get("/perfil")
-def obtener_perfil(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def obtener_perfil(credentials: HTTPAuthorizationCredentials = Depends(security)):
     email = verificar_token(credentials)
     
-    if email not in usuarios_db:
+    usuario = await en_almacen(almacen.obtener_usuario, email)
+    if usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    usuario = usuarios_db[email]
     return {
         "nombre": usuario["nombre"],
         "email": usuario["email"],
@@ -297,16 +896,18 @@ class ActualizarPerfil(BaseModel):
     telefono: Optional[str] = None
 
 @app.put("/perfil/actualizar")
-def actualizar_perfil(datos: ActualizarPerfil, credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def actualizar_perfil(datos: ActualizarPerfil, credentials: HTTPAuthorizationCredentials = Depends(security)):
     email = verificar_token(credentials)
     
-    if email not in usuarios_db:
+    if await en_almacen(almacen.obtener_usuario, email) is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
+    cambios = {}
     if datos.nombre:
-        usuarios_db[email]["nombre"] = datos.nombre
+        cambios["nombre"] = datos.nombre
     if datos.telefono is not None:
-        usuarios_db[email]["telefono"] = datos.telefono
+        cambios["telefono"] = datos.telefono
+    await en_almacen(actualizar_usuario, email, cambios)
     
     return {"mensaje": "Perfil actualizado correctamente"}
 
@@ -315,18 +916,17 @@ class CambiarPasswordRequest(BaseModel):
     password_nueva: str
 
 @app.put("/perfil/cambiar-password")
-def cambiar_password_perfil(datos: CambiarPasswordRequest, credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def cambiar_password_perfil(datos: CambiarPasswordRequest, credentials: HTTPAuthorizationCredentials = Depends(security)):
     email = verificar_token(credentials)
     
-    if email not in usuarios_db:
+    usuario = await en_almacen(almacen.obtener_usuario, email)
+    if usuario is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    usuario = usuarios_db[email]
-    
-    if not verificar_password(datos.password_actual, usuario["password"]):
+    if not await verificar_password(datos.password_actual, usuario["password"]):
         raise HTTPException(status_code=401, detail="Contraseña actual incorrecta")
     
-    usuarios_db[email]["password"] = encriptar_password(datos.password_nueva)
+    await en_almacen(actualizar_usuario, email, {"password": await encriptar_password(datos.password_nueva)})
     
     return {"mensaje": "Contraseña actualizada correctamente"}
 
@@ -334,8 +934,10 @@ def cambiar_password_perfil(datos: CambiarPasswordRequest, credentials: HTTPAuth
 # ENDPOINTS DEL TEST CSI
 # ============================================
 
+TEST_EXPIRADO = "El test expiró por inactividad, inicia uno nuevo"
+
 @app.post("/test/iniciar")
-def iniciar_test(datos: IniciarTest, credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def iniciar_test(datos: IniciarTest, credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Inicia un nuevo test CSI
     - Guarda la situación estresante
@@ -343,189 +945,665 @@ def iniciar_test(datos: IniciarTest, credentials: HTTPAuthorizationCredentials =
     - Retorna el ID para continuar
     """
     email = verificar_token(credentials)
+    servicio = normas_vigentes(datos.poblacion)
     
     test_id = str(uuid.uuid4())
     
-    tests_db[test_id] = {
-        "test_id": test_id,
-        "email": email,
-        "situacion_estresante": datos.situacion_estresante,
-        "fecha_inicio": datetime.now().isoformat(),
-        "estado": "en_progreso",
-        "completado": False
-    }
-    
-    respuestas_db[test_id] = {}
+    await en_almacen(almacen.crear_test, RegistroTest(
+        test_id=test_id,
+        email=email,
+        situacion_estresante=datos.situacion_estresante,
+        inicio=ahora_epoch_us(),
+        estado=EstadoTest.EN_PROGRESO,
+        normas=servicio.normas_id
+    ))
     
     return {
         "test_id": test_id,
+        "normas": servicio.normas_id,
         "mensaje": "Test iniciado exitosamente",
         "siguiente_paso": "Responder las 40 preguntas usando POST /test/{test_id}/responder"
     }
 
+def repetir_respuesta(guardada: RespuestaGuardada, test_id: str) -> Response:
+    if guardada.test_id != test_id:
+        raise HTTPException(status_code=422, detail="Esta Idempotency-Key ya se usó con otro test")
+    return Response(
+        guardada.cuerpo,
+        status_code=guardada.estado,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+def respuesta_de_test_completado(test: RegistroTest, datos: RespuestasTest, idempotency_key: Optional[str]) -> Dict:
+    """
+    Reintento que no está en la caché (otro worker, expulsado): si trae Idempotency-Key y
+    las mismas respuestas que se guardaron, recibe el resultado original desde el almacén
+    """
+    if idempotency_key is None or respuestas_empaquetadas(datos.respuestas) != test.respuestas:
+        raise HTTPException(status_code=400, detail="Este test ya fue completado")
+    return {
+        "test_id": test.test_id,
+        "mensaje": "Test completado exitosamente",
+        "normas": normas_de(test).normas_id,
+        "resultados": resultados_de(test)
+    }
+
 @app.post("/test/{test_id}/responder")
-def guardar_respuestas(
+async def guardar_respuestas(
     test_id: str, 
     datos: RespuestasTest,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    idempotency_key: Optional[str] = Header(
+        None, max_length=MAX_LONGITUD_CLAVE,
+        description="Identificador del envío; los reintentos con la misma clave reciben la respuesta original"
+    )
 ):
     """
     Guarda las respuestas del test y calcula resultados
+    - Con Idempotency-Key, un reintento recibe la respuesta original sin volver a puntuar
+    - Comprobar y completar es atómico: dos envíos simultáneos nunca escriben dos veces
     """
     email = verificar_token(credentials)
     
-    if test_id not in tests_db:
-        raise HTTPException(status_code=404, detail="Test no encontrado")
-    
-    test = tests_db[test_id]
+    if idempotency_key is not None:
+        guardada = respuestas_idempotentes.obtener(email, idempotency_key)
+        if guardada is not None:
+            return repetir_respuesta(guardada, test_id)
     
-    if test["email"] != email:
-        raise HTTPException(status_code=403, detail="No tienes permiso para este test")
-    
-    if test["completado"]:
-        raise HTTPException(status_code=400, detail="Este test ya fue completado")
-    
-    # Validar que haya 40 respuestas
-    if len(datos.respuestas) != 40:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Se requieren 40 respuestas, recibidas: {len(datos.respuestas)}"
-        )
+    async with cerrojos_tests.de(test_id):
+        # Un envío simultáneo con la misma clave pudo terminar mientras se esperaba el lock
+        if idempotency_key is not None:
+            guardada = respuestas_idempotentes.obtener(email, idempotency_key)
+            if guardada is not None:
+                return repetir_respuesta(guardada, test_id)
+        
+        test = await en_almacen(almacen.obtener_test, test_id)
+        if test is None:
+            raise HTTPException(status_code=404, detail="Test no encontrado")
+        
+        if test.email != email:
+            raise HTTPException(status_code=403, detail="No tienes permiso para este test")
+        
+        if test.completado:
+            contenido = respuesta_de_test_completado(test, datos, idempotency_key)
+        else:
+            if test.estado is EstadoTest.EXPIRADO:
+                raise HTTPException(status_code=410, detail=TEST_EXPIRADO)
+            
+            # 40 respuestas en rango 0-4, ya en el formato que se guarda
+            respuestas = respuestas_empaquetadas(datos.respuestas)
+            
+            # Calcular resultados; solo se guardan los puntajes brutos
+            servicio = normas_para_completar(test)
+            with metricas.tramo("calcular_puntajes"):
+                raw_scores = servicio.calcular_puntajes_empaquetados(respuestas)
+                resultados = servicio.interpret_scores(raw_scores)
+            
+            # Guardar respuestas y actualizar test (solo si sigue en curso)
+            if await en_almacen(
+                completar_test,
+                test_id,
+                email,
+                respuestas,
+                empaquetar_puntajes(raw_scores),
+                datos.capacidad_afrontamiento,
+                resultados,
+                servicio.normas_id
+            ):
+                contenido = {
+                    "test_id": test_id,
+                    "mensaje": "Test completado exitosamente",
+                    "normas": servicio.normas_id,
+                    "resultados": resultados
+                }
+            else:
+                # Otro worker lo completó o el barrido lo expiró entre la lectura y la escritura
+                test = await en_almacen(almacen.obtener_test, test_id)
+                if not test.completado:
+                    raise HTTPException(status_code=410, detail=TEST_EXPIRADO)
+                contenido = respuesta_de_test_completado(test, datos, idempotency_key)
+        
+        respuesta = RespuestaJSON(contenido)
+        if idempotency_key is not None:
+            respuestas_idempotentes.guardar(email, idempotency_key, test_id, respuesta.status_code, respuesta.body)
+        return respuesta
+
+@app.patch("/test/{test_id}/respuestas")
+async def guardar_respuestas_parciales(
+    test_id: str,
+    datos: RespuestasParciales,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Guarda una o varias respuestas sin completar el test
+    - Se pueden enviar en cualquier orden y corregir las ya enviadas
+    - Con finalizar=true y las 40 respondidas, calcula los resultados a partir de las sumas acumuladas
+    """
+    email = verificar_token(credentials)
     
-    # Validar que todas las respuestas estén en rango 0-4
     for pregunta, valor in datos.respuestas.items():
+        if pregunta < 1 or pregunta > CSIScoringService.NUM_PREGUNTAS:
+            raise HTTPException(status_code=400, detail=f"La pregunta {pregunta} no existe")
         if valor < 0 or valor > 4:
             raise HTTPException(
                 status_code=400,
                 detail=f"La respuesta de la pregunta {pregunta} debe estar entre 0 y 4"
             )
     
-    # Guardar respuestas
-    respuestas_db[test_id] = datos.respuestas
+    # Escritura condicional: si otra petición modificó el test entre la lectura y la
+    # escritura, se vuelve a leer y se reaplican las respuestas
+    for _ in range(5):
+        test = await en_almacen(almacen.obtener_test, test_id)
+        if test is None:
+            raise HTTPException(status_code=404, detail="Test no encontrado")
+        
+        if test.email != email:
+            raise HTTPException(status_code=403, detail="No tienes permiso para este test")
+        
+        if test.completado:
+            raise HTTPException(status_code=400, detail="Este test ya fue completado")
+        
+        if test.estado is EstadoTest.EXPIRADO:
+            raise HTTPException(status_code=410, detail=TEST_EXPIRADO)
+        
+        respuestas, raw_scores = aplicar_respuestas(test.respuestas, test.raw_scores, datos.respuestas)
+        capacidad = datos.capacidad_afrontamiento
+        if capacidad is None:
+            capacidad = test.capacidad_afrontamiento
+        if await en_almacen(almacen.guardar_parcial, test_id, test.respuestas, respuestas, raw_scores, capacidad):
+            break
+    else:
+        raise HTTPException(status_code=409, detail="El test se está modificando desde otra petición, inténtalo de nuevo")
+    
+    pendientes = preguntas_pendientes(respuestas)
     
-    # Calcular resultados
-    resultados = scoring_service.calculate_scores(datos.respuestas)
+    if not datos.finalizar:
+        return {
+            "test_id": test_id,
+            "respondidas": CSIScoringService.NUM_PREGUNTAS - len(pendientes),
+            "pendientes": pendientes,
+            "completado": False
+        }
     
-    # Actualizar test
-    tests_db[test_id].update({
-        "completado": True,
-        "fecha_completado": datetime.now().isoformat(),
-        "capacidad_afrontamiento": datos.capacidad_afrontamiento,
-        "resultados": resultados
-    })
+    if pendientes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se requieren 40 respuestas, recibidas: {CSIScoringService.NUM_PREGUNTAS - len(pendientes)}"
+        )
+    
+    servicio = normas_para_completar(test)
+    with metricas.tramo("calcular_puntajes"):
+        resultados = servicio.interpret_scores(desempaquetar_puntajes(raw_scores))
+    if not await en_almacen(completar_test, test_id, email, respuestas, raw_scores, capacidad, resultados, servicio.normas_id):
+        raise HTTPException(status_code=400, detail="Este test ya fue completado")
     
     return {
         "test_id": test_id,
         "mensaje": "Test completado exitosamente",
+        "completado": True,
+        "normas": servicio.normas_id,
         "resultados": resultados
     }
 
-@app.get("/test/{test_id}/resultados")
-def obtener_resultados(
+@app.get("/test/{test_id}/respuestas")
+async def obtener_respuestas_parciales(
     test_id: str,
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """
-    Obtiene los resultados de un test completado
+    Devuelve las respuestas guardadas de un test para retomarlo donde se quedó
     """
     email = verificar_token(credentials)
     
-    if test_id not in tests_db:
+    test = await en_almacen(almacen.obtener_test, test_id)
+    if test is None:
         raise HTTPException(status_code=404, detail="Test no encontrado")
     
-    test = tests_db[test_id]
-    
-    if test["email"] != email:
+    if test.email != email:
         raise HTTPException(status_code=403, detail="No tienes permiso para ver este test")
     
-    if not test["completado"]:
-        raise HTTPException(status_code=400, detail="El test aún no ha sido completado")
+    if test.estado is EstadoTest.EXPIRADO:
+        raise HTTPException(status_code=410, detail=TEST_EXPIRADO)
     
+    respuestas = {
+        q + 1: valor for q, valor in enumerate(test.respuestas or b"") if valor != SIN_RESPUESTA
+    }
     return {
         "test_id": test_id,
-        "situacion_estresante": test["situacion_estresante"],
-        "fecha_completado": test["fecha_completado"],
-        "capacidad_afrontamiento": test.get("capacidad_afrontamiento"),
-        "resultados": test["resultados"]
+        "completado": test.completado,
+        "respondidas": len(respuestas),
+        "pendientes": preguntas_pendientes(test.respuestas),
+        "respuestas": respuestas,
+        "capacidad_afrontamiento": test.capacidad_afrontamiento
     }
 
-@app.get("/test/historial")
-def obtener_historial(credentials: HTTPAuthorizationCredentials = Depends(security)):
+@app.get("/test/{test_id}/resultados")
+async def obtener_resultados(
+    test_id: str,
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
     """
-    Obtiene todos los tests del usuario
+    Obtiene los resultados de un test completado
+    - Se serializan una vez y se sirven desde caché con ETag (test_id y fecha de fin)
+    - Con If-None-Match del mismo ETag responde 304 sin cuerpo
     """
     email = verificar_token(credentials)
     
-    tests_usuario = [
-        {
+    entrada = cache_resultados.obtener(test_id)
+    if entrada is not None:
+        dueno, respuesta = entrada
+        if dueno != email:
+            raise HTTPException(status_code=403, detail="No tienes permiso para ver este test")
+        return respuesta.responder(request)
+    
+    test = await en_almacen(almacen.obtener_test, test_id)
+    if test is None:
+        raise HTTPException(status_code=404, detail="Test no encontrado")
+    
+    if test.email != email:
+        raise HTTPException(status_code=403, detail="No tienes permiso para ver este test")
+    
+    if not test.completado:
+        raise HTTPException(status_code=400, detail="El test aún no ha sido completado")
+    
+    with metricas.tramo("serializar_respuesta"):
+        respuesta = RespuestaPrecalculada({
             "test_id": test_id,
-            "fecha_inicio": test["fecha_inicio"],
-            "completado": test["completado"],
-            "fecha_completado": test.get("fecha_completado")
+            "situacion_estresante": test.situacion_estresante,
+            "fecha_completado": test.fecha_completado,
+            "capacidad_afrontamiento": test.capacidad_afrontamiento,
+            "normas": normas_de(test).normas_id,
+            "resultados": resultados_de(test)
+        }, CACHE_RESULTADOS, etag=f"{test_id}-{test.fin}", nivel_gzip=6, calidad_br=5)
+    cache_resultados.guardar(test_id, test.email, respuesta)
+    return respuesta.responder(request)
+
+def puntuar_lote(datos: RespuestasLote, servicio: CSIScoringService) -> Response:
+    for fila, respuestas in enumerate(datos.respuestas):
+        if len(respuestas) != 40:
+            raise HTTPException(
+                status_code=400,
+                detail=f"El test {fila} requiere 40 respuestas, recibidas: {len(respuestas)}"
+            )
+    
+    try:
+        matriz = np.array(datos.respuestas, dtype=np.int32)
+        fuera_de_rango = np.argwhere((matriz < 0) | (matriz > 4)).tolist()
+    except OverflowError:
+        # Algún valor no cabe en int32: se localiza en Python (solo en este caso de error)
+        fuera_de_rango = [
+            (fila, columna)
+            for fila, respuestas in enumerate(datos.respuestas)
+            for columna, valor in enumerate(respuestas)
+            if not 0 <= valor <= 4
+        ]
+    if fuera_de_rango:
+        fila, columna = fuera_de_rango[0]
+        raise HTTPException(
+            status_code=400,
+            detail=f"La respuesta de la pregunta {columna + 1} del test {fila} debe estar entre 0 y 4"
+        )
+    
+    lote = servicio.calculate_scores_batch(matriz)
+    
+    if datos.completo:
+        return RespuestaJSON({
+            "total_tests": len(matriz),
+            "normas": servicio.normas_id,
+            "resultados": [
+                servicio.expandir_resultado(raw, pct, niv)
+                for raw, pct, niv in zip(lote["raw_scores"], lote["percentiles"], lote["levels"])
+            ]
+        })
+    
+    return RespuestaJSON({
+        "total_tests": len(matriz),
+        "normas": servicio.normas_id,
+        "indicadores": lote["indicadores"],
+        "niveles": list(CSIScoringService.NIVELES),
+        "raw_scores": lote["raw_scores"].tolist(),
+        "percentiles": lote["percentiles"].tolist(),
+        "levels": lote["levels"].tolist()
+    })
+
+@app.post("/test/lote")
+async def calcular_lote(datos: RespuestasLote, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Calcula los resultados de muchos tests en una sola llamada
+    - Cada fila son las 40 respuestas en orden de pregunta
+    - No guarda nada, solo puntúa (recalificación de cohortes, exportaciones)
+    """
+    verificar_token(credentials)
+    servicio = normas_vigentes(datos.poblacion)
+    # Hasta 10000 tests: validación, puntuación y serialización fuera del event loop
+    return await en_executor(puntuar_lote, datos, servicio)
+
+@app.get("/test/tendencias")
+async def obtener_tendencias(
+    indicador: Optional[str] = Query(None, description="Código del indicador (REP, AUC, ...); por defecto todos"),
+    limite: Optional[int] = Query(None, ge=2, le=1000, description="Solo los últimos N tests completados"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Evolución de los indicadores a lo largo de los tests completados del usuario
+    - Por indicador: puntajes brutos, percentiles y niveles en orden de finalización
+    - deltas: diferencia de cada test con el anterior; en niveles, de códigos (0=Bajo, 1=Medio, 2=Alto)
+    - Se sirve del resumen que se amplía al completar cada test, sin volver a puntuar
+    """
+    email = verificar_token(credentials)
+    
+    if indicador is not None and indicador not in instrumento_csi.indicadores:
+        raise HTTPException(status_code=400, detail=f"Indicador desconocido: {indicador}")
+    
+    estado = await en_almacen(almacen.obtener_documento, tendencias.clave(email))
+    # Tests completados antes de existir el resumen, importados desde CSV o un envío que
+    # coincidió con una reconstrucción: se reconstruye a partir de los tests (una vez)
+    if estado is None or len(estado["tests"]) != await en_almacen(almacen.contar_tests, email, completado=True):
+        estado = await en_executor(tendencias_reconstruidas, email)
+        await en_almacen(almacen.guardar_documento, tendencias.clave(email), estado)
+    return tendencias.resumen(estado, instrumento_csi.nombres, indicador, limite)
+
+@app.get("/test/historial")
+async def obtener_historial(
+    limite: Optional[int] = Query(None, ge=1, le=200, description="Tests por página; sin límite si se omite"),
+    cursor: Optional[str] = Query(None, description="Valor de siguiente_cursor de la página anterior"),
+    completado: Optional[bool] = Query(None, description="Filtra por tests completados (true) o no completados, en progreso o expirados (false)"),
+    resumen: bool = Query(False, description="Incluye los niveles de cada test completado"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Obtiene los tests del usuario ordenados por fecha de inicio
+    - Paginación por cursor: pasar siguiente_cursor para pedir la página siguiente
+    - Con resumen=true evita una llamada a /resultados por cada test
+    """
+    email = verificar_token(credentials)
+    
+    despues_de = decodificar_cursor(cursor) if cursor else None
+    tests = await en_almacen(almacen.listar_tests, email, limite=limite, despues_de=despues_de, completado=completado)
+    
+    tests_usuario = []
+    for test in tests:
+        item = {
+            "test_id": test.test_id,
+            "fecha_inicio": test.fecha_inicio,
+            "completado": test.completado,
+            "estado": test.estado.value,
+            "fecha_completado": test.fecha_completado
         }
-        for test_id, test in tests_db.items()
-        if test["email"] == email
-    ]
+        if resumen and test.completado:
+            resultados = resultados_de(test)
+            item["resumen"] = {
+                "levels": resultados["levels"],
+                "summary": resultados["summary"]
+            }
+        tests_usuario.append(item)
+    
+    siguiente_cursor = None
+    if limite is not None and len(tests) == limite:
+        siguiente_cursor = codificar_cursor(tests[-1])
+    
+    total_tests = await en_almacen(almacen.contar_tests, email, completado=completado)
+    return {
+        "total_tests": total_tests,
+        "tests": tests_usuario,
+        "siguiente_cursor": siguiente_cursor
+    }
+
+# ============================================
+# EXPORTACIÓN (ADMINISTRACIÓN)
+# ============================================
+
+# Sin email ni situación estresante: la exportación es para investigación
+COLUMNAS_EXPORTACION = (
+    ["cursor", "test_id", "fecha_inicio", "fecha_completado", "completado", "capacidad_afrontamiento", "normas"]
+    + [f"raw_{ind}" for ind in instrumento_csi.indicadores]
+    + [f"percentil_{ind}" for ind in instrumento_csi.indicadores]
+    + [f"nivel_{ind}" for ind in instrumento_csi.indicadores]
+)
+FILAS_POR_BLOQUE = 500
+
+def fila_exportacion(test: RegistroTest) -> Dict:
+    fila = dict.fromkeys(COLUMNAS_EXPORTACION)
+    fila.update({
+        "cursor": codificar_cursor(test),
+        "test_id": test.test_id,
+        "fecha_inicio": test.fecha_inicio,
+        "fecha_completado": test.fecha_completado,
+        "completado": test.completado,
+        "capacidad_afrontamiento": test.capacidad_afrontamiento
+    })
+    if test.completado:
+        fila["normas"] = normas_de(test).normas_id
+        resultados = resultados_de(test)
+        for ind in instrumento_csi.indicadores:
+            fila[f"raw_{ind}"] = resultados["raw_scores"][ind]
+            fila[f"percentil_{ind}"] = resultados["percentiles"][ind]
+            fila[f"nivel_{ind}"] = resultados["levels"][ind]
+    return fila
+
+def bloques_de_filas(tests):
+    bloque = []
+    for test in tests:
+        bloque.append(fila_exportacion(test))
+        if len(bloque) == FILAS_POR_BLOQUE:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+def exportar_ndjson(tests):
+    for bloque in bloques_de_filas(tests):
+        yield "".join(json.dumps(fila, ensure_ascii=False) + "\n" for fila in bloque)
+
+def exportar_csv(tests):
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=COLUMNAS_EXPORTACION)
+    escritor.writeheader()
+    for bloque in bloques_de_filas(tests):
+        escritor.writerows(bloque)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.get("/admin/exportar")
+async def exportar_resultados(
+    formato: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    desde: Optional[datetime] = Query(None, description="Solo tests iniciados desde esta fecha (incluida)"),
+    hasta: Optional[datetime] = Query(None, description="Solo tests iniciados antes de esta fecha"),
+    solo_completados: bool = Query(True, description="Si es false, incluye también los tests sin completar"),
+    cursor: Optional[str] = Query(None, description="Columna cursor de la última fila recibida, para reanudar"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Exporta los resultados de todos los tests en NDJSON o CSV
+    - Se genera por bloques mientras se envía: la memoria no depende del número de tests
+    - Cada fila lleva su cursor para reanudar una descarga interrumpida
+    """
+    verificar_admin(credentials)
+    
+    inicio = INICIO_MINIMO
+    if desde is not None:
+        inicio = (datetime_a_epoch_us(desde), "")
+    if cursor:
+        inicio = max(inicio, decodificar_cursor(cursor))
+    tests = almacen.iterar_tests(
+        despues_de=inicio,
+        hasta=datetime_a_epoch_us(hasta) if hasta is not None else INICIO_MAXIMO,
+        completado=True if solo_completados else None
+    )
+    
+    if formato == "csv":
+        return StreamingResponse(exportar_csv(tests), media_type="text/csv; charset=utf-8")
+    return StreamingResponse(exportar_ndjson(tests), media_type="application/x-ndjson")
+
+@app.post("/admin/importar", status_code=202)
+async def importar_tests(
+    archivo: UploadFile = File(..., description="CSV con cabecera: p1 ... p40 y opcionalmente email, situacion_estresante, capacidad_afrontamiento, fecha"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Importa tests aplicados en papel desde un CSV
+    - Se procesa en segundo plano; el progreso se consulta en GET /admin/importar/{trabajo_id}
+    - Las filas inválidas se saltan y se informan en el estado del trabajo
+    """
+    email = verificar_admin(credentials)
+    
+    # El archivo subido se cierra al terminar la petición; el trabajo lee su propia copia
+    copia = tempfile.TemporaryFile()
+    await en_executor(shutil.copyfileobj, archivo.file, copia, 1024 * 1024)
+    copia.seek(0)
+    try:
+        trabajo = await en_executor(
+            ImportacionCSV, copia, archivo.filename or "", email, almacen, normas_vigentes(POBLACION_POR_DEFECTO)
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        copia.close()
+        raise HTTPException(status_code=400, detail=f"CSV inválido: {e}")
     
+    importaciones_en_curso.add(trabajo)
+    executor_importacion.submit(trabajo.ejecutar).add_done_callback(lambda _: importaciones_en_curso.discard(trabajo))
     return {
-        "total_tests": len(tests_usuario),
-        "tests": tests_usuario
+        "trabajo_id": trabajo.trabajo_id,
+        "estado": trabajo.estado["estado"],
+        "consultar": f"/admin/importar/{trabajo.trabajo_id}"
     }
 
+@app.get("/admin/importar/{trabajo_id}")
+async def consultar_importacion(trabajo_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Progreso, errores por fila y ritmo (filas por segundo) de una importación"""
+    verificar_admin(credentials)
+    
+    estado = await en_almacen(estado_importacion, almacen, trabajo_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+    return estado
+
+@app.post("/admin/normas/recargar")
+async def recargar_normas(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """
+    Relee los archivos de normas y publica la nueva versión sin reiniciar
+    - Si algún archivo es inválido no cambia nada y responde 400 con el error
+    - Los tests ya completados se siguen interpretando con las normas que guardaron
+    """
+    verificar_admin(credentials)
+    
+    try:
+        return await en_executor(registro_normas.recargar)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Normas inválidas, se mantienen las anteriores: {e}")
+
+@app.get("/admin/estadisticas")
+async def obtener_estadisticas(
+    indicador: Optional[str] = Query(None, description="Código del indicador (REP, AUC, ...); por defecto todos"),
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """
+    Estadísticas de población de los tests completados
+    - Por indicador: histograma de puntajes brutos (0-20), conteo de niveles, media, varianza y desviación
+    - Tests completados por semana ISO
+    - Se mantienen al completar cada test, así que la consulta no recorre los tests
+    """
+    verificar_admin(credentials)
+    
+    if indicador is not None and indicador not in instrumento_csi.indicadores:
+        raise HTTPException(status_code=400, detail=f"Indicador desconocido: {indicador}")
+    
+    estado = await en_almacen(almacen.obtener_documento, estadisticas.CLAVE_DOCUMENTO)
+    if estado is None:
+        estado = estadisticas.estado_vacio(instrumento_csi.indicadores)
+    return estadisticas.resumen(estado, indicador)
+
 # ============================================
 # INFORMACIÓN
 # ============================================
 
+ESCALA_CSI = "0 = En absoluto; 1 = Un poco; 2 = Bastante; 3 = Mucho; 4 = Totalmente"
+
+PREGUNTAS_CSI = [
+    "Luché para resolver el problema",
+    "Me culpé a mí mismo",
+    "Dejé salir mis sentimientos para reducir el estrés",
+    "Deseé que la situación nunca hubiera empezado",
+    "Encontré a alguien que escuchó mi problema",
+    "Repasé el problema una y otra vez en mi mente y al final vi las cosas de una forma diferente",
+    "No dejé que me afectara; evité pensar en ello demasiado",
+    "Pasé algún tiempo solo",
+    "Me esforcé para resolver los problemas de la situación",
+    "Me di cuenta de que era personalmente responsable de mis dificultades y me lo reproché",
+    "Expresé mis emociones, lo que sentía",
+    "Deseé que la situación no existiera o que de alguna manera terminase",
+    "Hablé con una persona de confianza",
+    "Cambié la forma en que veía la situación para que las cosas no parecieran tan malas",
+    "Traté de olvidar por completo el asunto",
+    "Evité estar con gente",
+    "Hice frente al problema",
+    "Me critiqué por lo ocurrido",
+    "Analicé mis sentimientos y simplemente los dejé salir",
+    "Deseé no encontrarme nunca más en esa situación",
+    "Dejé que mis amigos me echaran una mano",
+    "Me convencí de que las cosas no eran tan malas como parecían",
+    "Quité importancia a la situación y no quise preocuparme de más",
+    "Oculté lo que pensaba y sentía",
+    "Supe lo que había que hacer, así que doblé mis esfuerzos y traté con más ímpetu de hacer que las cosas funcionaran",
+    "Me recriminé por permitir que esto ocurriera",
+    "Dejé desahogar mis emociones",
+    "Deseé poder cambiar lo que había sucedido",
+    "Pasé algún tiempo con mis amigos",
+    "Me pregunté qué era realmente importante y descubrí que las cosas no estaban tan mal después de todo",
+    "Me comporté como si nada hubiera pasado",
+    "No dejé que nadie supiera cómo me sentía",
+    "Mantuve mi postura y luché por lo que quería",
+    "Fue un error mío, así que tenía que sufrir las consecuencias",
+    "Mis sentimientos eran abrumadores y estallaron",
+    "Me imaginé que las cosas podrían ser diferentes",
+    "Pedí consejos a un amigo o familiar que respeto",
+    "Me fijé en el lado bueno de las cosas",
+    "Evité pensar o hacer nada",
+    "Traté de ocultar mis sentimientos"
+]
+
+# El catálogo solo cambia entre despliegues: se serializa y comprime una vez al arrancar
+CACHE_CATALOGO = "public, max-age=86400, immutable"
+
+catalogo_preguntas = RespuestaPrecalculada({
+    "total_preguntas": len(PREGUNTAS_CSI),
+    "escala": ESCALA_CSI,
+    "preguntas": [{"numero": i+1, "texto": p} for i, p in enumerate(PREGUNTAS_CSI)]
+}, CACHE_CATALOGO)
+
+catalogo_indicadores = RespuestaPrecalculada({
+    "escala": ESCALA_CSI,
+    "indicadores": [
+        {
+            "codigo": indicador,
+            "nombre": instrumento_csi.nombres[indicador],
+            "preguntas": preguntas
+        }
+        for indicador, preguntas in instrumento_csi.preguntas.items()
+    ]
+}, CACHE_CATALOGO)
+
 @app.get("/test/preguntas")
-def obtener_preguntas():
+async def obtener_preguntas(request: Request):
     """
     Devuelve las 40 preguntas del test CSI
     """
-    preguntas = [
-        "Luché para resolver el problema",
-        "Me culpé a mí mismo",
-        "Dejé salir mis sentimientos para reducir el estrés",
-        "Deseé que la situación nunca hubiera empezado",
-        "Encontré a alguien que escuchó mi problema",
-        "Repasé el problema una y otra vez en mi mente y al final vi las cosas de una forma diferente",
-        "No dejé que me afectara; evité pensar en ello demasiado",
-        "Pasé algún tiempo solo",
-        "Me esforcé para resolver los problemas de la situación",
-        "Me di cuenta de que era personalmente responsable de mis dificultades y me lo reproché",
-        "Expresé mis emociones, lo que sentía",
-        "Deseé que la situación no existiera o que de alguna manera terminase",
-        "Hablé con una persona de confianza",
-        "Cambié la forma en que veía la situación para que las cosas no parecieran tan malas",
-        "Traté de olvidar por completo el asunto",
-        "Evité estar con gente",
-        "Hice frente al problema",
-        "Me critiqué por lo ocurrido",
-        "Analicé mis sentimientos y simplemente los dejé salir",
-        "Deseé no encontrarme nunca más en esa situación",
-        "Dejé que mis amigos me echaran una mano",
-        "Me convencí de que las cosas no eran tan malas como parecían",
-        "Quité importancia a la situación y no quise preocuparme de más",
-        "Oculté lo que pensaba y sentía",
-        "Supe lo que había que hacer, así que doblé mis esfuerzos y traté con más ímpetu de hacer que las cosas funcionaran",
-        "Me recriminé por permitir que esto ocurriera",
-        "Dejé desahogar mis emociones",
-        "Deseé poder cambiar lo que había sucedido",
-        "Pasé algún tiempo con mis amigos",
-        "Me pregunté qué era realmente importante y descubrí que las cosas no estaban tan mal después de todo",
-        "Me comporté como si nada hubiera pasado",
-        "No dejé que nadie supiera cómo me sentía",
-        "Mantuve mi postura y luché por lo que quería",
-        "Fue un error mío, así que tenía que sufrir las consecuencias",
-        "Mis sentimientos eran abrumadores y estallaron",
-        "Me imaginé que las cosas podrían ser diferentes",
-        "Pedí consejos a un amigo o familiar que respeto",
-        "Me fijé en el lado bueno de las cosas",
-        "Evité pensar o hacer nada",
-        "Traté de ocultar mis sentimientos"
-    ]
-    
-    return {
-        "total_preguntas": len(preguntas),
-        "escala": "0 = En absoluto; 1 = Un poco; 2 = Bastante; 3 = Mucho; 4 = Totalmente",
-        "preguntas": [{"numero": i+1, "texto": p} for i, p in enumerate(preguntas)]
-    }
\ No newline at end of file
+    return catalogo_preguntas.responder(request)
+
+@app.get("/test/indicadores")
+async def obtener_indicadores(request: Request):
+    """
+    Devuelve los 8 indicadores del CSI con su nombre y sus preguntas
+    """
+    return catalogo_indicadores.responder(request)
+
+@app.get("/test/normas")
+async def obtener_normas():
+    """
+    Instrumentos y normas disponibles; "poblacion" de POST /test/iniciar elige entre las vigentes
+    """
+    return registro_normas.listar()
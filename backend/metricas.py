@@ -0,0 +1,209 @@
+# metricas.py - Métricas del servicio en formato de texto de Prometheus (GET /metrics)
+#
+# - Middleware ASGI: histograma de latencia y conteo de códigos de estado por ruta
+#   (la plantilla de la ruta, /test/{test_id}/resultados, no la URL concreta) y
+#   peticiones en curso; las rechazadas antes del router (429/503 del control de
+#   admisión) se atribuyen a su ruta buscándola en la tabla de rutas
+# - Tramos explícitos en el camino caliente (verificar_token, hash de contraseñas,
+#   cálculo de puntajes, serialización) con muestreo opcional
+# - Indicadores que se calculan al leer /metrics (tamaño del almacén, cachés, límites)
+#
+# El coste por petición son dos lecturas del reloj, un bisect y unos accesos a
+# diccionario en el event loop; los tramos se ejecutan en corrutinas y en los hilos
+# de los executors (serializar un lote), y por eso sus histogramas llevan un lock.
+
+import random
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.routing import BaseRoute, Match
+
+# Límites superiores (segundos) de los cubos de los histogramas
+CUBOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Peticiones que no coinciden con ninguna ruta (404, escaneos): una sola serie
+SIN_RUTA = "sin_ruta"
+
+
+def escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def etiquetas_texto(nombres: Tuple[str, ...], valores: Tuple) -> str:
+    if not nombres:
+        return ""
+    return "{" + ",".join(f'{nombre}="{escapar(valor)}"' for nombre, valor in zip(nombres, valores)) + "}"
+
+
+def numero(valor: float) -> str:
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Histograma:
+    """
+    Histograma con etiquetas; cada serie es [cuenta por cubo..., +Inf, suma]
+    (las cuentas se guardan sin acumular y se acumulan al exponer)
+    """
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...], cubos=CUBOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.cubos = cubos
+        self.series: Dict[Tuple, List[float]] = {}
+
+    def observar(self, valores: Tuple, segundos: float) -> None:
+        serie = self.series.get(valores)
+        if serie is None:
+            serie = self.series[valores] = [0] * (len(self.cubos) + 1) + [0.0]
+        serie[bisect_left(self.cubos, segundos)] += 1
+        serie[-1] += segundos
+
+    def exponer(self) -> List[str]:
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        for valores, serie in sorted(self.series.items()):
+            acumulado = 0
+            for limite, cuenta in zip(self.cubos + ("+Inf",), serie):
+                acumulado += cuenta
+                le = limite if isinstance(limite, str) else numero(limite)
+                lineas.append(
+                    f"{self.nombre}_bucket{etiquetas_texto(self.etiquetas + ('le',), valores + (le,))} {acumulado}"
+                )
+            base = etiquetas_texto(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}_sum{base} {numero(serie[-1])}")
+            lineas.append(f"{self.nombre}_count{base} {acumulado}")
+        return lineas
+
+
+class Tramo:
+    """Context manager de un tramo medido; uno por uso, así sirve igual en hilos y en corrutinas"""
+
+    __slots__ = ("metricas", "nombre", "inicio")
+
+    def __init__(self, metricas: "Metricas", nombre: str):
+        self.metricas = metricas
+        self.nombre = nombre
+        self.inicio = None
+
+    def __enter__(self):
+        muestreo = self.metricas.muestreo
+        if muestreo >= 1.0 or (muestreo > 0 and random.random() < muestreo):
+            self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.inicio is not None:
+            duracion = time.perf_counter() - self.inicio
+            with self.metricas._lock:
+                self.metricas.tramos.observar((self.nombre,), duracion)
+        return False
+
+
+class Metricas:
+    """
+    Registro de métricas del proceso
+    - muestreo: fracción de tramos explícitos que se miden (1.0 = todos); no afecta a las
+      métricas de peticiones, que siempre se cuentan
+    """
+
+    def __init__(self, muestreo: float = 1.0):
+        self.muestreo = muestreo
+        self._lock = threading.Lock()
+        self.latencias = Histograma(
+            "csi_http_duracion_segundos", "Latencia de las peticiones HTTP por ruta", ("metodo", "ruta")
+        )
+        self.tramos = Histograma(
+            "csi_tramo_duracion_segundos", "Duración de tramos del camino caliente (muestreados)", ("tramo",)
+        )
+        self.respuestas: Dict[Tuple[str, str, int], int] = {}
+        self.en_curso = 0
+        self._indicadores: List[Tuple[str, str, Tuple[str, ...], Callable[[], Dict]]] = []
+
+    def tramo(self, nombre: str) -> Tramo:
+        """with metricas.tramo("verificar_token"): ..."""
+        return Tramo(self, nombre)
+
+    def indicador(self, nombre: str, ayuda: str, etiquetas: Tuple[str, ...], funcion: Callable[[], Dict]) -> None:
+        """
+        Registra un gauge que se calcula al exponer
+        - funcion() devuelve {tupla de valores de etiquetas: valor}
+        """
+        self._indicadores.append((nombre, ayuda, etiquetas, funcion))
+
+    def registrar_peticion(self, metodo: str, ruta: str, estado: int, segundos: float) -> None:
+        self.latencias.observar((metodo, ruta), segundos)
+        clave = (metodo, ruta, estado)
+        self.respuestas[clave] = self.respuestas.get(clave, 0) + 1
+
+    def exponer(self) -> str:
+        lineas = [
+            "# HELP csi_http_respuestas_total Respuestas HTTP por ruta y código de estado",
+            "# TYPE csi_http_respuestas_total counter",
+        ]
+        for (metodo, ruta, estado), cuenta in sorted(self.respuestas.items()):
+            lineas.append(
+                f"csi_http_respuestas_total{etiquetas_texto(('metodo', 'ruta', 'estado'), (metodo, ruta, estado))} {cuenta}"
+            )
+        lineas += [
+            "# HELP csi_http_en_curso Peticiones HTTP en curso",
+            "# TYPE csi_http_en_curso gauge",
+            f"csi_http_en_curso {self.en_curso}",
+        ]
+        lineas += self.latencias.exponer()
+        with self._lock:
+            lineas += self.tramos.exponer()
+        for nombre, ayuda, etiquetas, funcion in self._indicadores:
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+            for valores, valor in sorted(funcion().items()):
+                lineas.append(f"{nombre}{etiquetas_texto(etiquetas, valores)} {numero(valor)}")
+        return "\n".join(lineas) + "\n"
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI: latencia, código de estado y peticiones en curso por ruta
+    - rutas: tabla de rutas de la aplicación (app.router.routes), para atribuir las
+      respuestas que no pasaron por el router
+    """
+
+    def __init__(self, app, metricas: Metricas, rutas: Optional[Sequence[BaseRoute]] = None):
+        self.app = app
+        self.metricas = metricas
+        self.rutas = rutas
+
+    def _buscar_ruta(self, scope) -> Optional[BaseRoute]:
+        # Solo para peticiones sin ruta en el scope: rechazos del control de admisión y 404
+        for ruta in self.rutas or ():
+            coincidencia, _ = ruta.matches(scope)
+            if coincidencia is Match.FULL:
+                return ruta
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metricas = self.metricas
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        metricas.en_curso += 1
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metricas.en_curso -= 1
+            # El router de Starlette deja la ruta elegida en el scope
+            ruta = scope.get("route") or self._buscar_ruta(scope)
+            metricas.registrar_peticion(
+                scope["method"],
+                getattr(ruta, "path", SIN_RUTA),
+                estado,
+                time.perf_counter() - inicio
+            )
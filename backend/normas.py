@@ -0,0 +1,373 @@
+# normas.py - Instrumentos y normas (baremos) cargados desde archivos de datos
+#
+# Directorio CSI_NORMAS_DIR (por defecto backend/normas/):
+#   activas.json                              {"<instrumento>/<poblacion>": "<version>"}
+#   <instrumento>/instrumento.json            preguntas de cada indicador, nombres,
+#                                             interpretaciones y cortes de nivel
+#   <instrumento>/<poblacion>@<version>.json  percentil de cada puntaje bruto por indicador
+#
+# Al cargar, cada instrumento se compila en un índice pregunta -> indicador y cada archivo
+# de normas en tablas planas indexadas por puntaje bruto (listas para un test, matrices de
+# numpy para lotes). El identificador "csi/general@1.0" es lo que se guarda en cada test.
+#
+# RegistroNormas publica todo lo compilado como una instantánea inmutable que se sustituye
+# entera al recargar: quien ya la leyó termina con ella y las peticiones siguientes ven la
+# nueva, sin locks en la lectura. Las versiones que desaparecen de disco se conservan en
+# memoria para seguir interpretando los tests que se puntuaron con ellas; por lo mismo,
+# una recarga que cambie las tablas de una versión ya cargada se rechaza entera.
+#
+# Esa comprobación vale también entre reinicios y entre workers: la huella de cada
+# versión (percentiles, niveles, nombres e interpretaciones de sus indicadores) se guarda
+# en el almacén la primera vez que se carga, y una carga posterior con otro contenido
+# para el mismo identificador falla, también al arrancar.
+
+import asyncio
+import hashlib
+import json
+import logging
+import operator
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NIVELES = ('Bajo', 'Medio', 'Alto')
+ARCHIVO_ACTIVAS = "activas.json"
+ARCHIVO_INSTRUMENTO = "instrumento.json"
+# Documento del almacén con la huella de cada versión de normas cargada alguna vez
+CLAVE_HUELLAS = "normas_huellas"
+
+
+def identificador(instrumento: str, poblacion: str, version: str) -> str:
+    return f"{instrumento}/{poblacion}@{version}"
+
+
+def separar_identificador(normas_id: str) -> Tuple[str, str, str]:
+    """"csi/general@1.0" -> ("csi", "general", "1.0")"""
+    clave, _, version = normas_id.partition("@")
+    instrumento, _, poblacion = clave.partition("/")
+    if not instrumento or not poblacion or not version:
+        raise ValueError(f"Identificador de normas inválido: {normas_id}")
+    return instrumento, poblacion, version
+
+
+def leer_json(ruta: str):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Instrumento:
+    """Definición compilada de un instrumento (instrumento.json)"""
+
+    def __init__(self, codigo: str, datos: Dict):
+        self.codigo = codigo
+        self.nombre = datos.get("nombre", codigo)
+        self.num_preguntas = int(datos["preguntas"])
+        self.valor_maximo = int(datos["valor_maximo"])
+        self.medio_desde = int(datos["niveles"]["medio_desde"])
+        self.alto_desde = int(datos["niveles"]["alto_desde"])
+
+        definiciones = datos["indicadores"]
+        self.indicadores: List[str] = list(definiciones)
+        self.preguntas: Dict[str, List[int]] = {ind: list(d["preguntas"]) for ind, d in definiciones.items()}
+        self.nombres: Dict[str, str] = {ind: d["nombre"] for ind, d in definiciones.items()}
+        self.interpretaciones: Dict[str, str] = {ind: d["interpretacion_alta"] for ind, d in definiciones.items()}
+        # Puntaje bruto máximo de cada indicador (tope de las tablas de percentiles)
+        self.topes: List[int] = [len(self.preguntas[ind]) * self.valor_maximo for ind in self.indicadores]
+
+        # Pregunta -> índice de indicador (posición 0 sin uso); cada pregunta en exactamente uno
+        self.indicador_de_pregunta: List[Optional[int]] = [None] * (self.num_preguntas + 1)
+        for i, ind in enumerate(self.indicadores):
+            for q in self.preguntas[ind]:
+                if not 1 <= q <= self.num_preguntas:
+                    raise ValueError(f"{codigo}: la pregunta {q} de {ind} no existe")
+                if self.indicador_de_pregunta[q] is not None:
+                    raise ValueError(f"{codigo}: la pregunta {q} está en más de un indicador")
+                self.indicador_de_pregunta[q] = i
+        sin_indicador = [q for q in range(1, self.num_preguntas + 1) if self.indicador_de_pregunta[q] is None]
+        if sin_indicador:
+            raise ValueError(f"{codigo}: preguntas sin indicador: {sin_indicador}")
+
+        # Máscara preguntas x indicadores: mascara[p, i] = 1 si la pregunta p+1 pertenece al indicador i
+        self.mascara = np.zeros((self.num_preguntas, len(self.indicadores)), dtype=np.int32)
+        for q in range(1, self.num_preguntas + 1):
+            self.mascara[q - 1, self.indicador_de_pregunta[q]] = 1
+        # Indicador -> itemgetter de las posiciones de sus preguntas en las respuestas empaquetadas
+        self.extractores = [
+            (ind, operator.itemgetter(*[q - 1 for q in self.preguntas[ind]]))
+            for ind in self.indicadores
+        ]
+
+    def nivel(self, percentil: int) -> int:
+        """Código de nivel (índice en NIVELES) de un percentil"""
+        if percentil < self.medio_desde:
+            return 0
+        if percentil < self.alto_desde:
+            return 1
+        return 2
+
+
+class Normas:
+    """Tablas compiladas de un archivo de normas para un instrumento"""
+
+    def __init__(self, normas_id: str, instrumento: Instrumento, datos: Dict, archivo: str):
+        self.id = normas_id
+        self.instrumento, self.poblacion, self.version = separar_identificador(normas_id)
+        self.descripcion = datos.get("descripcion", "")
+        self.archivo = archivo
+
+        tablas = datos["percentiles"]
+        if set(tablas) != set(instrumento.indicadores):
+            raise ValueError(f"{normas_id}: los indicadores no coinciden con los de {instrumento.codigo}")
+        # Por índice de indicador y puntaje bruto: percentil y nivel
+        self.percentiles: List[List[int]] = []
+        for ind, tope in zip(instrumento.indicadores, instrumento.topes):
+            fila = [int(p) for p in tablas[ind]]
+            if len(fila) != tope + 1:
+                raise ValueError(f"{normas_id}: {ind} necesita {tope + 1} percentiles (0-{tope}), tiene {len(fila)}")
+            if any(p < 0 or p > 100 for p in fila):
+                raise ValueError(f"{normas_id}: {ind} tiene percentiles fuera de 0-100")
+            self.percentiles.append(fila)
+        self.niveles: List[List[str]] = [
+            [NIVELES[instrumento.nivel(p)] for p in fila] for fila in self.percentiles
+        ]
+
+        # Matrices indicadores x (tope + 1) para el modo por lotes; las filas más cortas
+        # se rellenan con su último valor (no se llega a leer: los índices se recortan al tope)
+        ancho = max(instrumento.topes) + 1
+        self.tabla_percentiles = np.array(
+            [fila + fila[-1:] * (ancho - len(fila)) for fila in self.percentiles], dtype=np.int16
+        )
+        self.tabla_niveles = np.vectorize(instrumento.nivel, otypes=[np.int8])(self.tabla_percentiles)
+
+        # Todo lo que aparece en los resultados de un test puntuado con estas normas
+        contenido = {
+            "percentiles": dict(zip(instrumento.indicadores, self.percentiles)),
+            "niveles": dict(zip(instrumento.indicadores, self.niveles)),
+            "nombres": instrumento.nombres,
+            "interpretaciones": instrumento.interpretaciones
+        }
+        self.huella = hashlib.sha256(json.dumps(contenido, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class Catalogo(NamedTuple):
+    """Instantánea inmutable del registro; se sustituye entera al recargar"""
+    instrumentos: Dict[str, Instrumento]
+    servicios: Dict[str, object]       # normas_id -> servicio de puntuación
+    vigentes: Dict[str, str]           # "instrumento/poblacion" -> normas_id
+    firma: Tuple[Tuple[str, int], ...]  # (ruta, mtime) de los archivos leídos
+    cargado: float
+
+
+class RegistroNormas:
+    """
+    Instrumentos y normas compilados, con recarga en caliente
+    - crear_servicio(instrumento, normas): construye el servicio de puntuación de unas
+      normas; el servicio debe exponerlas en su atributo .normas
+    - intervalo: segundos entre comprobaciones de cambios en disco en ejecutar()
+    - almacen: donde se guardan las huellas (actualizar_documento); sin él la comprobación
+      de contenido solo cubre lo cargado en este proceso
+    """
+
+    def __init__(
+        self,
+        directorio: str,
+        crear_servicio: Callable[[Instrumento, Normas], object],
+        intervalo: float = 30,
+        almacen=None
+    ):
+        self.directorio = directorio
+        self.crear_servicio = crear_servicio
+        self.intervalo = intervalo
+        self.almacen = almacen
+        self._lock = threading.Lock()
+        self.recargas = 0
+        self.errores = 0
+        self.ultimo_error: Optional[str] = None
+        self._firma_fallida = None
+        # Al arrancar un error de carga es fatal: sin normas no se puede puntuar
+        self.catalogo = self._cargar(anterior=None)
+
+    # ---------- Lectura (sin locks: una sola lectura del atributo) ----------
+
+    def servicio(self, normas_id: str):
+        """Servicio de unas normas concretas, o None si no están cargadas"""
+        return self.catalogo.servicios.get(normas_id)
+
+    def vigente(self, instrumento: str, poblacion: str):
+        """Servicio de la versión vigente para una población, o None si no hay"""
+        catalogo = self.catalogo
+        normas_id = catalogo.vigentes.get(f"{instrumento}/{poblacion}")
+        return catalogo.servicios[normas_id] if normas_id is not None else None
+
+    def instrumento(self, codigo: str) -> Instrumento:
+        return self.catalogo.instrumentos[codigo]
+
+    def poblaciones(self, instrumento: str) -> List[str]:
+        prefijo = f"{instrumento}/"
+        return sorted(clave[len(prefijo):] for clave in self.catalogo.vigentes if clave.startswith(prefijo))
+
+    def listar(self) -> Dict:
+        catalogo = self.catalogo
+        vigentes = set(catalogo.vigentes.values())
+        return {
+            "instrumentos": [
+                {"codigo": ins.codigo, "nombre": ins.nombre, "indicadores": ins.indicadores}
+                for ins in catalogo.instrumentos.values()
+            ],
+            "normas": [
+                {
+                    "id": servicio.normas.id,
+                    "instrumento": servicio.normas.instrumento,
+                    "poblacion": servicio.normas.poblacion,
+                    "version": servicio.normas.version,
+                    "descripcion": servicio.normas.descripcion,
+                    "vigente": servicio.normas.id in vigentes
+                }
+                for servicio in catalogo.servicios.values()
+            ]
+        }
+
+    # ---------- Carga y recarga ----------
+
+    def _archivos(self) -> List[str]:
+        rutas = []
+        for raiz, _, nombres in os.walk(self.directorio):
+            rutas += [os.path.join(raiz, nombre) for nombre in nombres if nombre.endswith(".json")]
+        return sorted(rutas)
+
+    def _firma(self) -> Tuple[Tuple[str, int], ...]:
+        firma = []
+        for ruta in self._archivos():
+            try:
+                firma.append((ruta, os.stat(ruta).st_mtime_ns))
+            except FileNotFoundError:
+                pass
+        return tuple(firma)
+
+    def _cargar(self, anterior: Optional[Catalogo]) -> Catalogo:
+        """Lee y compila todo el directorio; cualquier error anula la carga completa"""
+        firma = self._firma()
+        instrumentos: Dict[str, Instrumento] = {}
+        servicios: Dict[str, object] = {}
+        for ruta, _ in firma:
+            relativa = os.path.relpath(ruta, self.directorio).replace(os.sep, "/")
+            partes = relativa.split("/")
+            if len(partes) != 2:
+                continue
+            codigo, archivo = partes
+            if codigo not in instrumentos:
+                try:
+                    instrumentos[codigo] = Instrumento(codigo, leer_json(os.path.join(self.directorio, codigo, ARCHIVO_INSTRUMENTO)))
+                except (KeyError, TypeError) as e:
+                    raise ValueError(f"{codigo}/{ARCHIVO_INSTRUMENTO}: falta o sobra un campo ({e})") from e
+                previo = anterior.instrumentos.get(codigo) if anterior is not None else None
+                # Los puntajes guardados dependen del orden de indicadores y de sus preguntas
+                if previo is not None and list(previo.preguntas.items()) != list(instrumentos[codigo].preguntas.items()):
+                    raise ValueError(f"{codigo}: cambiar indicadores o preguntas requiere reiniciar el servicio")
+            if archivo == ARCHIVO_INSTRUMENTO:
+                continue
+            normas_id = f"{codigo}/{archivo[:-len('.json')]}"
+            try:
+                normas = Normas(normas_id, instrumentos[codigo], leer_json(ruta), relativa)
+            except (KeyError, TypeError) as e:
+                raise ValueError(f"{relativa}: falta o sobra un campo ({e})") from e
+            previo = anterior.servicios.get(normas_id) if anterior is not None else None
+            # Los tests guardados solo llevan el identificador: unas normas ya cargadas no
+            # pueden cambiar sus tablas, cortes ni textos sin una versión nueva
+            if previo is not None and previo.normas.huella != normas.huella:
+                raise ValueError(f"{relativa}: {normas_id} ya está cargado con otro contenido; publícalo como una versión nueva")
+            servicios[normas_id] = self.crear_servicio(instrumentos[codigo], normas)
+
+        # Versiones ya cargadas que ya no están en disco: los tests que las usaron las siguen necesitando
+        if anterior is not None:
+            for normas_id, servicio in anterior.servicios.items():
+                if normas_id not in servicios:
+                    servicios[normas_id] = servicio
+                    instrumentos.setdefault(servicio.normas.instrumento, anterior.instrumentos[servicio.normas.instrumento])
+
+        vigentes: Dict[str, str] = {}
+        for clave, version in leer_json(os.path.join(self.directorio, ARCHIVO_ACTIVAS)).items():
+            instrumento, _, poblacion = clave.partition("/")
+            normas_id = identificador(instrumento, poblacion, version)
+            if normas_id not in servicios:
+                raise ValueError(f"{ARCHIVO_ACTIVAS}: {normas_id} no está cargado")
+            vigentes[clave] = normas_id
+        if self.almacen is not None:
+            self._registrar_huellas({normas_id: servicio.normas.huella for normas_id, servicio in servicios.items()})
+        return Catalogo(instrumentos, servicios, vigentes, firma, time.time())
+
+    def _registrar_huellas(self, huellas: Dict[str, str]) -> None:
+        """Compara con las huellas guardadas y añade las nuevas, en una sola actualización atómica"""
+        def fusionar(guardadas: Optional[Dict]) -> Dict:
+            guardadas = dict(guardadas or {})
+            distintas = sorted(normas_id for normas_id, huella in huellas.items() if guardadas.get(normas_id, huella) != huella)
+            if distintas:
+                raise ValueError(
+                    f"{', '.join(distintas)}: ya se cargó antes con otro contenido; publícalo como una versión nueva"
+                )
+            guardadas.update(huellas)
+            return guardadas
+
+        self.almacen.actualizar_documento(CLAVE_HUELLAS, fusionar)
+
+    def recargar(self) -> Dict:
+        """
+        Relee el directorio y publica el nuevo catálogo de una vez
+        - Si algo falla se mantiene el catálogo anterior y se lanza ValueError
+        """
+        with self._lock:
+            try:
+                nuevo = self._cargar(anterior=self.catalogo)
+            except (OSError, ValueError) as e:
+                self.errores += 1
+                self.ultimo_error = str(e)
+                raise ValueError(str(e)) from e
+            self.catalogo = nuevo
+            self.recargas += 1
+            self.ultimo_error = None
+        return self.estadisticas()
+
+    def revisar(self) -> bool:
+        """Recarga si cambió algún archivo; True si publicó un catálogo nuevo"""
+        firma = self._firma()
+        if firma == self.catalogo.firma or firma == self._firma_fallida:
+            return False
+        try:
+            self.recargar()
+        except ValueError:
+            # No se reintenta hasta que los archivos vuelvan a cambiar
+            self._firma_fallida = firma
+            logger.exception("Error al recargar las normas; se mantienen las anteriores")
+            return False
+        self._firma_fallida = None
+        logger.info("Normas recargadas: %s", ", ".join(sorted(self.catalogo.vigentes.values())))
+        return True
+
+    async def ejecutar(self) -> None:
+        """Bucle de revisión; se lanza como tarea en el ciclo de vida de la app"""
+        if self.intervalo <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.intervalo)
+            try:
+                await asyncio.to_thread(self.revisar)
+            except Exception:
+                logger.exception("Error al revisar las normas")
+
+    def estadisticas(self) -> Dict:
+        catalogo = self.catalogo
+        return {
+            "directorio": self.directorio,
+            "instrumentos": len(catalogo.instrumentos),
+            "normas_cargadas": len(catalogo.servicios),
+            "vigentes": dict(catalogo.vigentes),
+            "cargado": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(catalogo.cargado)),
+            "recargas": self.recargas,
+            "errores": self.errores,
+            "ultimo_error": self.ultimo_error
+        }
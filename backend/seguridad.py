@@ -0,0 +1,109 @@
+# seguridad.py - Hash de contraseñas con scrypt en un pool de procesos acotado
+#
+# Formato almacenado: scrypt$n$r$p$sal$hash (sal y hash en base64)
+# Los hashes antiguos (SHA-256 en hex, sin sal) se siguen aceptando y se
+# reemplazan por scrypt en el siguiente login correcto.
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+LONGITUD_SAL = 16
+LONGITUD_HASH = 32
+
+# ============================================
+# FUNCIONES DE HASH (se ejecutan en los procesos del pool)
+# ============================================
+
+def hashear_password(password: str) -> str:
+    sal = os.urandom(LONGITUD_SAL)
+    derivado = hashlib.scrypt(
+        password.encode(), salt=sal, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=LONGITUD_HASH
+    )
+    return "$".join([
+        "scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+        base64.b64encode(sal).decode(), base64.b64encode(derivado).decode()
+    ])
+
+def verificar_password(password: str, almacenado: str) -> bool:
+    if not almacenado.startswith("scrypt$"):
+        legado = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legado, almacenado)
+    try:
+        _, n, r, p, sal, esperado = almacenado.split("$")
+        esperado = base64.b64decode(esperado)
+        derivado = hashlib.scrypt(
+            password.encode(), salt=base64.b64decode(sal),
+            n=int(n), r=int(r), p=int(p), dklen=len(esperado)
+        )
+    except ValueError:
+        return False
+    return hmac.compare_digest(derivado, esperado)
+
+def necesita_actualizar(almacenado: str) -> bool:
+    """True si el hash no es scrypt con los parámetros actuales"""
+    return not almacenado.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+# ============================================
+# POOL DE HASHING
+# ============================================
+
+class PoolSaturado(Exception):
+    """Hay demasiadas operaciones de hash pendientes; el cliente debe reintentar"""
+
+
+class PoolHashing:
+    """
+    Ejecuta el KDF fuera del event loop y del threadpool de FastAPI
+    - procesos > 0: pool de procesos de ese tamaño (se crea en el primer uso)
+    - procesos = 0: cálculo en línea, sin pool (solo para comparar en benchmarks)
+    - max_pendientes: operaciones en cola o en curso antes de rechazar con PoolSaturado
+    """
+
+    def __init__(self, procesos: int, max_pendientes: int):
+        self.procesos = procesos
+        self.max_pendientes = max_pendientes
+        self.pendientes = 0
+        self.rechazadas = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _obtener_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: los procesos hijos no heredan hilos ni conexiones abiertas del servidor
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _ejecutar(self, funcion, *args):
+        if self.procesos <= 0:
+            return funcion(*args)
+        if self.pendientes >= self.max_pendientes:
+            self.rechazadas += 1
+            raise PoolSaturado()
+        self.pendientes += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._obtener_executor(), funcion, *args)
+        finally:
+            self.pendientes -= 1
+
+    async def hashear(self, password: str) -> str:
+        return await self._ejecutar(hashear_password, password)
+
+    async def verificar(self, password: str, almacenado: str) -> bool:
+        return await self._ejecutar(verificar_password, password, almacenado)
+
+    def cerrar(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
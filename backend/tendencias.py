@@ -0,0 +1,102 @@
+# tendencias.py - Evolución de los indicadores CSI de cada usuario entre tests
+#
+# Por usuario, un documento en el almacén ("tendencias:<email>") con una entrada por
+# test completado en orden de finalización: puntajes brutos, percentiles y códigos de
+# nivel tal como se calcularon (con las normas de ese test). Se amplía al completar cada
+# test, así que GET /test/tendencias arma las series leyendo un solo documento, sin
+# volver a puntuar ni leer los tests uno a uno.
+#
+# Los valores de cada entrada son listas en el orden de "indicadores" del documento:
+# un usuario con 100 tests ocupa unos 15 KB de JSON.
+
+from typing import Dict, List, Optional, Sequence
+
+from almacenamiento import epoch_a_iso
+from normas import NIVELES
+
+PREFIJO_CLAVE = "tendencias:"
+
+
+def clave(email: str) -> str:
+    """Clave del documento de tendencias de un usuario en el almacén"""
+    return PREFIJO_CLAVE + email
+
+
+def estado_vacio(indicadores: Sequence[str]) -> Dict:
+    return {"indicadores": list(indicadores), "tests": []}
+
+
+def registrar(
+    estado: Dict,
+    test_id: str,
+    fin: int,
+    normas: str,
+    capacidad: Optional[int],
+    resultados: Dict
+) -> Dict:
+    """Añade un test completado (lo modifica y lo devuelve); si ya estaba, no cambia nada"""
+    tests = estado["tests"]
+    if any(test["test_id"] == test_id for test in tests):
+        return estado
+    indicadores = estado["indicadores"]
+    entrada = {
+        "test_id": test_id,
+        "fin": fin,
+        "normas": normas,
+        "capacidad": capacidad,
+        "raw": [resultados["raw_scores"][ind] for ind in indicadores],
+        "percentiles": [resultados["percentiles"][ind] for ind in indicadores],
+        "niveles": [NIVELES.index(resultados["levels"][ind]) for ind in indicadores]
+    }
+    # Casi siempre va al final; dos envíos casi simultáneos pueden llegar en otro orden
+    posicion = len(tests)
+    while posicion and (tests[posicion - 1]["fin"], tests[posicion - 1]["test_id"]) > (fin, test_id):
+        posicion -= 1
+    tests.insert(posicion, entrada)
+    return estado
+
+
+def diferencias(valores: List[int]) -> List[int]:
+    """Diferencia de cada valor con el anterior (n - 1 elementos)"""
+    return [actual - anterior for anterior, actual in zip(valores, valores[1:])]
+
+
+def resumen(estado: Dict, nombres: Dict[str, str], indicador: Optional[str] = None, limite: Optional[int] = None) -> Dict:
+    """
+    Series por indicador y deltas entre tests consecutivos
+    - limite: solo los últimos N tests
+    - En los deltas de niveles, diferencia de códigos (0=Bajo, 1=Medio, 2=Alto): +1 es subir un nivel
+    """
+    tests = estado["tests"][-limite:] if limite else estado["tests"]
+    indicadores = estado["indicadores"]
+    series = {}
+    for i, ind in enumerate(indicadores):
+        if indicador is not None and ind != indicador:
+            continue
+        raw = [test["raw"][i] for test in tests]
+        percentiles = [test["percentiles"][i] for test in tests]
+        niveles = [test["niveles"][i] for test in tests]
+        series[ind] = {
+            "nombre": nombres[ind],
+            "raw_scores": raw,
+            "percentiles": percentiles,
+            "levels": [NIVELES[codigo] for codigo in niveles],
+            "deltas": {
+                "raw_scores": diferencias(raw),
+                "percentiles": diferencias(percentiles),
+                "levels": diferencias(niveles)
+            }
+        }
+    return {
+        "total_tests": len(estado["tests"]),
+        "tests": [
+            {
+                "test_id": test["test_id"],
+                "fecha_completado": epoch_a_iso(test["fin"]),
+                "normas": test["normas"],
+                "capacidad_afrontamiento": test["capacidad"]
+            }
+            for test in tests
+        ],
+        "indicadores": series
+    }